@@ -31,6 +31,7 @@ if config.config_file_name is not None:
 
 # add your model's MetaData object here
 # for 'autogenerate' support
+from app.models import index_sync  # noqa: F401
 from app.models.mental_health_conversation import Base
 
 target_metadata = Base.metadata
@@ -0,0 +1,133 @@
+"""Add index sync tracking
+
+Revision ID: 5f2c8e1a9d47
+Revises: 843194bba944
+Create Date: 2026-10-17 10:12:05.418233
+
+"""
+
+import hashlib
+import unicodedata
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "5f2c8e1a9d47"
+down_revision: Union[str, None] = "843194bba944"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "mental_health_conversations",
+        sa.Column("content_hash", sa.String(length=64), nullable=True),
+    )
+    op.add_column(
+        "mental_health_conversations",
+        sa.Column("indexed_hash", sa.String(length=64), nullable=True),
+    )
+    op.create_index(
+        op.f("ix_mental_health_conversations_updated_at"),
+        "mental_health_conversations",
+        ["updated_at"],
+        unique=False,
+    )
+    op.create_table(
+        "conversation_tombstones",
+        sa.Column("conversation_id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column(
+            "deleted_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.PrimaryKeyConstraint("conversation_id"),
+    )
+    op.create_index(
+        op.f("ix_conversation_tombstones_deleted_at"),
+        "conversation_tombstones",
+        ["deleted_at"],
+        unique=False,
+    )
+    op.create_table(
+        "index_sync_state",
+        sa.Column("name", sa.String(length=64), nullable=False),
+        sa.Column("watermark", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("name"),
+    )
+    backfill_hashes()
+
+
+def content_hash(question: str, answer: str) -> str:
+    """app.utils.embedding_cache.content_hash as of this revision.
+
+    Copied so later changes to the application do not change what this
+    migration writes.
+    """
+
+    def normalize(text: str) -> str:
+        return " ".join(unicodedata.normalize("NFKC", text).split())
+
+    text = f"{normalize(question)}\x1f{normalize(answer)}"
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def backfill_hashes(batch_size: int = 1000) -> None:
+    """Hash existing rows and treat them as indexed.
+
+    Rows were indexed by the per-change tasks until now, so the first sync
+    only has to read them. Run app.scripts.reindex to rebuild the index if it
+    may be incomplete.
+    """
+    bind = op.get_bind()
+    conversations = sa.table(
+        "mental_health_conversations",
+        sa.column("id"),
+        sa.column("question"),
+        sa.column("answer"),
+        sa.column("content_hash"),
+        sa.column("indexed_hash"),
+    )
+    after_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(
+                conversations.c.id, conversations.c.question, conversations.c.answer
+            )
+            .where(conversations.c.id > after_id)
+            .order_by(conversations.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        bind.execute(
+            conversations.update()
+            .where(conversations.c.id == sa.bindparam("row_id"))
+            .values(
+                content_hash=sa.bindparam("digest"), indexed_hash=sa.bindparam("digest")
+            ),
+            [
+                {"row_id": row.id, "digest": content_hash(row.question, row.answer)}
+                for row in rows
+            ],
+        )
+        after_id = rows[-1].id
+
+
+def downgrade() -> None:
+    op.drop_table("index_sync_state")
+    op.drop_index(
+        op.f("ix_conversation_tombstones_deleted_at"),
+        table_name="conversation_tombstones",
+    )
+    op.drop_table("conversation_tombstones")
+    op.drop_index(
+        op.f("ix_mental_health_conversations_updated_at"),
+        table_name="mental_health_conversations",
+    )
+    op.drop_column("mental_health_conversations", "indexed_hash")
+    op.drop_column("mental_health_conversations", "content_hash")
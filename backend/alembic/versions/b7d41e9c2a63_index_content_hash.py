@@ -0,0 +1,34 @@
+"""Index content hash
+
+Revision ID: b7d41e9c2a63
+Revises: 5f2c8e1a9d47
+Create Date: 2026-10-18 09:41:27.503118
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "b7d41e9c2a63"
+down_revision: Union[str, None] = "5f2c8e1a9d47"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Bulk imports look up existing conversations by content hash
+    op.create_index(
+        op.f("ix_mental_health_conversations_content_hash"),
+        "mental_health_conversations",
+        ["content_hash"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        op.f("ix_mental_health_conversations_content_hash"),
+        table_name="mental_health_conversations",
+    )
@@ -1,51 +1,121 @@
-from typing import List
+import asyncio
+import json
+import math
+from typing import AsyncIterator, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.crud import mental_health_conversation
-from app.db.database import get_db
+from app.db.database import get_async_db
 from app.schemas.mental_health_conversation import (
     ConversationGenerateRequest,
     ConversationGenerateResponse,
     MentalHealthConversation,
+    MentalHealthConversationBulkCreate,
+    MentalHealthConversationBulkCreateResponse,
     MentalHealthConversationCreate,
 )
-from app.services.conversation_generation import ConversationRAGGenerationService
-from app.worker.tasks import delete_conversation_index, index_conversation
+from app.services.conversation_generation import (
+    AsyncConversationRAGGenerationService,
+    get_rag_service,
+)
+from app.utils.pagination import decode_cursor, encode_cursor
+from app.utils.rate_limiter import RateLimitExceeded
+from app.worker.tasks import enqueue_delete, enqueue_index, index_conversations
 
 router = APIRouter()
 
-# Initialize the RAG service
-rag_service = ConversationRAGGenerationService()
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
 
 
 @router.post("/conversations/", response_model=MentalHealthConversation)
-def create_conversation(
-    conversation: MentalHealthConversationCreate, db: Session = Depends(get_db)
+async def create_conversation(
+    conversation: MentalHealthConversationCreate,
+    db: AsyncSession = Depends(get_async_db),
 ):
     # Create the conversation in the database
-    db_conversation = mental_health_conversation.create_conversation(
+    db_conversation = await mental_health_conversation.acreate_conversation(
         db=db, conversation=conversation
     )
 
-    # Enqueue the indexing task and get the task result
-    index_conversation.delay(db_conversation.id)
+    # Enqueue the conversation for indexing
+    await asyncio.to_thread(enqueue_index, db_conversation.id)
 
     return db_conversation
 
 
+@router.post(
+    "/conversations/bulk", response_model=MentalHealthConversationBulkCreateResponse
+)
+async def create_conversations_bulk(
+    request: MentalHealthConversationBulkCreate,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Create many conversations in one transaction and index them in one job.
+
+    With skip_existing, conversations whose text is already stored are not
+    created again and their existing ids are returned, so a retried import
+    does not duplicate rows.
+    """
+    if request.skip_existing:
+        ids, created = await mental_health_conversation.acreate_missing_conversations(
+            db=db, conversations=request.conversations
+        )
+    else:
+        ids = created = await mental_health_conversation.acreate_conversations(
+            db=db, conversations=request.conversations
+        )
+    skipped = len(ids) - len(created)
+    if not created:
+        return MentalHealthConversationBulkCreateResponse(ids=ids, skipped=skipped)
+
+    # A single batched indexing job instead of one task per conversation
+    task = await asyncio.to_thread(index_conversations.delay, created)
+
+    return MentalHealthConversationBulkCreateResponse(
+        ids=ids, task_id=task.id, skipped=skipped
+    )
+
+
 @router.get("/conversations/", response_model=List[MentalHealthConversation])
-def read_conversations(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    conversations = mental_health_conversation.get_conversations(
-        db, skip=skip, limit=limit
+async def read_conversations(
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """List conversations ordered by id.
+
+    Pass the X-Next-Cursor header of a page as cursor to get the next one; the
+    header is absent on the last page. skip is kept for existing callers but
+    gets slower the deeper it goes.
+    """
+    if skip and cursor is None:
+        return await mental_health_conversation.aget_conversations(
+            db, skip=skip, limit=limit
+        )
+
+    try:
+        after_id = decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    conversations = await mental_health_conversation.aget_conversations_after(
+        db, after_id=after_id, limit=limit
     )
+    if len(conversations) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(conversations[-1].id)
     return conversations
 
 
 @router.get("/conversations/{conversation_id}", response_model=MentalHealthConversation)
-def read_conversation(conversation_id: int, db: Session = Depends(get_db)):
-    db_conversation = mental_health_conversation.get_conversation(
+async def read_conversation(
+    conversation_id: int, db: AsyncSession = Depends(get_async_db)
+):
+    db_conversation = await mental_health_conversation.aget_conversation(
         db, conversation_id=conversation_id
     )
     if db_conversation is None:
@@ -54,33 +124,35 @@ def read_conversation(conversation_id: int, db: Session = Depends(get_db)):
 
 
 @router.put("/conversations/{conversation_id}", response_model=MentalHealthConversation)
-def update_conversation(
+async def update_conversation(
     conversation_id: int,
     conversation: MentalHealthConversationCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    db_conversation = mental_health_conversation.update_conversation(
+    db_conversation = await mental_health_conversation.aupdate_conversation(
         db, conversation_id=conversation_id, conversation=conversation
     )
     if db_conversation is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
     # Re-index the updated conversation
-    index_conversation.delay(conversation_id)
+    await asyncio.to_thread(enqueue_index, conversation_id)
 
     return db_conversation
 
 
 @router.delete("/conversations/{conversation_id}")
-def delete_conversation(conversation_id: int, db: Session = Depends(get_db)):
-    success = mental_health_conversation.delete_conversation(
+async def delete_conversation(
+    conversation_id: int, db: AsyncSession = Depends(get_async_db)
+):
+    success = await mental_health_conversation.adelete_conversation(
         db, conversation_id=conversation_id
     )
     if not success:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
     # Delete from vector index
-    delete_conversation_index.delay(conversation_id)
+    await asyncio.to_thread(enqueue_delete, conversation_id)
 
     return {"ok": True}
 
@@ -88,10 +160,61 @@ def delete_conversation(conversation_id: int, db: Session = Depends(get_db)):
 @router.post("/conversations/generate", response_model=ConversationGenerateResponse)
 async def generate_conversation_response(
     request: ConversationGenerateRequest,
+    rag_service: AsyncConversationRAGGenerationService = Depends(get_rag_service),
 ):
     """Generate a response for a given question using RAG."""
     try:
-        response = rag_service.generate_response(request.question)
+        response = await rag_service.generate_response(request.question)
         return ConversationGenerateResponse(answer=response)
+    except RateLimitExceeded as e:
+        raise _unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+def _unavailable(error: RateLimitExceeded) -> HTTPException:
+    """503 telling the client when OpenAI quota should be available again."""
+    return HTTPException(
+        status_code=503,
+        detail=str(error),
+        headers={"Retry-After": str(math.ceil(error.retry_after))},
+    )
+
+
+async def _sse_events(tokens: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Format completion tokens as Server-Sent Events."""
+    try:
+        async for token in tokens:
+            yield f"data: {json.dumps({'token': token})}\n\n"
+    except Exception as e:
+        yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+        return
+    yield "event: done\ndata: {}\n\n"
+
+
+@router.post("/conversations/generate/stream")
+async def stream_conversation_response(
+    request: ConversationGenerateRequest,
+    rag_service: AsyncConversationRAGGenerationService = Depends(get_rag_service),
+):
+    """Stream a RAG response for a given question as Server-Sent Events.
+
+    Retrieval happens before the response starts so its failures are still
+    reported as a 500; tokens are forwarded as soon as the model emits them.
+    """
+    try:
+        similar_conversations = await rag_service.get_similar_conversations(
+            request.question
+        )
+    except RateLimitExceeded as e:
+        raise _unavailable(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return StreamingResponse(
+        _sse_events(
+            rag_service.stream_completion(request.question, similar_conversations)
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,7 +1,10 @@
 from fastapi import APIRouter, Depends
 from pydantic import BaseModel
 
-from app.services.conversation_generation import ConversationRAGGenerationService
+from app.services.conversation_generation import (
+    AsyncConversationRAGGenerationService,
+    get_rag_service,
+)
 
 router = APIRouter()
 
@@ -17,10 +20,8 @@ class GenerateRequest(BaseModel):
 @router.post("/generate", response_model=GenerateResponse)
 async def generate_response(
     request: GenerateRequest,
-    rag_service: ConversationRAGGenerationService = Depends(
-        lambda: ConversationRAGGenerationService()
-    ),
+    rag_service: AsyncConversationRAGGenerationService = Depends(get_rag_service),
 ) -> GenerateResponse:
     """Generate a response using RAG"""
-    response = rag_service.generate_response(request.query)
+    response = await rag_service.generate_response(request.query)
     return GenerateResponse(response=response)
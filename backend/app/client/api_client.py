@@ -1,18 +1,30 @@
-from typing import Dict, List, Optional
+import asyncio
+import json
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 import httpx
 from pydantic import BaseModel
 
 from app.schemas.mental_health_conversation import (
     MentalHealthConversation,
+    MentalHealthConversationBulkCreate,
+    MentalHealthConversationBulkCreateResponse,
     MentalHealthConversationCreate,
 )
+from app.tracing import inject
+
+
+async def _propagate_trace(request: httpx.Request):
+    # Requests made inside a span continue its trace on the server
+    inject(request.headers)
 
 
 class APIClient:
     def __init__(self, base_url: str = "http://localhost:8000"):
         self.base_url = base_url.rstrip("/")
-        self.client = httpx.AsyncClient(base_url=self.base_url)
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url, event_hooks={"request": [_propagate_trace]}
+        )
 
     async def __aenter__(self):
         return self
@@ -34,6 +46,26 @@ class APIClient:
         response.raise_for_status()
         return MentalHealthConversation.model_validate(response.json())
 
+    async def create_conversations_bulk(
+        self,
+        conversations: List[MentalHealthConversationCreate],
+        skip_existing: bool = False,
+    ) -> List[int]:
+        """Create many conversations in one request, returning their ids in order.
+
+        With skip_existing, conversations already stored are not created again.
+        """
+        request = MentalHealthConversationBulkCreate(
+            conversations=conversations, skip_existing=skip_existing
+        )
+        response = await self.client.post(
+            "/api/v1/conversations/bulk", json=request.model_dump(), timeout=60.0
+        )
+        response.raise_for_status()
+        return MentalHealthConversationBulkCreateResponse.model_validate(
+            response.json()
+        ).ids
+
     async def get_conversation(self, conversation_id: int) -> MentalHealthConversation:
         """Get a specific conversation by ID."""
         response = await self.client.get(f"/api/v1/conversations/{conversation_id}")
@@ -52,6 +84,44 @@ class APIClient:
             MentalHealthConversation.model_validate(item) for item in response.json()
         ]
 
+    async def get_conversations_page(
+        self, cursor: Optional[str] = None, limit: int = 100
+    ) -> Tuple[List[MentalHealthConversation], Optional[str]]:
+        """Get one page of conversations and the cursor of the next page.
+
+        The cursor is None on the last page.
+        """
+        params = {"limit": limit}
+        if cursor:
+            params["cursor"] = cursor
+        response = await self.client.get("/api/v1/conversations/", params=params)
+        response.raise_for_status()
+        conversations = [
+            MentalHealthConversation.model_validate(item) for item in response.json()
+        ]
+        return conversations, response.headers.get("X-Next-Cursor")
+
+    async def iter_conversations(
+        self, page_size: int = 100
+    ) -> AsyncIterator[MentalHealthConversation]:
+        """Iterate over all conversations, fetching the next page in the background."""
+        page = asyncio.create_task(self.get_conversations_page(limit=page_size))
+        try:
+            while page is not None:
+                conversations, cursor = await page
+                page = (
+                    asyncio.create_task(
+                        self.get_conversations_page(cursor=cursor, limit=page_size)
+                    )
+                    if cursor
+                    else None
+                )
+                for conversation in conversations:
+                    yield conversation
+        finally:
+            if page is not None and not page.done():
+                page.cancel()
+
     async def update_conversation(
         self, conversation_id: int, question: str, answer: str
     ) -> MentalHealthConversation:
@@ -77,3 +147,26 @@ class APIClient:
         )
         response.raise_for_status()
         return response.json()["answer"]
+
+    async def stream_conversation_response(self, question: str) -> AsyncIterator[str]:
+        """Generate a response for a given question, yielding tokens as they arrive."""
+        async with self.client.stream(
+            "POST",
+            "/api/v1/conversations/generate/stream",
+            json={"question": question},
+            timeout=httpx.Timeout(5.0, read=60.0),
+        ) as response:
+            response.raise_for_status()
+            event = "message"
+            async for line in response.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[len("event:") :].strip()
+                elif line.startswith("data:"):
+                    data = json.loads(line[len("data:") :])
+                    if event == "error":
+                        raise RuntimeError(data["detail"])
+                    if event == "done":
+                        return
+                    yield data["token"]
+                elif not line:
+                    event = "message"
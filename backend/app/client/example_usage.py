@@ -32,6 +32,13 @@ async def main():
         deleted = await client.delete_conversation(conversation.id)
         print(f"Deleted conversation: {deleted}")
 
+        # Stream a generated response as it is produced
+        async for token in client.stream_conversation_response(
+            "I can't sleep because of stress"
+        ):
+            print(token, end="", flush=True)
+        print()
+
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -1,9 +1,18 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, bindparam, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
+from app.metrics import CRUD_SECONDS, instrumented
+from app.models.index_sync import ConversationTombstone
 from app.models.mental_health_conversation import MentalHealthConversation
 from app.schemas.mental_health_conversation import MentalHealthConversationCreate
+from app.utils.embedding_cache import content_hash
 
 
+@instrumented(CRUD_SECONDS)
 def get_conversation(db: Session, conversation_id: int):
     return (
         db.query(MentalHealthConversation)
@@ -12,13 +21,91 @@ def get_conversation(db: Session, conversation_id: int):
     )
 
 
+@instrumented(CRUD_SECONDS)
 def get_conversations(db: Session, skip: int = 0, limit: int = 100):
     return db.query(MentalHealthConversation).offset(skip).limit(limit).all()
 
 
+@instrumented(CRUD_SECONDS)
+def get_conversations_after(db: Session, after_id: int = 0, limit: int = 100):
+    """Keyset page: the next limit conversations with id greater than after_id.
+
+    Seeks on the primary key, so the cost does not grow with the page depth
+    the way OFFSET does.
+    """
+    return (
+        db.query(MentalHealthConversation)
+        .filter(MentalHealthConversation.id > after_id)
+        .order_by(MentalHealthConversation.id)
+        .limit(limit)
+        .all()
+    )
+
+
+@instrumented(CRUD_SECONDS)
+def get_conversations_changed_since(
+    db: Session,
+    since: datetime,
+    after: Optional[Tuple[datetime, int]] = None,
+    limit: int = 100,
+):
+    """Keyset page of conversations with updated_at >= since.
+
+    Ordered by (updated_at, id); after is the (updated_at, id) of the last row
+    of the previous page. Uses the updated_at index, so the cost depends on
+    the number of changed rows rather than the table size.
+    """
+    query = db.query(MentalHealthConversation).filter(
+        MentalHealthConversation.updated_at >= since
+    )
+    if after is not None:
+        updated_at, last_id = after
+        query = query.filter(
+            or_(
+                MentalHealthConversation.updated_at > updated_at,
+                and_(
+                    MentalHealthConversation.updated_at == updated_at,
+                    MentalHealthConversation.id > last_id,
+                ),
+            )
+        )
+    return (
+        query.order_by(MentalHealthConversation.updated_at, MentalHealthConversation.id)
+        .limit(limit)
+        .all()
+    )
+
+
+@instrumented(CRUD_SECONDS)
+def mark_indexed(db: Session, hashes: Dict[int, str]):
+    """Record the content hash now in the vector index for each conversation id.
+
+    The index sync also records its marker for rejected text here. updated_at
+    is written back unchanged so this does not count as a change.
+    """
+    if not hashes:
+        return
+    db.connection().execute(
+        update(MentalHealthConversation)
+        .where(MentalHealthConversation.id == bindparam("conversation_id"))
+        .values(
+            indexed_hash=bindparam("hash"),
+            updated_at=MentalHealthConversation.updated_at,
+        ),
+        [
+            {"conversation_id": conversation_id, "hash": digest}
+            for conversation_id, digest in hashes.items()
+        ],
+    )
+    db.commit()
+
+
+@instrumented(CRUD_SECONDS)
 def create_conversation(db: Session, conversation: MentalHealthConversationCreate):
     db_conversation = MentalHealthConversation(
-        question=conversation.question, answer=conversation.answer
+        question=conversation.question,
+        answer=conversation.answer,
+        content_hash=content_hash(conversation.question, conversation.answer),
     )
     db.add(db_conversation)
     db.commit()
@@ -26,6 +113,53 @@ def create_conversation(db: Session, conversation: MentalHealthConversationCreat
     return db_conversation
 
 
+# Rows per INSERT statement in create_conversations
+BULK_INSERT_CHUNK_SIZE = 1000
+
+
+@instrumented(CRUD_SECONDS)
+def create_conversations(
+    db: Session, conversations: List[MentalHealthConversationCreate]
+) -> List[int]:
+    """Insert many conversations in one transaction and return their ids in order."""
+    rows = [
+        {
+            "question": conversation.question,
+            "answer": conversation.answer,
+            "content_hash": content_hash(conversation.question, conversation.answer),
+        }
+        for conversation in conversations
+    ]
+    dialect = db.get_bind().dialect
+    ids: List[int] = []
+
+    for start in range(0, len(rows), BULK_INSERT_CHUNK_SIZE):
+        chunk = rows[start : start + BULK_INSERT_CHUNK_SIZE]
+        statement, params = _bulk_insert_statement(dialect, chunk)
+        ids.extend(_inserted_ids(dialect, db.execute(statement, params), chunk))
+
+    db.commit()
+    return ids
+
+
+def _bulk_insert_statement(dialect, chunk):
+    if dialect.insert_executemany_returning_sort_by_parameter_order:
+        statement = insert(MentalHealthConversation).returning(
+            MentalHealthConversation.id, sort_by_parameter_order=True
+        )
+        return statement, chunk
+    # MySQL has no RETURNING. InnoDB allocates consecutive ids to a
+    # multi-row "simple insert", and lastrowid is the first of them.
+    return insert(MentalHealthConversation).values(chunk), None
+
+
+def _inserted_ids(dialect, result, chunk) -> List[int]:
+    if dialect.insert_executemany_returning_sort_by_parameter_order:
+        return list(result.scalars().all())
+    return list(range(result.lastrowid, result.lastrowid + len(chunk)))
+
+
+@instrumented(CRUD_SECONDS)
 def update_conversation(
     db: Session, conversation_id: int, conversation: MentalHealthConversationCreate
 ):
@@ -33,15 +167,163 @@ def update_conversation(
     if db_conversation:
         db_conversation.question = conversation.question
         db_conversation.answer = conversation.answer
+        db_conversation.content_hash = content_hash(
+            conversation.question, conversation.answer
+        )
         db.commit()
         db.refresh(db_conversation)
     return db_conversation
 
 
+@instrumented(CRUD_SECONDS)
 def delete_conversation(db: Session, conversation_id: int):
     db_conversation = get_conversation(db, conversation_id)
     if db_conversation:
         db.delete(db_conversation)
+        # Lets the index sync remove it even if the delete task never runs
+        db.add(ConversationTombstone(conversation_id=conversation_id))
         db.commit()
         return True
     return False
+
+
+# Async variants used by the API endpoints. The sync functions above remain for
+# scripts, tests and the Celery worker.
+
+
+@instrumented(CRUD_SECONDS)
+async def aget_conversation(db: AsyncSession, conversation_id: int):
+    return await db.get(MentalHealthConversation, conversation_id)
+
+
+@instrumented(CRUD_SECONDS)
+async def aget_conversations(db: AsyncSession, skip: int = 0, limit: int = 100):
+    result = await db.scalars(
+        select(MentalHealthConversation).offset(skip).limit(limit)
+    )
+    return result.all()
+
+
+@instrumented(CRUD_SECONDS)
+async def aget_conversations_after(
+    db: AsyncSession, after_id: int = 0, limit: int = 100
+):
+    """Async variant of get_conversations_after."""
+    result = await db.scalars(
+        select(MentalHealthConversation)
+        .where(MentalHealthConversation.id > after_id)
+        .order_by(MentalHealthConversation.id)
+        .limit(limit)
+    )
+    return result.all()
+
+
+@instrumented(CRUD_SECONDS)
+async def acreate_conversation(
+    db: AsyncSession, conversation: MentalHealthConversationCreate
+):
+    db_conversation = MentalHealthConversation(
+        question=conversation.question,
+        answer=conversation.answer,
+        content_hash=content_hash(conversation.question, conversation.answer),
+    )
+    db.add(db_conversation)
+    await db.commit()
+    await db.refresh(db_conversation)
+    return db_conversation
+
+
+@instrumented(CRUD_SECONDS)
+async def acreate_conversations(
+    db: AsyncSession, conversations: List[MentalHealthConversationCreate]
+) -> List[int]:
+    """Async variant of create_conversations."""
+    rows = [
+        {
+            "question": conversation.question,
+            "answer": conversation.answer,
+            "content_hash": content_hash(conversation.question, conversation.answer),
+        }
+        for conversation in conversations
+    ]
+    dialect = db.bind.dialect
+    ids: List[int] = []
+
+    for start in range(0, len(rows), BULK_INSERT_CHUNK_SIZE):
+        chunk = rows[start : start + BULK_INSERT_CHUNK_SIZE]
+        statement, params = _bulk_insert_statement(dialect, chunk)
+        result = await db.execute(statement, params)
+        ids.extend(_inserted_ids(dialect, result, chunk))
+
+    await db.commit()
+    return ids
+
+
+async def _aids_by_content_hash(db: AsyncSession, hashes: List[str]) -> Dict[str, int]:
+    """Lowest id of a stored conversation for each of the content hashes."""
+    found: Dict[str, int] = {}
+    for start in range(0, len(hashes), BULK_INSERT_CHUNK_SIZE):
+        result = await db.execute(
+            select(
+                MentalHealthConversation.content_hash, MentalHealthConversation.id
+            ).where(
+                MentalHealthConversation.content_hash.in_(
+                    hashes[start : start + BULK_INSERT_CHUNK_SIZE]
+                )
+            )
+        )
+        for digest, conversation_id in result:
+            found[digest] = min(found.get(digest, conversation_id), conversation_id)
+    return found
+
+
+@instrumented(CRUD_SECONDS)
+async def acreate_missing_conversations(
+    db: AsyncSession, conversations: List[MentalHealthConversationCreate]
+) -> Tuple[List[int], List[int]]:
+    """Create the conversations whose text is not stored yet.
+
+    Returns the id of every input in order, the stored one for texts that
+    already exist, and the ids that were created. Rows with the same text in
+    one call are created once. Concurrent calls with the same new text can
+    still both create it.
+    """
+    hashes = [content_hash(c.question, c.answer) for c in conversations]
+    existing = await _aids_by_content_hash(db, sorted(set(hashes)))
+    new: Dict[str, MentalHealthConversationCreate] = {}
+    for digest, conversation in zip(hashes, conversations):
+        if digest not in existing:
+            new.setdefault(digest, conversation)
+
+    created = await acreate_conversations(db, list(new.values())) if new else []
+    existing.update(zip(new, created))
+    return [existing[digest] for digest in hashes], created
+
+
+@instrumented(CRUD_SECONDS)
+async def aupdate_conversation(
+    db: AsyncSession,
+    conversation_id: int,
+    conversation: MentalHealthConversationCreate,
+):
+    db_conversation = await aget_conversation(db, conversation_id)
+    if db_conversation:
+        db_conversation.question = conversation.question
+        db_conversation.answer = conversation.answer
+        db_conversation.content_hash = content_hash(
+            conversation.question, conversation.answer
+        )
+        await db.commit()
+        await db.refresh(db_conversation)
+    return db_conversation
+
+
+@instrumented(CRUD_SECONDS)
+async def adelete_conversation(db: AsyncSession, conversation_id: int):
+    db_conversation = await aget_conversation(db, conversation_id)
+    if db_conversation:
+        await db.delete(db_conversation)
+        db.add(ConversationTombstone(conversation_id=conversation_id))
+        await db.commit()
+        return True
+    return False
@@ -1,10 +1,16 @@
+import asyncio
+import json
 import os
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Sequence
 
+import numpy as np
 from dotenv import load_dotenv
 from pymilvus import Collection, DataType, MilvusClient, connections
 
+from app.resources import resources
+from app.utils.projection import EmbeddingProjection, embedding_projection
+
 # Load environment variables
 load_dotenv(".env.local")
 
@@ -14,71 +20,189 @@ ROOT_DIR = Path(__file__).parent.parent.parent
 # Milvus configuration
 COLLECTION_NAME = os.getenv("MILVUS_COLLECTION_NAME", "mental_health_conversations")
 EMBEDDING_DIM = 1536  # OpenAI ada-002 dimension
+# Dimension of the stored vectors, smaller with an EMBEDDING_PROJECTION_PATH
+VECTOR_DIM = embedding_projection.output_dim if embedding_projection else EMBEDDING_DIM
+METRIC_TYPE = "COSINE"
+
+# Build and search parameters per supported index type. IVF nlist should be
+# around 4 * sqrt(number of vectors); nprobe and ef trade recall for latency.
+DEFAULT_INDEX_PARAMS = {
+    "FLAT": {},
+    "IVF_FLAT": {"nlist": 128},
+    "IVF_SQ8": {"nlist": 128},
+    "HNSW": {"M": 16, "efConstruction": 200},
+}
+DEFAULT_SEARCH_PARAMS = {
+    "FLAT": {},
+    "IVF_FLAT": {"nprobe": 16},
+    "IVF_SQ8": {"nprobe": 16},
+    "HNSW": {"ef": 64},
+}
+
+# Index configuration, params are JSON objects overriding the defaults above
+MILVUS_INDEX_TYPE = os.getenv("MILVUS_INDEX_TYPE", "IVF_FLAT").upper()
+if MILVUS_INDEX_TYPE not in DEFAULT_INDEX_PARAMS:
+    raise ValueError(
+        f"Unsupported MILVUS_INDEX_TYPE {MILVUS_INDEX_TYPE}, "
+        f"expected one of {', '.join(DEFAULT_INDEX_PARAMS)}"
+    )
+MILVUS_INDEX_PARAMS = {
+    **DEFAULT_INDEX_PARAMS[MILVUS_INDEX_TYPE],
+    **json.loads(os.getenv("MILVUS_INDEX_PARAMS", "{}")),
+}
+MILVUS_SEARCH_PARAMS = {
+    **DEFAULT_SEARCH_PARAMS[MILVUS_INDEX_TYPE],
+    **json.loads(os.getenv("MILVUS_SEARCH_PARAMS", "{}")),
+}
+
+# Storage type of the embedding field. FLOAT16_VECTOR halves the memory of the
+# raw vectors, IVF_SQ8 additionally quantizes the index to one byte per
+# dimension. Existing collections keep their type until rebuilt with
+# app.scripts.reindex.
+VECTOR_DTYPES = {"FLOAT_VECTOR": np.float32, "FLOAT16_VECTOR": np.float16}
+MILVUS_VECTOR_TYPE = os.getenv("MILVUS_VECTOR_TYPE", "FLOAT_VECTOR").upper()
+if MILVUS_VECTOR_TYPE not in VECTOR_DTYPES:
+    raise ValueError(
+        f"Unsupported MILVUS_VECTOR_TYPE {MILVUS_VECTOR_TYPE}, "
+        f"expected one of {', '.join(VECTOR_DTYPES)}"
+    )
+
+# Milvus client, connected on first use
+milvus_client = resources.register(
+    "milvus",
+    lambda: MilvusClient(uri=os.getenv("MILVUS_URI")),
+    close=MilvusClient.close,
+)
+
+
+def to_milvus_vector(
+    embedding: Sequence[float],
+    vector_type: str = MILVUS_VECTOR_TYPE,
+    projection: Optional[EmbeddingProjection] = embedding_projection,
+) -> np.ndarray:
+    """An embedding as the vector field expects it: projected and in its dtype."""
+    if projection is not None:
+        embedding = projection.project(embedding)
+    return np.asarray(embedding, dtype=VECTOR_DTYPES[vector_type])
+
+
+def build_index_params(
+    index_type: str = MILVUS_INDEX_TYPE, params: Optional[Dict[str, Any]] = None
+):
+    """Index parameters for the embedding field."""
+    index_params = milvus_client.prepare_index_params()
+    index_params.add_index(
+        field_name="embedding",
+        index_type=index_type,
+        metric_type=METRIC_TYPE,
+        params=DEFAULT_INDEX_PARAMS[index_type] if params is None else params,
+    )
+    return index_params
+
+
+def build_search_params(
+    index_type: str = MILVUS_INDEX_TYPE, params: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """Search parameters matching an index built by build_index_params."""
+    return {
+        "metric_type": METRIC_TYPE,
+        "params": DEFAULT_SEARCH_PARAMS[index_type] if params is None else params,
+    }
+
+
+def rebuild_index(
+    collection_name: str = COLLECTION_NAME,
+    index_type: str = MILVUS_INDEX_TYPE,
+    params: Optional[Dict[str, Any]] = None,
+):
+    """Replace the embedding index of an existing collection and reload it."""
+    milvus_client.release_collection(collection_name)
+    for index_name in milvus_client.list_indexes(collection_name):
+        milvus_client.drop_index(collection_name, index_name)
+    milvus_client.create_index(collection_name, build_index_params(index_type, params))
+    milvus_client.load_collection(collection_name)
+
+
+def create_collection(
+    collection_name: str = COLLECTION_NAME,
+    vector_type: str = MILVUS_VECTOR_TYPE,
+    dim: int = VECTOR_DIM,
+):
+    """Create a conversation collection with the configured index."""
+    # Create schema
+    schema = milvus_client.create_schema(
+        auto_id=False,
+        enable_dynamic_field=True,
+    )
+
+    # Add fields to schema
+    schema.add_field(
+        field_name="id",
+        datatype=DataType.INT64,
+        is_primary=True,
+        description="conversation id",
+    )
+    schema.add_field(
+        field_name="question",
+        datatype=DataType.VARCHAR,
+        max_length=65535,
+        description="conversation question",
+    )
+    schema.add_field(
+        field_name="answer",
+        datatype=DataType.VARCHAR,
+        max_length=65535,
+        description="conversation answer",
+    )
+    schema.add_field(
+        field_name="embedding",
+        datatype=getattr(DataType, vector_type),
+        dim=dim,
+        description="combined question-answer embedding",
+    )
 
-# Initialize Milvus client
-milvus_client = MilvusClient(uri=os.getenv("MILVUS_URI"))
+    # Create collection with schema and index
+    milvus_client.create_collection(
+        collection_name=collection_name,
+        schema=schema,
+        index_params=build_index_params(MILVUS_INDEX_TYPE, MILVUS_INDEX_PARAMS),
+    )
+
+    print(
+        f"Created {dim}-d {vector_type} collection and {MILVUS_INDEX_TYPE} index "
+        f"{MILVUS_INDEX_PARAMS} for {collection_name}"
+    )
 
 
 def init_milvus():
     """Initialize Milvus collection if it doesn't exist."""
     if not milvus_client.has_collection(COLLECTION_NAME):
         print(f"Creating collection {COLLECTION_NAME}...")
-
-        # Create schema
-        schema = milvus_client.create_schema(
-            auto_id=False,
-            enable_dynamic_field=True,
-        )
-
-        # Add fields to schema
-        schema.add_field(
-            field_name="id",
-            datatype=DataType.INT64,
-            is_primary=True,
-            description="conversation id",
-        )
-        schema.add_field(
-            field_name="question",
-            datatype=DataType.VARCHAR,
-            max_length=65535,
-            description="conversation question",
-        )
-        schema.add_field(
-            field_name="answer",
-            datatype=DataType.VARCHAR,
-            max_length=65535,
-            description="conversation answer",
-        )
-        schema.add_field(
-            field_name="embedding",
-            datatype=DataType.FLOAT_VECTOR,
-            dim=EMBEDDING_DIM,
-            description="combined question-answer embedding",
-        )
-
-        # Prepare index parameters
-        index_params = milvus_client.prepare_index_params()
-        index_params.add_index(
-            field_name="embedding",
-            index_type="IVF_FLAT",
-            metric_type="COSINE",
-            params={"nlist": 1024},
-        )
-
-        # Create collection with schema and index
-        milvus_client.create_collection(
-            collection_name=COLLECTION_NAME,
-            schema=schema,
-            index_params=index_params,
-        )
-
-        print(f"Created collection and index for {COLLECTION_NAME}")
+        create_collection(COLLECTION_NAME)
     else:
         print(f"Collection {COLLECTION_NAME} already exists")
+        dim = collection_dim(COLLECTION_NAME)
+        if dim != VECTOR_DIM:
+            raise ValueError(
+                f"Collection {COLLECTION_NAME} stores {dim}-d vectors but "
+                f"{VECTOR_DIM}-d are configured; check EMBEDDING_PROJECTION_PATH "
+                "or rebuild it with app.scripts.reindex"
+            )
+
+
+def collection_dim(collection_name: str = COLLECTION_NAME) -> int:
+    """Dimension of a collection's embedding field."""
+    description = milvus_client.describe_collection(collection_name)
+    field = next(f for f in description["fields"] if f["name"] == "embedding")
+    return int(field["params"]["dim"])
 
 
 def reset_milvus():
-    """Drop and recreate the Milvus collection."""
+    """Drop and recreate the Milvus collection.
+
+    Search is down until everything is re-indexed; use app.scripts.reindex to
+    rebuild a live collection without downtime.
+    """
     if milvus_client.has_collection(COLLECTION_NAME):
         print(f"Dropping collection {COLLECTION_NAME}...")
         milvus_client.drop_collection(COLLECTION_NAME)
@@ -86,18 +210,33 @@ def reset_milvus():
 
 
 def get_similar_conversations(
-    query_embedding: List[float], limit: int = 3
+    query_embedding: Sequence[float], limit: int = 3
 ) -> List[Dict[str, Any]]:
     """Search for similar conversations in Milvus"""
     search_results = milvus_client.search(
         collection_name=COLLECTION_NAME,
-        data=[query_embedding],
+        data=[to_milvus_vector(query_embedding)],
         limit=limit,
         output_fields=["question", "answer"],
+        search_params=build_search_params(MILVUS_INDEX_TYPE, MILVUS_SEARCH_PARAMS),
     )
 
-    # Return the conversations in a simplified format
-    return [hit["entity"] for hit in search_results[0]]
+    # Return the conversations in a simplified format, with the id and the
+    # cosine similarity of each hit
+    return [
+        {**hit["entity"], "id": hit["id"], "distance": hit["distance"]}
+        for hit in search_results[0]
+    ]
+
+
+async def aget_similar_conversations(
+    query_embedding: Sequence[float], limit: int = 3
+) -> List[Dict[str, Any]]:
+    """Search for similar conversations without blocking the event loop.
+
+    The gRPC call runs in a worker thread; the client is thread-safe.
+    """
+    return await asyncio.to_thread(get_similar_conversations, query_embedding, limit)
 
 
 if __name__ == "__main__":
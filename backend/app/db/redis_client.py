@@ -0,0 +1,28 @@
+import os
+from functools import lru_cache
+
+import redis
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv(".env.local")
+
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+# Keep application data apart from the Celery broker/result database
+REDIS_CACHE_DB = int(os.getenv("REDIS_CACHE_DB", "1"))
+
+
+@lru_cache(maxsize=1)
+def get_redis_client() -> redis.Redis:
+    """Get the shared Redis client used for caches and coordination.
+
+    The client connects lazily, so calling this never blocks on the network.
+    """
+    return redis.Redis(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        db=REDIS_CACHE_DB,
+        socket_timeout=1.0,
+        socket_connect_timeout=1.0,
+    )
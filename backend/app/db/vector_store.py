@@ -0,0 +1,381 @@
+import asyncio
+import fcntl
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from dotenv import load_dotenv
+
+from app.metrics import RAG_STAGE_SECONDS, timed
+from app.resources import resources
+from app.tracing import start_span
+
+# Load environment variables
+load_dotenv(".env.local")
+
+logger = logging.getLogger(__name__)
+
+# Get project root directory
+ROOT_DIR = Path(__file__).parent.parent.parent
+
+EMBEDDING_DIM = 1536  # OpenAI ada-002 dimension
+
+# "milvus" uses the Milvus server, "local" searches memory-mapped vectors
+# in-process and needs no external service.
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "milvus")
+LOCAL_VECTOR_STORE_DIR = os.getenv(
+    "LOCAL_VECTOR_STORE_DIR", str(ROOT_DIR / "data" / "vector_store")
+)
+LOCAL_VECTOR_STORE_INITIAL_CAPACITY = int(
+    os.getenv("LOCAL_VECTOR_STORE_INITIAL_CAPACITY", "1024")
+)
+# "float16" halves the size of the vector file at a small cost in recall,
+# see `scripts.test_milvus_search quantization`
+LOCAL_VECTOR_STORE_DTYPE = os.getenv("LOCAL_VECTOR_STORE_DTYPE", "float32")
+# Rows converted to float32 at a time when searching float16 vectors
+SEARCH_BLOCK_ROWS = 16384
+
+
+class MilvusVectorStore:
+    """Vector store backed by the Milvus collection."""
+
+    def __init__(self):
+        # Imported here so the local backend never connects to Milvus
+        from app.db import milvus_client
+
+        self.milvus = milvus_client
+
+    def init(self):
+        self.milvus.init_milvus()
+
+    def warm_up(self):
+        """Load the collection so the first search does not wait for it."""
+        self.milvus.milvus_client.load_collection(self.milvus.COLLECTION_NAME)
+
+    def search(
+        self, query_embedding: Sequence[float], limit: int = 3
+    ) -> List[Dict[str, Any]]:
+        return self.milvus.get_similar_conversations(query_embedding, limit)
+
+    def upsert(self, rows: List[Dict[str, Any]]):
+        """Insert or replace rows with id, question, answer and embedding."""
+        rows = [
+            {**row, "embedding": self.milvus.to_milvus_vector(row["embedding"])}
+            for row in rows
+        ]
+        return self.milvus.milvus_client.upsert(
+            collection_name=self.milvus.COLLECTION_NAME, data=rows
+        )
+
+    def delete(self, ids: List[int]):
+        return self.milvus.milvus_client.delete(
+            collection_name=self.milvus.COLLECTION_NAME, ids=ids
+        )
+
+
+class LocalVectorStore:
+    """In-process vector store for small corpora, dev machines and tests.
+
+    Unit-normalized float32 (or float16) vectors live in a memory-mapped
+    file, with the conversation id of every slot in a second one (-1 for a
+    free slot). A top-k cosine query is one matrix-vector product over the
+    mapped vectors.
+    Questions and answers are kept in SQLite next to them.
+
+    Writers from several processes are serialized with a file lock. Readers
+    pick up writes through the shared mapping and remap after the files grow.
+    """
+
+    def __init__(
+        self,
+        directory: str = LOCAL_VECTOR_STORE_DIR,
+        dim: int = EMBEDDING_DIM,
+        initial_capacity: int = LOCAL_VECTOR_STORE_INITIAL_CAPACITY,
+        dtype: str = LOCAL_VECTOR_STORE_DTYPE,
+    ):
+        self.directory = Path(directory)
+        self.dim = dim
+        self.initial_capacity = initial_capacity
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.float32, np.float16):
+            raise ValueError(f"Unsupported vector dtype {dtype}")
+        self._lock = threading.RLock()
+        self._capacity = 0
+        self._vectors: Optional[np.memmap] = None
+        self._ids: Optional[np.memmap] = None
+        self._local = threading.local()
+        self.init()
+
+    def _vectors_file(self, dtype: np.dtype) -> Path:
+        return self.directory / f"vectors.f{dtype.itemsize * 8}"
+
+    @property
+    def _vectors_path(self) -> Path:
+        return self._vectors_file(self.dtype)
+
+    @property
+    def _ids_path(self) -> Path:
+        return self.directory / "ids.i64"
+
+    def init(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with self._write_lock():
+            if not self._ids_path.exists():
+                self._resize(self.initial_capacity)
+            elif not self._vectors_path.exists():
+                self._convert_vectors()
+            db = self._db()
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                "id INTEGER PRIMARY KEY, question TEXT NOT NULL, answer TEXT NOT NULL)"
+            )
+            db.commit()
+        self._remap()
+
+    def _db(self) -> sqlite3.Connection:
+        # One connection per thread; searches run in worker threads
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.directory / "payloads.sqlite3", timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    def reset_after_fork(self):
+        """Drop the locks and connections a forked child inherited from its parent.
+
+        SQLite connections must not be used across fork(), so each process
+        opens its own.
+        """
+        self._lock = threading.RLock()
+        self._local = threading.local()
+
+    @contextmanager
+    def _write_lock(self):
+        with self._lock, open(self.directory / ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _convert_vectors(self):
+        """Rewrite the vectors of a store created with the other dtype in self.dtype.
+
+        Every process using the store must be restarted with the new dtype.
+        """
+        other = np.dtype(np.float16 if self.dtype == np.float32 else np.float32)
+        source_path = self._vectors_file(other)
+        if not source_path.exists():
+            raise RuntimeError(
+                f"{self.directory} has ids but no {self._vectors_path.name}; "
+                "delete the directory and reindex to rebuild the store"
+            )
+        capacity = self._ids_path.stat().st_size // 8
+        logger.info(
+            f"Converting {capacity} vectors in {self.directory} from {other} "
+            f"to {self.dtype}"
+        )
+        source = np.memmap(
+            source_path, dtype=other, mode="r", shape=(capacity, self.dim)
+        )
+        tmp_path = self._vectors_path.with_suffix(".tmp")
+        target = np.memmap(
+            tmp_path, dtype=self.dtype, mode="w+", shape=(capacity, self.dim)
+        )
+        for start in range(0, capacity, SEARCH_BLOCK_ROWS):
+            target[start : start + SEARCH_BLOCK_ROWS] = source[
+                start : start + SEARCH_BLOCK_ROWS
+            ]
+        target.flush()
+        del source, target
+        os.replace(tmp_path, self._vectors_path)
+        source_path.unlink()
+
+    def _resize(self, capacity: int):
+        """Grow both files to capacity slots, new slots are free."""
+        old_capacity = (
+            self._ids_path.stat().st_size // 8 if self._ids_path.exists() else 0
+        )
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(capacity * self.dim * self.dtype.itemsize)
+        with open(self._ids_path, "ab") as f:
+            f.truncate(capacity * 8)
+        ids = np.memmap(self._ids_path, dtype=np.int64, mode="r+", shape=(capacity,))
+        ids[old_capacity:] = -1
+        ids.flush()
+
+    def _remap(self):
+        """Map the files again if another writer grew them."""
+        capacity = self._ids_path.stat().st_size // 8
+        if capacity != self._capacity:
+            self._vectors = np.memmap(
+                self._vectors_path,
+                dtype=self.dtype,
+                mode="r+",
+                shape=(capacity, self.dim),
+            )
+            self._ids = np.memmap(
+                self._ids_path, dtype=np.int64, mode="r+", shape=(capacity,)
+            )
+            self._capacity = capacity
+
+    def warm_up(self):
+        """Read the vector file once so the first search finds it in memory."""
+        with self._lock:
+            self._remap()
+            vectors = self._vectors
+        for start in range(0, len(vectors), SEARCH_BLOCK_ROWS):
+            vectors[start : start + SEARCH_BLOCK_ROWS].max()
+
+    def search(
+        self, query_embedding: Sequence[float], limit: int = 3
+    ) -> List[Dict[str, Any]]:
+        """Top-limit conversations by cosine similarity, most similar first."""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        with self._lock:
+            self._remap()
+            vectors, ids = self._vectors, self._ids
+        # Snapshot the ids so a concurrent write cannot shift the result
+        ids = np.array(ids)
+        scores = self._scores(vectors, query)
+        scores[ids < 0] = -np.inf
+
+        in_use = int(np.count_nonzero(ids >= 0))
+        limit = min(limit, in_use)
+        if limit <= 0:
+            return []
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+
+        hit_ids = [int(ids[slot]) for slot in top]
+        placeholders = ",".join("?" * len(hit_ids))
+        payloads = {
+            row[0]: row[1:]
+            for row in self._db().execute(
+                f"SELECT id, question, answer FROM conversations "
+                f"WHERE id IN ({placeholders})",
+                hit_ids,
+            )
+        }
+        return [
+            {
+                "question": payloads[conversation_id][0],
+                "answer": payloads[conversation_id][1],
+                "id": conversation_id,
+                "distance": float(scores[slot]),
+            }
+            for conversation_id, slot in zip(hit_ids, top)
+            if conversation_id in payloads
+        ]
+
+    def _scores(self, vectors: np.memmap, query: np.ndarray) -> np.ndarray:
+        if self.dtype == np.float32:
+            return vectors @ query
+        # NumPy has no fast float16 matmul; widen a block at a time instead
+        scores = np.empty(len(vectors), dtype=np.float32)
+        for start in range(0, len(vectors), SEARCH_BLOCK_ROWS):
+            block = vectors[start : start + SEARCH_BLOCK_ROWS]
+            scores[start : start + len(block)] = block.astype(np.float32) @ query
+        return scores
+
+    def upsert(self, rows: List[Dict[str, Any]]):
+        """Insert or replace rows with id, question, answer and embedding."""
+        if not rows:
+            return {"upsert_count": 0}
+        vectors = np.asarray([row["embedding"] for row in rows], dtype=np.float32)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-d vectors, got {vectors.shape[1]}")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+        with self._write_lock():
+            self._remap()
+            in_use = np.flatnonzero(self._ids >= 0)
+            slots = dict(zip(self._ids[in_use].tolist(), in_use.tolist()))
+            # Reversed so pop() hands out the lowest free slot first
+            free = np.flatnonzero(self._ids < 0)[::-1].tolist()
+            needed = sum(1 for row in rows if row["id"] not in slots) - len(free)
+            if needed > 0:
+                old_capacity = self._capacity
+                self._resize(max(old_capacity * 2, old_capacity + needed))
+                self._remap()
+                free = list(range(self._capacity - 1, old_capacity - 1, -1)) + free
+
+            db = self._db()
+            db.executemany(
+                "INSERT OR REPLACE INTO conversations (id, question, answer) "
+                "VALUES (?, ?, ?)",
+                [(row["id"], row["question"], row["answer"]) for row in rows],
+            )
+            for row, vector in zip(rows, vectors):
+                slot = slots.get(row["id"])
+                if slot is None:
+                    slot = slots[row["id"]] = free.pop()
+                self._vectors[slot] = vector
+                self._ids[slot] = row["id"]
+            self._vectors.flush()
+            self._ids.flush()
+            db.commit()
+
+        return {"upsert_count": len(rows)}
+
+    def delete(self, ids: List[int]):
+        with self._write_lock():
+            self._remap()
+            slots = np.flatnonzero(np.isin(self._ids, list(ids)))
+            self._ids[slots] = -1
+            self._vectors[slots] = 0
+            self._ids.flush()
+            self._vectors.flush()
+            db = self._db()
+            db.executemany(
+                "DELETE FROM conversations WHERE id = ?", [(i,) for i in ids]
+            )
+            db.commit()
+        return {"delete_count": len(slots)}
+
+    def count(self) -> int:
+        with self._lock:
+            self._remap()
+            return int(np.count_nonzero(self._ids >= 0))
+
+
+vector_store = (
+    LocalVectorStore() if VECTOR_STORE_BACKEND == "local" else MilvusVectorStore()
+)
+resources.add_warmup("vector_store", vector_store.warm_up)
+
+if isinstance(vector_store, LocalVectorStore) and hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=vector_store.reset_after_fork)
+
+
+def get_similar_conversations(
+    query_embedding: Sequence[float], limit: int = 3
+) -> List[Dict[str, Any]]:
+    """Search for similar conversations in the configured vector store."""
+    with (
+        start_span("vector_store.search", limit=limit),
+        timed(RAG_STAGE_SECONDS, stage="vector_search", model="", cache_hit="false"),
+    ):
+        return vector_store.search(query_embedding, limit)
+
+
+async def aget_similar_conversations(
+    query_embedding: Sequence[float], limit: int = 3
+) -> List[Dict[str, Any]]:
+    """Search for similar conversations without blocking the event loop."""
+    return await asyncio.to_thread(get_similar_conversations, query_embedding, limit)
+
+
+if __name__ == "__main__":
+    vector_store.init()
@@ -1,9 +1,58 @@
-from fastapi import FastAPI
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.api.endpoints import mental_health_conversation
+from app.db.database import async_engine, get_pool_stats
+from app.metrics import render_metrics
+from app.resources import resources
+from app.services.conversation_generation import (
+    aembedding_flight,
+    ageneration_flight,
+)
+from app.services.hybrid_search import HYBRID_SEARCH_ENABLED
+from app.services.keyword_index import keyword_index
+from app.tracing import extract, start_span
+from app.utils.embedding_cache import embedding_cache, load_prewarm_queries
+from app.utils.embeddings import EMBEDDING_MODEL, get_embeddings
+
+logger = logging.getLogger(__name__)
+
+
+def prewarm_embedding_cache():
+    """Embed the frequent queries listed in EMBEDDING_CACHE_PREWARM_FILE."""
+    prewarm_file = os.getenv("EMBEDDING_CACHE_PREWARM_FILE")
+    if not prewarm_file:
+        return
 
-app = FastAPI(title="Mental Health API")
+    queries = load_prewarm_queries(Path(prewarm_file))
+    added = embedding_cache.prewarm(
+        queries,
+        EMBEDDING_MODEL,
+        lambda texts: [result.embedding for result in get_embeddings(texts)],
+    )
+    logger.info(f"Pre-warmed embedding cache with {added} of {len(queries)} queries")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create clients and load the collection and templates before serving
+    init_times = await asyncio.to_thread(resources.warm_up)
+    logger.info(f"Resources warmed up, init times in ms: {init_times}")
+    if HYBRID_SEARCH_ENABLED:
+        # Built in the background; retrieval is vector-only until it is ready
+        keyword_index.start_loading()
+    await asyncio.to_thread(prewarm_embedding_cache)
+    yield
+    await async_engine.dispose()
+
+
+app = FastAPI(title="Mental Health API", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -16,8 +65,28 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["Content-Type", "Authorization"],
+    expose_headers=["X-Next-Cursor", "X-Trace-Id"],
 )
 
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Record each request as a span, continuing the caller's trace if sent."""
+    with start_span(
+        f"{request.method} {request.url.path}",
+        parent=extract(request.headers),
+        kind="SERVER",
+        **{"http.method": request.method, "http.path": request.url.path},
+    ) as span:
+        response = await call_next(request)
+        route = request.scope.get("route")
+        if route is not None:
+            span.name = f"{request.method} {route.path}"
+        span.set_tag("http.status_code", str(response.status_code))
+    response.headers["X-Trace-Id"] = span.context.trace_id
+    return response
+
+
 app.include_router(
     mental_health_conversation.router,
     prefix="/api/v1",
@@ -28,3 +97,31 @@ app.include_router(
 @app.get("/")
 def read_root():
     return {"message": "Welcome to Mental Health API"}
+
+
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    """Latency histograms in the Prometheus text format."""
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
+@app.get("/health/db-pool")
+def read_db_pool_stats():
+    """Connection pool usage and checkout wait times."""
+    return get_pool_stats()
+
+
+@app.get("/health/resources")
+def read_resource_stats():
+    """Clients initialized so far, their init times and warm-up errors."""
+    return resources.stats()
+
+
+@app.get("/health/single-flight")
+def read_single_flight_stats():
+    """Upstream calls made, and calls saved by joining an identical one in flight."""
+    return {
+        "embedding": aembedding_flight.stats(),
+        "generation": ageneration_flight.stats(),
+    }
@@ -0,0 +1,147 @@
+import asyncio
+import functools
+import inspect
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Tuple
+
+from dotenv import load_dotenv
+
+# Load environment variables. prometheus_client picks single or multiprocess
+# mode when it is imported, so PROMETHEUS_MULTIPROC_DIR must be set by then.
+load_dotenv(".env.local")
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+
+# Set for processes that fork workers (Celery prefork, uvicorn --workers), so
+# every child writes its samples there and /metrics aggregates them
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+# Port of the worker's metrics endpoint, 0 disables it
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9100"))
+
+# From a cache lookup to a long chat completion
+LATENCY_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+RAG_STAGE_SECONDS = Histogram(
+    "rag_stage_seconds",
+    "Time spent in each stage of a RAG generation",
+    ["stage", "model", "outcome", "cache_hit"],
+    buckets=LATENCY_BUCKETS,
+)
+CRUD_SECONDS = Histogram(
+    "crud_operation_seconds",
+    "Time spent in conversation CRUD operations",
+    ["operation", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+TASK_SECONDS = Histogram(
+    "celery_task_seconds",
+    "Run time of Celery tasks",
+    ["task", "outcome"],
+    buckets=LATENCY_BUCKETS + (120.0, 300.0, 600.0),
+)
+
+RATE_LIMIT_WAIT_SECONDS = Histogram(
+    "openai_rate_limit_wait_seconds",
+    "Time OpenAI calls waited for quota of the shared rate limiter",
+    ["limiter", "priority"],
+    buckets=LATENCY_BUCKETS,
+)
+OPENAI_RETRIES = Counter(
+    "openai_retries",
+    "OpenAI calls retried after a 429, a 5xx or a connection error",
+    ["limiter", "reason"],
+)
+
+
+@contextmanager
+def timed(histogram: Histogram, **labels: str) -> Iterator[Dict[str, str]]:
+    """Observe the time the block takes, with outcome "error" if it raises.
+
+    Yields the labels so the block can fill in ones only known inside it,
+    such as whether a cache was hit. A block left because the caller went
+    away, such as a disconnected client, counts as "cancelled".
+    """
+    labels.setdefault("outcome", "success")
+    started = time.perf_counter()
+    try:
+        yield labels
+    except (asyncio.CancelledError, GeneratorExit):
+        labels["outcome"] = "cancelled"
+        raise
+    except BaseException:
+        labels["outcome"] = "error"
+        raise
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - started)
+
+
+def instrumented(histogram: Histogram, label: str = "operation") -> Callable:
+    """Decorator timing every call of a sync or async function by its name."""
+
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with timed(histogram, **{label: fn.__name__}):
+                    return await fn(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(histogram, **{label: fn.__name__}):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def metrics_registry() -> CollectorRegistry:
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """The current metrics in the Prometheus text format, and its content type."""
+    return generate_latest(metrics_registry()), CONTENT_TYPE_LATEST
+
+
+def start_metrics_server(port: int):
+    start_http_server(port, registry=metrics_registry())
+
+
+def mark_process_dead(pid: int):
+    """Drop the live gauges of a finished worker process from the aggregate."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
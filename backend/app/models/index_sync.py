@@ -0,0 +1,31 @@
+from sqlalchemy import Column, DateTime, Integer, String
+from sqlalchemy.sql import func
+
+from ..db.database import Base
+
+
+class ConversationTombstone(Base):
+    """A deleted conversation, kept until the vector index sync has removed it."""
+
+    __tablename__ = "conversation_tombstones"
+
+    conversation_id = Column(Integer, primary_key=True, autoincrement=False)
+    deleted_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+    def __repr__(self):
+        return (
+            f"<ConversationTombstone(conversation_id={self.conversation_id}, "
+            f"deleted_at={self.deleted_at})>"
+        )
+
+
+class IndexSyncState(Base):
+    """How far a sync job has read the conversation changes."""
+
+    __tablename__ = "index_sync_state"
+
+    name = Column(String(64), primary_key=True)
+    watermark = Column(DateTime(timezone=True), nullable=False)
+
+    def __repr__(self):
+        return f"<IndexSyncState(name={self.name}, watermark={self.watermark})>"
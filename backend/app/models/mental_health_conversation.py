@@ -12,8 +12,16 @@ class MentalHealthConversation(Base):
     answer = Column(Text, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(
-        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        index=True,
     )
+    # Hash of the current text, and of the text last written to the vector
+    # index. The index sync only re-embeds rows where the two differ; bulk
+    # imports look up content_hash to skip conversations already stored.
+    content_hash = Column(String(64), index=True)
+    indexed_hash = Column(String(64))
 
     def __repr__(self):
         return f"<MentalHealthConversation(id={self.id}, created_at={self.created_at})>"
@@ -0,0 +1,168 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Generic, List, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class LazyResource(Generic[T]):
+    """A client created on first use, once per process.
+
+    Attribute access is forwarded to the client, so a LazyResource can stand
+    in for the module-level client it replaces. After a fork the child drops
+    the parent's client and creates its own, as gRPC channels and HTTP
+    connection pools must not be shared across processes.
+    """
+
+    def __init__(
+        self,
+        registry: "ResourceRegistry",
+        name: str,
+        factory: Callable[[], T],
+        close: Optional[Callable[[T], Any]] = None,
+    ):
+        self._registry = registry
+        self._name = name
+        self._factory = factory
+        self._close = close
+        self._instance: Optional[T] = None
+        self._lock = threading.Lock()
+
+    @property
+    def initialized(self) -> bool:
+        return self._instance is not None
+
+    def get(self) -> T:
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    started = time.perf_counter()
+                    self._instance = self._factory()
+                    self._registry._record(self._name, time.perf_counter() - started)
+                instance = self._instance
+        return instance
+
+    def reset(self):
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def close(self):
+        """Release the client's connections; it is recreated on next use."""
+        with self._lock:
+            instance, self._instance = self._instance, None
+        if instance is not None and self._close is not None:
+            self._close(instance)
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
+
+
+class ResourceRegistry:
+    """Process-wide clients and warm-up steps with their init times.
+
+    Clients are registered at import, which costs nothing, and created on
+    first use. The API's lifespan calls warm_up so the first request does
+    not pay for them, and reports the time each one took.
+    """
+
+    def __init__(self):
+        self._resources: Dict[str, LazyResource] = {}
+        self._warmups: Dict[str, Callable[[], None]] = {}
+        self._init_times: Dict[str, float] = {}
+        self._errors: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def register(
+        self,
+        name: str,
+        factory: Callable[[], T],
+        close: Optional[Callable[[T], Any]] = None,
+    ) -> LazyResource[T]:
+        """Register a client created by factory, and released by close if given."""
+        resource = LazyResource(self, name, factory, close)
+        self._resources[name] = resource
+        return resource
+
+    def add_warmup(self, name: str, fn: Callable[[], None]):
+        """Run fn during warm_up, after all registered clients are created."""
+        self._warmups[name] = fn
+
+    def _record(self, name: str, seconds: float):
+        with self._lock:
+            self._init_times[name] = round(seconds * 1000, 1)
+            self._errors.pop(name, None)
+        logger.info(f"Initialized {name} in {seconds * 1000:.1f} ms")
+
+    def warm_up(self, names: Optional[List[str]] = None) -> Dict[str, float]:
+        """Create clients and run warm-up steps, returning ms per component.
+
+        A failing component is logged and skipped; clients are retried on
+        first use, so the API still starts when a dependency is down.
+        """
+        for name, resource in self._resources.items():
+            if names is not None and name not in names:
+                continue
+            try:
+                resource.get()
+            except Exception as e:
+                logger.exception(f"Could not initialize {name}")
+                self._errors[name] = str(e)
+        for name, fn in self._warmups.items():
+            if names is not None and name not in names:
+                continue
+            started = time.perf_counter()
+            try:
+                fn()
+            except Exception as e:
+                logger.exception(f"Warm-up step {name} failed")
+                self._errors[name] = str(e)
+                continue
+            self._record(name, time.perf_counter() - started)
+        return self.init_times()
+
+    def init_times(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._init_times)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "initialized": sorted(
+                    name for name, r in self._resources.items() if r.initialized
+                ),
+                "init_ms": dict(self._init_times),
+                "errors": dict(self._errors),
+            }
+
+    def close(self):
+        """Close every client that was created, e.g. when a worker shuts down."""
+        for name, resource in self._resources.items():
+            try:
+                resource.close()
+            except Exception:
+                logger.exception(f"Could not close {name}")
+
+    def reset(self):
+        """Drop every client, to be recreated on next use.
+
+        Also runs in a forked child, where a lock held by another thread of
+        the parent is never released, so locks are replaced rather than taken.
+        """
+        for resource in self._resources.values():
+            resource.reset()
+        self._lock = threading.Lock()
+        self._init_times = {}
+        self._errors = {}
+
+
+resources = ResourceRegistry()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=resources.reset)
@@ -1,7 +1,10 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+# Upper bound on rows accepted by a single bulk create request
+BULK_CREATE_MAX_ROWS = 10000
 
 
 class MentalHealthConversationBase(BaseModel):
@@ -13,6 +16,21 @@ class MentalHealthConversationCreate(MentalHealthConversationBase):
     pass
 
 
+class MentalHealthConversationBulkCreate(BaseModel):
+    conversations: List[MentalHealthConversationCreate] = Field(
+        min_length=1, max_length=BULK_CREATE_MAX_ROWS
+    )
+    # Leave out conversations whose question and answer are already stored
+    skip_existing: bool = False
+
+
+class MentalHealthConversationBulkCreateResponse(BaseModel):
+    ids: List[int]
+    task_id: Optional[str] = None
+    # Conversations that already existed; their ids are in ids
+    skipped: int = 0
+
+
 class MentalHealthConversation(MentalHealthConversationBase):
     id: int
     created_at: datetime
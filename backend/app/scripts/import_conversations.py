@@ -1,32 +1,169 @@
 import argparse
 import asyncio
 import csv
+import json
+import time
 from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 from app.client.api_client import APIClient
+from app.schemas.mental_health_conversation import MentalHealthConversationCreate
+from app.utils.embedding_cache import content_hash
 
 
-async def import_conversations(csv_path: Path, base_url: str = "http://localhost:8000"):
-    """Import conversations from CSV file using the API client."""
+class ImportCheckpoint:
+    """Import progress appended to a file next to the CSV so a run can be resumed.
+
+    Every finished batch appends a line with committed_rows, the number of
+    leading CSV rows that are fully imported, and the content hashes of the
+    batch. The hashes cover batches that finished out of order too, so a
+    resumed run does not send them again. The server skips conversations it
+    already has either way, so a lost or stale checkpoint only costs time.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.committed_rows = 0
+        self.hashes: Set[str] = set()
+        if not path.exists():
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        for line in text.splitlines():
+            try:
+                state = json.loads(line)
+            except ValueError:
+                # The last line of a run that was killed while writing it
+                continue
+            self.committed_rows = max(self.committed_rows, state["committed_rows"])
+            self.hashes.update(state["hashes"])
+        if text and not text.endswith("\n"):
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("\n")
+
+    def record(self, committed_rows: int, hashes: Iterable[str]):
+        hashes = list(hashes)
+        self.committed_rows = committed_rows
+        self.hashes.update(hashes)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"committed_rows": committed_rows, "hashes": hashes}))
+            f.write("\n")
+
+
+def read_batches(
+    csv_path: Path, start_row: int, batch_size: int
+) -> Iterator[Tuple[int, List[Tuple[str, str]]]]:
+    """Stream (end_row, [(question, answer), ...]) batches after start_row."""
+    with open(csv_path, "r", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        batch: List[Tuple[str, str]] = []
+        row_number = 0
+        for row in reader:
+            row_number += 1
+            if row_number <= start_row:
+                continue
+            batch.append((row["question"].strip(), row["answer"].strip()))
+            if len(batch) == batch_size:
+                yield row_number, batch
+                batch = []
+        if batch:
+            yield row_number, batch
+
+
+async def import_conversations(
+    csv_path: Path,
+    base_url: str = "http://localhost:8000",
+    batch_size: int = 500,
+    concurrency: int = 4,
+    checkpoint_path: Optional[Path] = None,
+):
+    """Import conversations from CSV file using the API client.
+
+    Rows are sent through the bulk endpoint with several batches in flight.
+    The server skips conversations that are already stored, so re-running an
+    interrupted import is safe. Progress is checkpointed after every batch so
+    a resumed run starts where the last one stopped.
+    """
+    checkpoint_path = checkpoint_path or csv_path.with_suffix(".import-state.json")
+    checkpoint = ImportCheckpoint(checkpoint_path)
     print(f"Importing conversations from {csv_path}")
+    if checkpoint.committed_rows:
+        print(f"Resuming after row {checkpoint.committed_rows}")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    # end_row of every batch in flight or finished, in submission order
+    pending: Dict[int, bool] = {}
+    in_flight: Set[str] = set()
+    imported = skipped = failed = 0
+    started = time.monotonic()
+
+    def advance_checkpoint(hashes: Iterable[str] = ()):
+        # Move committed_rows over the finished prefix of batches
+        committed_rows = checkpoint.committed_rows
+        for end_row in sorted(pending):
+            if not pending[end_row]:
+                break
+            committed_rows = end_row
+            del pending[end_row]
+        if hashes or committed_rows != checkpoint.committed_rows:
+            checkpoint.record(committed_rows, hashes)
+
+    async def send(client: APIClient, end_row: int, rows: List[Tuple[str, str]]):
+        nonlocal imported, failed
+        hashes = [content_hash(q, a) for q, a in rows]
+        try:
+            await client.create_conversations_bulk(
+                [MentalHealthConversationCreate(question=q, answer=a) for q, a in rows],
+                skip_existing=True,
+            )
+            imported += len(rows)
+            pending[end_row] = True
+        except Exception as e:
+            print(f"Error importing rows up to {end_row}: {e}")
+            failed += len(rows)
+            # Leave the batch unfinished so the checkpoint never moves past it
+            hashes = []
+        finally:
+            in_flight.difference_update(content_hash(q, a) for q, a in rows)
+            advance_checkpoint(hashes)
+            elapsed = time.monotonic() - started
+            print(
+                f"Imported {imported} rows ({imported / elapsed:.0f} rows/sec), "
+                f"skipped {skipped} duplicates, {failed} failed"
+            )
+            semaphore.release()
 
     async with APIClient(base_url=base_url) as client:
-        with open(csv_path, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            imported = 0
-
-            for row in reader:
-                try:
-                    conversation = await client.create_conversation(
-                        question=row["question"].strip(), answer=row["answer"].strip()
-                    )
-                    print(f"Imported conversation {conversation.id}")
-                    imported += 1
-                except Exception as e:
-                    print(f"Error importing conversation: {e}")
+        tasks = []
+        for end_row, batch in read_batches(
+            csv_path, checkpoint.committed_rows, batch_size
+        ):
+            rows = []
+            for question, answer in batch:
+                digest = content_hash(question, answer)
+                if digest in checkpoint.hashes or digest in in_flight:
+                    skipped += 1
                     continue
+                in_flight.add(digest)
+                rows.append((question, answer))
+
+            if not rows:
+                pending[end_row] = True
+                continue
 
-            print(f"Successfully imported {imported} conversations")
+            await semaphore.acquire()
+            pending[end_row] = False
+            tasks.append(asyncio.create_task(send(client, end_row, rows)))
+
+        await asyncio.gather(*tasks)
+        advance_checkpoint()
+
+    elapsed = time.monotonic() - started
+    print(
+        f"Successfully imported {imported} conversations in {elapsed:.1f}s "
+        f"({imported / max(elapsed, 1e-9):.0f} rows/sec), "
+        f"skipped {skipped} duplicates, {failed} failed"
+    )
 
 
 def main():
@@ -42,6 +179,23 @@ def main():
         default="http://localhost:8000",
         help="Base URL for the API (default: http://localhost:8000)",
     )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=500,
+        help="Rows per bulk request (default: 500)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Bulk requests in flight at once (default: 4)",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        type=Path,
+        help="Checkpoint file (default: <file>.import-state.json)",
+    )
 
     args = parser.parse_args()
 
@@ -53,7 +207,15 @@ def main():
         print(f"Error: Could not find {args.file}")
         return
 
-    asyncio.run(import_conversations(args.file, args.url))
+    asyncio.run(
+        import_conversations(
+            args.file,
+            args.url,
+            batch_size=args.batch_size,
+            concurrency=args.concurrency,
+            checkpoint_path=args.checkpoint,
+        )
+    )
 
 
 if __name__ == "__main__":
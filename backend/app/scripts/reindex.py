@@ -0,0 +1,344 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Optional, Set, Tuple
+
+from pymilvus import MilvusException
+from sqlalchemy import func, select
+
+from app.db.database import SessionLocal
+from app.db.milvus_client import (
+    COLLECTION_NAME,
+    ROOT_DIR,
+    create_collection,
+    milvus_client,
+    to_milvus_vector,
+)
+from app.models.mental_health_conversation import MentalHealthConversation
+from app.utils.embeddings import get_combined_embeddings
+
+DEFAULT_CHECKPOINT_PATH = ROOT_DIR / "data" / "milvus.reindex-state.json"
+
+# Rows changed this long before the build started are replayed as well, to
+# cover clock differences and transactions that committed late.
+CATCH_UP_MARGIN = timedelta(minutes=1)
+
+
+class ReindexCheckpoint:
+    """Progress of a reindex, persisted so an interrupted run can resume.
+
+    ranges are (after_id, last_id] id ranges of about batch_size rows, planned
+    once at the start so a resumed run processes exactly the same batches.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.collection_name: Optional[str] = None
+        self.started_at: Optional[datetime] = None
+        self.ranges: List[Tuple[int, int]] = []
+        self.done: Set[int] = set()
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self.collection_name = state["collection_name"]
+            self.started_at = datetime.fromisoformat(state["started_at"])
+            self.ranges = [tuple(r) for r in state["ranges"]]
+            self.done = set(state["done"])
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "collection_name": self.collection_name,
+                    "started_at": self.started_at.isoformat(),
+                    "ranges": self.ranges,
+                    "done": sorted(self.done),
+                },
+                f,
+            )
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if self.path.exists():
+            self.path.unlink()
+
+
+def plan_ranges(batch_size: int) -> List[Tuple[int, int]]:
+    """Split the table into id ranges of batch_size rows, reading ids only."""
+    ranges = []
+    after_id = 0
+    with SessionLocal() as db:
+        while True:
+            ids = db.scalars(
+                select(MentalHealthConversation.id)
+                .where(MentalHealthConversation.id > after_id)
+                .order_by(MentalHealthConversation.id)
+                .limit(batch_size)
+            ).all()
+            if not ids:
+                return ranges
+            ranges.append((after_id, ids[-1]))
+            after_id = ids[-1]
+
+
+def _upsert_conversations(collection_name: str, conversations) -> int:
+    """Embed and upsert conversations, returning how many were written."""
+    results = get_combined_embeddings([(c.question, c.answer) for c in conversations])
+    data = [
+        {
+            "id": c.id,
+            "question": c.question,
+            "answer": c.answer,
+            "embedding": to_milvus_vector(result.embedding),
+        }
+        for c, result in zip(conversations, results)
+        if result.ok
+    ]
+    if data:
+        milvus_client.upsert(collection_name=collection_name, data=data)
+    return len(data)
+
+
+def index_range(collection_name: str, after_id: int, last_id: int) -> Tuple[int, int]:
+    """Index the conversations in (after_id, last_id], returns (indexed, failed)."""
+    with SessionLocal() as db:
+        conversations = (
+            db.query(MentalHealthConversation)
+            .filter(
+                MentalHealthConversation.id > after_id,
+                MentalHealthConversation.id <= last_id,
+            )
+            .all()
+        )
+    indexed = _upsert_conversations(collection_name, conversations)
+    return indexed, len(conversations) - indexed
+
+
+def catch_up(collection_name: str, since: datetime, batch_size: int) -> int:
+    """Re-index rows changed since a point in time and drop deleted ones."""
+    updated = 0
+    after_id = 0
+    with SessionLocal() as db:
+        while True:
+            conversations = (
+                db.query(MentalHealthConversation)
+                .filter(
+                    MentalHealthConversation.updated_at >= since,
+                    MentalHealthConversation.id > after_id,
+                )
+                .order_by(MentalHealthConversation.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not conversations:
+                break
+            updated += _upsert_conversations(collection_name, conversations)
+            after_id = conversations[-1].id
+
+        live_ids = set(db.scalars(select(MentalHealthConversation.id)).all())
+
+    iterator = milvus_client.query_iterator(
+        collection_name=collection_name, batch_size=10000, output_fields=["id"]
+    )
+    stale_ids = []
+    while True:
+        batch = iterator.next()
+        if not batch:
+            iterator.close()
+            break
+        stale_ids.extend(row["id"] for row in batch if row["id"] not in live_ids)
+    if stale_ids:
+        milvus_client.delete(collection_name=collection_name, ids=stale_ids)
+
+    print(f"Caught up {updated} changed and {len(stale_ids)} deleted conversations")
+    return updated
+
+
+def count_rows(collection_name: str) -> int:
+    result = milvus_client.query(
+        collection_name=collection_name,
+        filter="",
+        output_fields=["count(*)"],
+        consistency_level="Strong",
+    )
+    return result[0]["count(*)"]
+
+
+def current_collection() -> Optional[str]:
+    """The collection COLLECTION_NAME points to, if it is an alias."""
+    try:
+        return milvus_client.describe_alias(COLLECTION_NAME)["collection_name"]
+    except MilvusException:
+        return None
+
+
+def switch_alias(collection_name: str) -> Optional[str]:
+    """Point COLLECTION_NAME at collection_name, returning the previous collection."""
+    previous = current_collection()
+    if previous is not None:
+        milvus_client.alter_alias(collection_name, COLLECTION_NAME)
+        return previous
+
+    if milvus_client.has_collection(COLLECTION_NAME):
+        # First reindex: the live collection still has the plain name. Rename
+        # it so the name can become an alias; searches fail for the moment
+        # between the two calls.
+        previous = f"{COLLECTION_NAME}_v0"
+        milvus_client.rename_collection(COLLECTION_NAME, previous)
+    milvus_client.create_alias(collection_name, COLLECTION_NAME)
+    return previous
+
+
+def reindex(
+    batch_size: int = 500,
+    concurrency: int = 4,
+    checkpoint_path: Path = DEFAULT_CHECKPOINT_PATH,
+    force: bool = False,
+):
+    """Build a new collection from MySQL and switch COLLECTION_NAME to it."""
+    checkpoint = ReindexCheckpoint(checkpoint_path)
+    if checkpoint.collection_name and milvus_client.has_collection(
+        checkpoint.collection_name
+    ):
+        print(
+            f"Resuming into {checkpoint.collection_name}, "
+            f"{len(checkpoint.done)}/{len(checkpoint.ranges)} batches done"
+        )
+    else:
+        with SessionLocal() as db:
+            checkpoint.started_at = db.scalar(select(func.now()))
+        checkpoint.collection_name = (
+            f"{COLLECTION_NAME}_v{checkpoint.started_at:%Y%m%d%H%M%S}"
+        )
+        print("Planning batches...")
+        checkpoint.ranges = plan_ranges(batch_size)
+        checkpoint.done = set()
+        create_collection(checkpoint.collection_name)
+        checkpoint.save()
+        print(
+            f"Reindexing into {checkpoint.collection_name}: "
+            f"{len(checkpoint.ranges)} batches of up to {batch_size} rows"
+        )
+
+    collection_name = checkpoint.collection_name
+    pending = [i for i in range(len(checkpoint.ranges)) if i not in checkpoint.done]
+    indexed = failed = 0
+    started = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {
+            executor.submit(index_range, collection_name, *checkpoint.ranges[i]): i
+            for i in pending
+        }
+        for future in as_completed(futures):
+            batch_indexed, batch_failed = future.result()
+            indexed += batch_indexed
+            failed += batch_failed
+            checkpoint.done.add(futures[future])
+            checkpoint.save()
+
+            elapsed = time.monotonic() - started
+            remaining = len(checkpoint.ranges) - len(checkpoint.done)
+            done_here = len(checkpoint.done) - (len(checkpoint.ranges) - len(pending))
+            eta = elapsed / done_here * remaining
+            print(
+                f"Batches {len(checkpoint.done)}/{len(checkpoint.ranges)}, "
+                f"{indexed} rows ({indexed / elapsed:.0f} rows/sec), "
+                f"{failed} failed, ETA {eta:.0f}s"
+            )
+
+    if failed and not force:
+        print(f"Error: {failed} conversations could not be embedded, not switching")
+        return
+
+    with SessionLocal() as db:
+        catch_up_started = db.scalar(select(func.now()))
+    catch_up(collection_name, checkpoint.started_at - CATCH_UP_MARGIN, batch_size)
+
+    milvus_client.flush(collection_name)
+    with SessionLocal() as db:
+        expected = db.scalar(select(func.count(MentalHealthConversation.id)))
+    actual = count_rows(collection_name)
+    print(f"Validation: MySQL has {expected} conversations, {collection_name} {actual}")
+    if actual != expected and not force:
+        print("Error: row counts differ, not switching")
+        return
+
+    previous = switch_alias(collection_name)
+    # Writes that reached the old collection while we were validating
+    catch_up(collection_name, catch_up_started - CATCH_UP_MARGIN, batch_size)
+    checkpoint.clear()
+
+    print(f"Switched {COLLECTION_NAME} to {collection_name}")
+    if previous:
+        print(
+            f"Kept {previous} for rollback: "
+            f"python -m app.scripts.reindex --rollback {previous}"
+        )
+
+
+def rollback(collection_name: str):
+    """Point COLLECTION_NAME back at an older collection."""
+    if not milvus_client.has_collection(collection_name):
+        print(f"Error: collection {collection_name} does not exist")
+        return
+    previous = switch_alias(collection_name)
+    print(f"Switched {COLLECTION_NAME} from {previous} to {collection_name}")
+
+
+def main():
+    """Main entry point for the reindex script."""
+    parser = argparse.ArgumentParser(
+        description="Rebuild the Milvus collection from MySQL without downtime"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=500,
+        help="Rows embedded and written per batch (default: 500)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Batches processed in parallel (default: 4)",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        type=Path,
+        default=DEFAULT_CHECKPOINT_PATH,
+        help=f"Checkpoint file (default: {DEFAULT_CHECKPOINT_PATH})",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Switch even if some rows failed or the row counts differ",
+    )
+    parser.add_argument(
+        "--rollback",
+        metavar="COLLECTION",
+        help="Point the alias back at COLLECTION instead of reindexing",
+    )
+
+    args = parser.parse_args()
+
+    if args.rollback:
+        rollback(args.rollback)
+        return
+
+    reindex(
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        checkpoint_path=args.checkpoint,
+        force=args.force,
+    )
+
+
+if __name__ == "__main__":
+    main()
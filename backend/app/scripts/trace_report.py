@@ -0,0 +1,118 @@
+import argparse
+import json
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.tracing import TRACE_JSON_PATH
+
+Span = Dict[str, Any]
+
+
+def load_traces(path: Path) -> Dict[str, List[Span]]:
+    """Spans written by the json trace exporter, grouped by trace id."""
+    traces: Dict[str, List[Span]] = defaultdict(list)
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                span = json.loads(line)
+                traces[span["traceId"]].append(span)
+    for spans in traces.values():
+        spans.sort(key=lambda span: span["timestamp"])
+    return traces
+
+
+def searchable_latency(spans: List[Span]) -> Optional[float]:
+    """Seconds from the start of the trace until its last vector store write.
+
+    For a trace started by creating or updating a conversation, this is how
+    long it took for the conversation to become searchable.
+    """
+    upserts = [span for span in spans if span["name"] == "vector_store.upsert"]
+    if not upserts:
+        return None
+    searchable_at = max(span["timestamp"] + span["duration"] for span in upserts)
+    return (searchable_at - spans[0]["timestamp"]) / 1_000_000
+
+
+def conversation_ids(spans: List[Span]) -> List[int]:
+    ids = set()
+    for span in spans:
+        if span["name"] == "index_rows" and "conversation_ids" in span["tags"]:
+            ids.update(json.loads(span["tags"]["conversation_ids"]))
+    return sorted(ids)
+
+
+def print_trace(trace_id: str, spans: List[Span]):
+    start = spans[0]["timestamp"]
+    latency = searchable_latency(spans)
+    print(
+        f"\nTrace {trace_id}: conversations {conversation_ids(spans)}, "
+        f"searchable after {latency * 1000:.1f} ms"
+    )
+    for span in spans:
+        service = span.get("localEndpoint", {}).get("serviceName", "")
+        print(
+            f"  +{(span['timestamp'] - start) / 1000:9.1f} ms "
+            f"{span['duration'] / 1000:9.1f} ms  {service:<22} {span['name']}"
+            + (f"  error: {span['tags']['error']}" if "error" in span["tags"] else "")
+        )
+
+
+def report(path: Path, limit: int):
+    traces = load_traces(path)
+    indexed = {
+        trace_id: spans
+        for trace_id, spans in traces.items()
+        if searchable_latency(spans) is not None
+    }
+    print(f"{len(traces)} traces, {len(indexed)} of them indexed conversations")
+    if not indexed:
+        return
+
+    latencies = np.array([searchable_latency(spans) for spans in indexed.values()])
+    print(
+        "Created -> searchable: "
+        f"p50 {np.percentile(latencies, 50) * 1000:.1f} ms, "
+        f"p95 {np.percentile(latencies, 95) * 1000:.1f} ms, "
+        f"max {latencies.max() * 1000:.1f} ms"
+    )
+
+    # Where the time went, summed over the indexed traces
+    totals: Dict[str, float] = defaultdict(float)
+    for spans in indexed.values():
+        for span in spans:
+            totals[span["name"]] += span["duration"] / 1_000_000
+    print("\nTime by span:")
+    for name, seconds in sorted(totals.items(), key=lambda item: -item[1]):
+        print(f"  {seconds / len(indexed) * 1000:9.1f} ms avg  {name}")
+
+    slowest = sorted(indexed.items(), key=lambda item: -searchable_latency(item[1]))
+    for trace_id, spans in slowest[:limit]:
+        print_trace(trace_id, spans)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Report created -> searchable latency from exported traces"
+    )
+    parser.add_argument(
+        "--path",
+        type=Path,
+        default=TRACE_JSON_PATH,
+        help=f"Span file of the json exporter (default: {TRACE_JSON_PATH})",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=5,
+        help="Slowest traces to show span by span (default: 5)",
+    )
+    args = parser.parse_args()
+    report(args.path, args.limit)
+
+
+if __name__ == "__main__":
+    main()
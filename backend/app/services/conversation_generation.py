@@ -1,74 +1,389 @@
+import asyncio
+import hashlib
+import logging
 import os
-from typing import List
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
 
+import numpy as np
 from jinja2 import Environment, FileSystemLoader
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 from pydantic import BaseModel
 
-from app.db.milvus_client import get_similar_conversations, milvus_client
+from app.metrics import RAG_STAGE_SECONDS, timed
+from app.resources import resources
+from app.services.hybrid_search import ahybrid_search, hybrid_search
+from app.services.prompt_assembly import AssembledPrompt, PromptAssembler
+from app.services.response_cache import RESPONSE_CACHE_ENABLED, response_cache
+from app.tracing import start_span
+from app.utils.embedding_cache import cache_key, embedding_cache, normalize_text
+from app.utils.embeddings import (
+    EMBEDDING_ENCODING_FORMAT,
+    EMBEDDING_MODEL,
+    count_tokens,
+    decode_embedding,
+)
+from app.utils.rate_limiter import chat_limiter, embedding_limiter
+from app.utils.single_flight import AsyncSingleFlight, SingleFlight
+
+logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-openai_client = OpenAI(
+# Initialize OpenAI clients. Requests go through the Helicone proxy unless
+# OPENAI_BASE_URL points elsewhere, e.g. at scripts/fake_openai.py. Calls are
+# retried by the rate limiters instead of the clients.
+openai_client_config = dict(
     api_key=os.getenv("OPENAI_API_KEY"),
-    base_url="https://oai.helicone.ai/v1",
+    max_retries=0,
+    base_url=os.getenv("OPENAI_BASE_URL", "https://oai.helicone.ai/v1"),
     default_headers={"Helicone-Auth": f"Bearer {os.getenv('HELICONE_API_KEY')}"},
 )
+openai_client = resources.register(
+    "openai_chat", lambda: OpenAI(**openai_client_config), close=OpenAI.close
+)
+async_openai_client = resources.register(
+    "async_openai_chat", lambda: AsyncOpenAI(**openai_client_config)
+)
+
+CHAT_MODEL = "gpt-4-turbo-preview"  # or your preferred model
+SYSTEM_PROMPT = "You are a mental health counseling assistant."
+TEMPERATURE = 0.7
+MAX_TOKENS = 1000
+# Number of similar conversations used as context
+CONTEXT_LIMIT = 3
 
 # Setup Jinja2 environment
 template_env = Environment(loader=FileSystemLoader("app/templates"))
 
 
+def _create_prompt_assembler() -> PromptAssembler:
+    return PromptAssembler(
+        model=CHAT_MODEL,
+        system_prompt=SYSTEM_PROMPT,
+        instructions=template_env.get_template(
+            "conversation_gen_rag_instructions.jinja"
+        ).render(),
+        template=template_env.get_template("conversation_gen_rag_prompt.jinja"),
+    )
+
+
+# Templates and tokenizer, loaded on first use or during warm-up
+prompt_assembler = resources.register("prompt_assembler", _create_prompt_assembler)
+
+# Identical requests in flight at the same time share one embedding and one
+# generation. Shared across service instances, which may be made per request.
+embedding_flight = SingleFlight()
+generation_flight = SingleFlight()
+aembedding_flight = AsyncSingleFlight()
+ageneration_flight = AsyncSingleFlight()
+
+
+@contextmanager
+def rag_stage(stage: str, model: str = "") -> Iterator[Dict[str, str]]:
+    """Time and trace a stage of a generation; cache_hit stays "false" unless set."""
+    with (
+        start_span(f"rag.{stage}", model=model) as span,
+        timed(RAG_STAGE_SECONDS, stage=stage, model=model, cache_hit="false") as labels,
+    ):
+        yield labels
+        span.set_tag("cache_hit", labels["cache_hit"])
+
+
+def generation_key(user_query: str) -> str:
+    digest = hashlib.sha256(normalize_text(user_query).encode("utf-8")).hexdigest()
+    return f"gen:{CHAT_MODEL}:{TEMPERATURE}:{digest}"
+
+
 class ConversationContext(BaseModel):
     question: str
     answer: str
+    id: Optional[int] = None
+    score: Optional[float] = None
+
+
+def _to_contexts(conversations: List[Dict[str, Any]]) -> List[ConversationContext]:
+    return [
+        ConversationContext(
+            question=conv["question"],
+            answer=conv["answer"],
+            id=conv.get("id"),
+            score=conv.get("distance"),
+        )
+        for conv in conversations
+    ]
 
 
-class ConversationRAGGenerationService:
-    def __init__(self):
-        self.template = template_env.get_template("conversation_gen_rag_prompt.jinja")
+class BaseRAGGenerationService:
+    """Prompt and response cache handling shared by the sync and async services.
 
-    def get_similar_conversations(
-        self, query: str, limit: int = 3
-    ) -> List[ConversationContext]:
-        """Retrieve similar conversations from Milvus"""
-        # Get embedding for the query
-        response = openai_client.embeddings.create(
-            input=query, model="text-embedding-ada-002"
+    Services hold no state of their own; clients and templates are shared
+    process-wide through the resource registry.
+    """
+
+    def _build_prompt(
+        self, user_query: str, similar_conversations: List[ConversationContext]
+    ) -> AssembledPrompt:
+        """Fit the similar conversations into the input token budget."""
+        with rag_stage("prompt", CHAT_MODEL):
+            return prompt_assembler.assemble(user_query, similar_conversations)
+
+    def _log_usage(self, prompt: AssembledPrompt, response):
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            logger.info(
+                f"Prompt used {usage.prompt_tokens} input tokens "
+                f"({prompt.prompt_tokens} counted locally), "
+                f"{usage.completion_tokens} output tokens"
+            )
+
+    def _cached_response(self, user_query: str) -> Optional[str]:
+        if not RESPONSE_CACHE_ENABLED:
+            return None
+        with rag_stage("response_cache", CHAT_MODEL) as labels:
+            cached = response_cache.get_exact(user_query, CHAT_MODEL, TEMPERATURE)
+            labels["cache_hit"] = str(cached is not None).lower()
+        return cached
+
+    def _semantically_cached_response(
+        self, query_embedding: np.ndarray
+    ) -> Optional[str]:
+        if not RESPONSE_CACHE_ENABLED:
+            return None
+        with rag_stage("semantic_cache", CHAT_MODEL) as labels:
+            cached = response_cache.get_semantic(
+                query_embedding, CHAT_MODEL, TEMPERATURE
+            )
+            labels["cache_hit"] = str(cached is not None).lower()
+        return cached
+
+    def _cache_response(
+        self,
+        user_query: str,
+        query_embedding: np.ndarray,
+        similar_conversations: List[ConversationContext],
+        answer: str,
+    ):
+        if not RESPONSE_CACHE_ENABLED:
+            return
+        response_cache.set(
+            user_query,
+            CHAT_MODEL,
+            TEMPERATURE,
+            query_embedding,
+            answer,
+            context_ids=[conv.id for conv in similar_conversations],
+            context_scores=[conv.score for conv in similar_conversations],
+            limit=CONTEXT_LIMIT,
+        )
+
+
+class ConversationRAGGenerationService(BaseRAGGenerationService):
+    def _create_embedding(self, text: str) -> np.ndarray:
+        response = embedding_limiter.call(
+            lambda: openai_client.embeddings.create(
+                input=text,
+                model=EMBEDDING_MODEL,
+                encoding_format=EMBEDDING_ENCODING_FORMAT,
+            ),
+            tokens=count_tokens(text),
         )
-        query_embedding = response.data[0].embedding
+        return decode_embedding(response.data[0].embedding)
+
+    def _embed_query(self, query: str) -> np.ndarray:
+        return embedding_flight.do(
+            cache_key(query, EMBEDDING_MODEL), lambda: self._embed_query_once(query)
+        )
+
+    def _embed_query_once(self, query: str) -> np.ndarray:
+        with rag_stage("embedding", EMBEDDING_MODEL) as labels:
+            labels["cache_hit"] = "true"
+
+            def create(text: str) -> np.ndarray:
+                labels["cache_hit"] = "false"
+                return self._create_embedding(text)
 
-        # Use abstracted Milvus client function
-        conversations = get_similar_conversations(query_embedding, limit)
-        return [
-            ConversationContext(question=conv["question"], answer=conv["answer"])
-            for conv in conversations
-        ]
+            # Repeated queries are served from the embedding cache
+            return embedding_cache.get_or_compute(query, EMBEDDING_MODEL, create)
+
+    def _search(
+        self, query: str, query_embedding: np.ndarray, limit: int
+    ) -> List[ConversationContext]:
+        with rag_stage("retrieval"):
+            return _to_contexts(hybrid_search(query, query_embedding, limit))
+
+    def get_similar_conversations(
+        self, query: str, limit: int = CONTEXT_LIMIT
+    ) -> List[ConversationContext]:
+        """Retrieve similar conversations by vector and keyword search"""
+        return self._search(query, self._embed_query(query), limit)
 
     def generate_response(self, user_query: str) -> str:
         """Generate a response using RAG"""
+        with rag_stage("total", CHAT_MODEL) as labels:
+            answer = self._cached_response(user_query)
+            cached = answer is not None
+            if not cached:
+                answer, cached = generation_flight.do(
+                    generation_key(user_query), lambda: self._generate(user_query)
+                )
+            labels["cache_hit"] = str(cached).lower()
+        return answer
+
+    def _generate(self, user_query: str) -> Tuple[str, bool]:
+        """The answer, and whether it came from the semantic cache."""
+        query_embedding = self._embed_query(user_query)
+        cached = self._semantically_cached_response(query_embedding)
+        if cached is not None:
+            return cached, True
+
         # Get similar conversations
-        similar_conversations = self.get_similar_conversations(user_query)
+        similar_conversations = self._search(user_query, query_embedding, CONTEXT_LIMIT)
+
+        # Call OpenAI
+        prompt = self._build_prompt(user_query, similar_conversations)
+        with rag_stage("completion", CHAT_MODEL):
+            response = chat_limiter.call(
+                lambda: openai_client.chat.completions.create(
+                    model=CHAT_MODEL,
+                    messages=prompt.messages,
+                    temperature=TEMPERATURE,
+                    max_tokens=MAX_TOKENS,
+                ),
+                tokens=prompt.prompt_tokens + MAX_TOKENS,
+            )
+        self._log_usage(prompt, response)
+
+        answer = response.choices[0].message.content
+        self._cache_response(user_query, query_embedding, similar_conversations, answer)
+        return answer, False
+
+
+class AsyncConversationRAGGenerationService(BaseRAGGenerationService):
+    """RAG service that never blocks the event loop.
 
-        # Prepare prompt using template
-        prompt = self.template.render(
-            user_query=user_query, similar_conversations=similar_conversations
+    OpenAI calls use the async client and the vector and keyword searches run
+    in worker threads, so a single process can keep many generations in flight.
+    """
+
+    async def _acreate_embedding(self, text: str) -> np.ndarray:
+        response = await embedding_limiter.acall(
+            lambda: async_openai_client.embeddings.create(
+                input=text,
+                model=EMBEDDING_MODEL,
+                encoding_format=EMBEDDING_ENCODING_FORMAT,
+            ),
+            tokens=count_tokens(text),
         )
+        return decode_embedding(response.data[0].embedding)
 
-        # Call OpenAI
-        response = openai_client.chat.completions.create(
-            model="gpt-4-turbo-preview",  # or your preferred model
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a mental health counseling assistant.",
-                },
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.7,
-            max_tokens=1000,
+    async def _embed_query(self, query: str) -> np.ndarray:
+        return await aembedding_flight.do(
+            cache_key(query, EMBEDDING_MODEL), lambda: self._embed_query_once(query)
+        )
+
+    async def _embed_query_once(self, query: str) -> np.ndarray:
+        with rag_stage("embedding", EMBEDDING_MODEL) as labels:
+            labels["cache_hit"] = "true"
+
+            async def create(text: str) -> np.ndarray:
+                labels["cache_hit"] = "false"
+                return await self._acreate_embedding(text)
+
+            return await embedding_cache.aget_or_compute(query, EMBEDDING_MODEL, create)
+
+    async def _search(
+        self, query: str, query_embedding: np.ndarray, limit: int
+    ) -> List[ConversationContext]:
+        with rag_stage("retrieval"):
+            return _to_contexts(await ahybrid_search(query, query_embedding, limit))
+
+    async def get_similar_conversations(
+        self, query: str, limit: int = CONTEXT_LIMIT
+    ) -> List[ConversationContext]:
+        """Retrieve similar conversations by vector and keyword search"""
+        return await self._search(query, await self._embed_query(query), limit)
+
+    async def generate_response(self, user_query: str) -> str:
+        """Generate a response using RAG"""
+        with rag_stage("total", CHAT_MODEL) as labels:
+            # The cache may poll the corpus change log in Redis
+            answer = await asyncio.to_thread(self._cached_response, user_query)
+            cached = answer is not None
+            if not cached:
+                answer, cached = await ageneration_flight.do(
+                    generation_key(user_query), lambda: self._generate(user_query)
+                )
+            labels["cache_hit"] = str(cached).lower()
+        return answer
+
+    async def _generate(self, user_query: str) -> Tuple[str, bool]:
+        """The answer, and whether it came from the semantic cache."""
+        query_embedding = await self._embed_query(user_query)
+        cached = await asyncio.to_thread(
+            self._semantically_cached_response, query_embedding
+        )
+        if cached is not None:
+            return cached, True
+
+        similar_conversations = await self._search(
+            user_query, query_embedding, CONTEXT_LIMIT
         )
 
-        return response.choices[0].message.content
+        prompt = self._build_prompt(user_query, similar_conversations)
+        with rag_stage("completion", CHAT_MODEL):
+            response = await chat_limiter.acall(
+                lambda: async_openai_client.chat.completions.create(
+                    model=CHAT_MODEL,
+                    messages=prompt.messages,
+                    temperature=TEMPERATURE,
+                    max_tokens=MAX_TOKENS,
+                ),
+                tokens=prompt.prompt_tokens + MAX_TOKENS,
+            )
+        self._log_usage(prompt, response)
+
+        answer = response.choices[0].message.content
+        self._cache_response(user_query, query_embedding, similar_conversations, answer)
+        return answer, False
+
+    async def stream_completion(
+        self, user_query: str, similar_conversations: List[ConversationContext]
+    ) -> AsyncIterator[str]:
+        """Yield completion tokens for already retrieved context as they arrive."""
+        prompt = self._build_prompt(user_query, similar_conversations)
+        # Timed without a span: a generator cannot hold the current span
+        # across the yields it hands to its consumer
+        with timed(
+            RAG_STAGE_SECONDS,
+            stage="stream_completion",
+            model=CHAT_MODEL,
+            cache_hit="false",
+        ):
+            stream = await chat_limiter.acall(
+                lambda: async_openai_client.chat.completions.create(
+                    model=CHAT_MODEL,
+                    messages=prompt.messages,
+                    temperature=TEMPERATURE,
+                    max_tokens=MAX_TOKENS,
+                    stream=True,
+                ),
+                tokens=prompt.prompt_tokens + MAX_TOKENS,
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+    async def stream_response(self, user_query: str) -> AsyncIterator[str]:
+        """Generate a response using RAG, yielding tokens as they arrive"""
+        similar_conversations = await self.get_similar_conversations(user_query)
+        async for token in self.stream_completion(user_query, similar_conversations):
+            yield token
+
+
+@lru_cache(maxsize=1)
+def get_rag_service() -> AsyncConversationRAGGenerationService:
+    """The process-wide RAG service, for use as a FastAPI dependency."""
+    return AsyncConversationRAGGenerationService()
 
 
 if __name__ == "__main__":
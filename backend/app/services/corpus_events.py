@@ -0,0 +1,154 @@
+import logging
+import os
+import threading
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from pydantic import BaseModel, ConfigDict, field_validator
+
+from app.db.redis_client import get_redis_client
+
+# Load environment variables
+load_dotenv(".env.local")
+
+logger = logging.getLogger(__name__)
+
+# "redis" shares changes between the API and worker processes, "memory" only
+# sees changes made in the current process. The response cache and keyword
+# index of the API learn about the worker's indexing from this log, so
+# "memory" is only right when nothing else writes to the corpus.
+CORPUS_EVENTS_BACKEND = os.getenv("CORPUS_EVENTS_BACKEND", "redis")
+CORPUS_EVENTS_STREAM = "corpus:changes"
+CORPUS_EVENTS_MAX_LEN = int(os.getenv("CORPUS_EVENTS_MAX_LEN", "10000"))
+
+
+class CorpusChange(BaseModel):
+    """A conversation that was (re)indexed or removed from the vector index."""
+
+    conversation_id: int
+    deleted: bool = False
+    embedding: Optional[np.ndarray] = None
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    @field_validator("embedding", mode="before")
+    @classmethod
+    def _to_array(cls, value):
+        return None if value is None else np.asarray(value, dtype=np.float32)
+
+
+class InMemoryCorpusEvents:
+    """Bounded in-process change log."""
+
+    def __init__(self, max_len: int = CORPUS_EVENTS_MAX_LEN):
+        self.max_len = max_len
+        self._events: List[Tuple[int, CorpusChange]] = []
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def publish(self, change: CorpusChange):
+        with self._lock:
+            self._seq += 1
+            self._events.append((self._seq, change))
+            del self._events[: -self.max_len]
+
+    def read_since(
+        self, cursor: Optional[str]
+    ) -> Tuple[Optional[List[CorpusChange]], str]:
+        """Return changes after cursor and the new cursor.
+
+        Changes are None when events after cursor were already trimmed, in
+        which case the reader has to assume anything may have changed.
+        """
+        with self._lock:
+            if cursor is None:
+                return [], str(self._seq)
+            after = int(cursor)
+            if self._events and self._events[0][0] > after + 1:
+                return None, str(self._seq)
+            return [c for seq, c in self._events if seq > after], str(self._seq)
+
+
+def _stream_id(value) -> Tuple[int, int]:
+    if isinstance(value, bytes):
+        value = value.decode()
+    ms, _, seq = value.partition("-")
+    return int(ms), int(seq or 0)
+
+
+class RedisCorpusEvents:
+    """Change log in a capped Redis stream, shared by all processes."""
+
+    def __init__(self, max_len: int = CORPUS_EVENTS_MAX_LEN):
+        self.max_len = max_len
+        self.redis = get_redis_client()
+
+    def publish(self, change: CorpusChange):
+        fields = {
+            "conversation_id": change.conversation_id,
+            "deleted": int(change.deleted),
+        }
+        if change.embedding is not None:
+            fields["embedding"] = change.embedding.tobytes()
+        self.redis.xadd(
+            CORPUS_EVENTS_STREAM, fields, maxlen=self.max_len, approximate=True
+        )
+
+    def read_since(
+        self, cursor: Optional[str]
+    ) -> Tuple[Optional[List[CorpusChange]], str]:
+        """See InMemoryCorpusEvents.read_since."""
+        if cursor is None:
+            last = self.redis.xrevrange(CORPUS_EVENTS_STREAM, count=1)
+            return [], last[0][0].decode() if last else "0-0"
+
+        first = self.redis.xrange(CORPUS_EVENTS_STREAM, count=1)
+        entries = self.redis.xrange(CORPUS_EVENTS_STREAM, min=f"({cursor}")
+        new_cursor = entries[-1][0].decode() if entries else cursor
+        if first and cursor != "0-0" and _stream_id(first[0][0]) > _stream_id(cursor):
+            # The entry at cursor was trimmed, so changes may have been lost
+            return None, new_cursor
+
+        changes = []
+        for _, fields in entries:
+            embedding = fields.get(b"embedding")
+            changes.append(
+                CorpusChange(
+                    conversation_id=int(fields[b"conversation_id"]),
+                    deleted=bool(int(fields[b"deleted"])),
+                    embedding=(
+                        np.frombuffer(embedding, dtype=np.float32)
+                        if embedding
+                        else None
+                    ),
+                )
+            )
+        return changes, new_cursor
+
+
+if CORPUS_EVENTS_BACKEND == "redis":
+    corpus_events = RedisCorpusEvents()
+else:
+    logger.warning(
+        "CORPUS_EVENTS_BACKEND=memory: the response cache and keyword index will "
+        "not see conversations indexed by the Celery worker"
+    )
+    corpus_events = InMemoryCorpusEvents()
+
+
+def publish_corpus_change(
+    conversation_id: int, embedding: Optional[Sequence[float]] = None, deleted=False
+):
+    """Record that retrieval results involving a conversation may have changed.
+
+    Never raises: a lost event only means caches rely on their TTL instead.
+    """
+    try:
+        corpus_events.publish(
+            CorpusChange(
+                conversation_id=conversation_id, deleted=deleted, embedding=embedding
+            )
+        )
+    except Exception:
+        logger.exception(f"Could not publish corpus change for {conversation_id}")
@@ -0,0 +1,87 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Sequence
+
+from dotenv import load_dotenv
+
+from app.db.vector_store import aget_similar_conversations, get_similar_conversations
+from app.metrics import RAG_STAGE_SECONDS, timed
+from app.services.keyword_index import keyword_index
+
+# Load environment variables
+load_dotenv(".env.local")
+
+# Combine vector search with BM25 keyword search
+HYBRID_SEARCH_ENABLED = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() == "true"
+# Candidates taken from each retriever before fusion
+HYBRID_SEARCH_CANDIDATES = int(os.getenv("HYBRID_SEARCH_CANDIDATES", "10"))
+# Damping constant of reciprocal rank fusion, 60 is the usual choice
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="keyword-search")
+
+
+def reciprocal_rank_fusion(
+    ranked_lists: Sequence[List[Dict[str, Any]]], limit: int, k: int = RRF_K
+) -> List[Dict[str, Any]]:
+    """Merge ranked result lists by summing 1 / (k + rank) per conversation.
+
+    A conversation keeps its vector "distance" when the vector search found
+    it, and gets None otherwise.
+    """
+    scores: Dict[int, float] = {}
+    merged: Dict[int, Dict[str, Any]] = {}
+    for results in ranked_lists:
+        for rank, result in enumerate(results, start=1):
+            conversation_id = result["id"]
+            scores[conversation_id] = scores.get(conversation_id, 0.0) + 1 / (k + rank)
+            entry = merged.setdefault(
+                conversation_id,
+                {
+                    "question": result["question"],
+                    "answer": result["answer"],
+                    "id": conversation_id,
+                    "distance": None,
+                },
+            )
+            if result.get("distance") is not None:
+                entry["distance"] = result["distance"]
+
+    ranked = sorted(scores, key=lambda i: scores[i], reverse=True)[:limit]
+    return [{**merged[i], "rrf_score": scores[i]} for i in ranked]
+
+
+def _keyword_search(query: str, limit: int) -> List[Dict[str, Any]]:
+    with timed(RAG_STAGE_SECONDS, stage="keyword_search", model="", cache_hit="false"):
+        return keyword_index.search(query, limit)
+
+
+def hybrid_search(
+    query: str, query_embedding: List[float], limit: int
+) -> List[Dict[str, Any]]:
+    """Vector and keyword search run in parallel, fused with RRF."""
+    if not HYBRID_SEARCH_ENABLED:
+        return get_similar_conversations(query_embedding, limit)
+
+    candidates = max(limit, HYBRID_SEARCH_CANDIDATES)
+    keyword_results = _executor.submit(_keyword_search, query, candidates)
+    vector_results = get_similar_conversations(query_embedding, candidates)
+    return reciprocal_rank_fusion([vector_results, keyword_results.result()], limit)
+
+
+async def ahybrid_search(
+    query: str, query_embedding: List[float], limit: int
+) -> List[Dict[str, Any]]:
+    """Async variant of hybrid_search."""
+    if not HYBRID_SEARCH_ENABLED:
+        return await aget_similar_conversations(query_embedding, limit)
+
+    candidates = max(limit, HYBRID_SEARCH_CANDIDATES)
+    vector_results, keyword_results = await asyncio.gather(
+        aget_similar_conversations(query_embedding, candidates),
+        asyncio.get_running_loop().run_in_executor(
+            _executor, _keyword_search, query, candidates
+        ),
+    )
+    return reciprocal_rank_fusion([vector_results, keyword_results], limit)
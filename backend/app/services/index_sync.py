@@ -0,0 +1,266 @@
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from app.crud.mental_health_conversation import (
+    get_conversations_changed_since,
+    mark_indexed,
+)
+from app.db.database import SessionLocal
+from app.db.vector_store import vector_store
+from app.models.index_sync import ConversationTombstone, IndexSyncState
+from app.models.mental_health_conversation import MentalHealthConversation
+from app.services.corpus_events import publish_corpus_change
+from app.tracing import start_span
+from app.utils.embedding_cache import content_hash
+from app.utils.embeddings import get_combined_embeddings
+
+# Load environment variables
+load_dotenv(".env.local")
+
+logger = logging.getLogger(__name__)
+
+# Rows read, embedded and upserted per round
+INDEX_SYNC_BATCH_SIZE = int(os.getenv("INDEX_SYNC_BATCH_SIZE", "500"))
+# Changes this far behind the watermark are read again, to cover clock
+# differences and transactions that committed after newer rows were synced.
+# Rows already in the index are skipped by their hash, so this is cheap.
+INDEX_SYNC_OVERLAP = timedelta(seconds=float(os.getenv("INDEX_SYNC_OVERLAP", "300")))
+# Tombstones are kept this long after the sync has passed them
+TOMBSTONE_RETENTION = timedelta(days=float(os.getenv("TOMBSTONE_RETENTION_DAYS", "7")))
+
+# indexed_hash of a row whose text the embedding API rejected, followed by the
+# start of its content hash. The row is skipped until its text changes.
+REJECTED_PREFIX = "rejected:"
+
+# Batches up to this size list their conversation ids on the index_rows span,
+# larger ones only their count
+SPAN_MAX_IDS = int(os.getenv("TRACE_SPAN_MAX_IDS", "20"))
+
+SYNC_NAME = "vector_index"
+# Watermark of a first sync, reading the whole table
+EPOCH = datetime(1970, 1, 1)
+
+
+class IndexingRateLimited(Exception):
+    """OpenAI kept rate limiting the embeddings of some conversations.
+
+    conversation_ids are the ids of the batch to try again, including any whose
+    embedding failed for another passing reason. indexed holds the ids of the
+    same batch that are in the index all the same.
+    """
+
+    def __init__(
+        self,
+        conversation_ids: List[int],
+        retry_after: float,
+        indexed: Optional[List[int]] = None,
+    ):
+        super().__init__(
+            f"Embeddings of {len(conversation_ids)} conversations were rate limited"
+        )
+        self.conversation_ids = conversation_ids
+        self.retry_after = retry_after
+        self.indexed = indexed or []
+
+
+def rejected_hash(digest: str) -> str:
+    return REJECTED_PREFIX + digest[: 64 - len(REJECTED_PREFIX)]
+
+
+def index_rows(
+    db: Session, conversations: List[MentalHealthConversation]
+) -> Tuple[List[int], List[int], List[int], List[int]]:
+    """Embed and upsert the conversations whose text changed since they were indexed.
+
+    Returns the ids written, the ids skipped because the index already has
+    their text, the ids whose embedding failed and may succeed later, and the
+    ids whose text the embedding API rejected. Rejected rows are marked and
+    skipped until their text changes. Raises IndexingRateLimited, after
+    writing the others, when OpenAI kept rate limiting some of them.
+    """
+    tags = {"conversations": len(conversations)}
+    if len(conversations) <= SPAN_MAX_IDS:
+        tags["conversation_ids"] = [c.id for c in conversations]
+    with start_span("index_rows", **tags) as span:
+        indexed, unchanged, failed, rejected = _index_rows(db, conversations)
+        span.set_tag("indexed", len(indexed))
+        span.set_tag("failed", len(failed))
+        span.set_tag("rejected", len(rejected))
+    return indexed, unchanged, failed, rejected
+
+
+def _index_rows(
+    db: Session, conversations: List[MentalHealthConversation]
+) -> Tuple[List[int], List[int], List[int], List[int]]:
+    hashes = {
+        c.id: c.content_hash or content_hash(c.question, c.answer)
+        for c in conversations
+    }
+    changed, unchanged, rejected = [], [], []
+    for c in conversations:
+        if c.indexed_hash == hashes[c.id]:
+            unchanged.append(c.id)
+        elif c.indexed_hash == rejected_hash(hashes[c.id]):
+            rejected.append(c.id)
+        else:
+            changed.append(c)
+
+    with start_span("embed", conversations=len(changed)):
+        results = get_combined_embeddings([(c.question, c.answer) for c in changed])
+    data = []
+    failed = []
+    marks = {}
+    rate_limited = [r.retry_after for r in results if r.retry_after is not None]
+    for conversation, result in zip(changed, results):
+        if result.retry_after is not None:
+            failed.append(conversation.id)
+            continue
+        if result.permanent:
+            logger.error(
+                f"Embedding API rejected conversation {conversation.id}, skipping "
+                f"it until its text changes: {result.error}"
+            )
+            rejected.append(conversation.id)
+            marks[conversation.id] = rejected_hash(hashes[conversation.id])
+            continue
+        if not result.ok:
+            logger.error(
+                f"Could not embed conversation {conversation.id}: {result.error}"
+            )
+            failed.append(conversation.id)
+            continue
+        data.append(
+            {
+                "id": conversation.id,
+                "question": conversation.question,
+                "answer": conversation.answer,
+                "embedding": result.embedding,
+            }
+        )
+
+    if data:
+        # Upsert so re-indexing a conversation never leaves duplicates
+        with start_span("vector_store.upsert", rows=len(data)):
+            result = vector_store.upsert(data)
+        logger.info(f"Vector store upsert result: {result}")
+        for row in data:
+            publish_corpus_change(row["id"], row["embedding"])
+        marks.update({row["id"]: hashes[row["id"]] for row in data})
+    mark_indexed(db, marks)
+
+    if rate_limited:
+        raise IndexingRateLimited(
+            failed,
+            max(rate_limited),
+            indexed=[row["id"] for row in data] + unchanged,
+        )
+    return [row["id"] for row in data], unchanged, failed, rejected
+
+
+def delete_rows(conversation_ids: List[int]):
+    """Remove conversations from the vector index; ids not in it are ignored."""
+    vector_store.delete(conversation_ids)
+    for conversation_id in conversation_ids:
+        publish_corpus_change(conversation_id, deleted=True)
+
+
+def _sync_tombstones(db: Session, since: datetime, batch_size: int):
+    """Remove conversations deleted since since, returns (count, last deleted_at)."""
+    rows = (
+        db.query(
+            ConversationTombstone.conversation_id, ConversationTombstone.deleted_at
+        )
+        .filter(ConversationTombstone.deleted_at >= since)
+        .order_by(ConversationTombstone.deleted_at)
+        .all()
+    )
+    for start in range(0, len(rows), batch_size):
+        delete_rows([row.conversation_id for row in rows[start : start + batch_size]])
+    return len(rows), rows[-1].deleted_at if rows else None
+
+
+def sync_index(batch_size: int = INDEX_SYNC_BATCH_SIZE) -> Dict[str, int]:
+    """Bring the vector index up to date with MySQL.
+
+    Reads conversations changed since the stored watermark through the
+    updated_at index, re-embeds only those whose content hash differs from
+    the one last indexed, and removes conversations with a tombstone. The
+    watermark never moves past a row whose embedding failed for a passing
+    reason, so it is retried on the next run; rows whose text the API rejected
+    are marked instead and do not hold it back. When OpenAI rate limits the
+    embeddings, the sync stops reading changes and leaves the rest to the
+    next run.
+    """
+    stats = {
+        "scanned": 0,
+        "indexed": 0,
+        "unchanged": 0,
+        "failed": 0,
+        "rejected": 0,
+        "deleted": 0,
+    }
+
+    with SessionLocal() as db:
+        state = db.get(IndexSyncState, SYNC_NAME)
+        watermark = state.watermark if state else EPOCH
+        since = max(watermark - INDEX_SYNC_OVERLAP, EPOCH)
+        newest = watermark
+        retry_from: Optional[datetime] = None
+
+        after = None
+        while True:
+            page = get_conversations_changed_since(db, since, after, batch_size)
+            if not page:
+                break
+            updated_at = {c.id: c.updated_at for c in page}
+            after = (page[-1].updated_at, page[-1].id)
+            newest = max(newest, after[0])
+
+            rate_limited = False
+            try:
+                indexed, unchanged, failed, rejected = index_rows(db, page)
+            except IndexingRateLimited as e:
+                logger.warning(f"Stopping index sync: {e}")
+                # The rest of the page is in the index all the same
+                indexed, unchanged = e.indexed, []
+                failed, rejected = e.conversation_ids, []
+                rate_limited = True
+            stats["scanned"] += len(page)
+            stats["indexed"] += len(indexed)
+            stats["unchanged"] += len(unchanged)
+            stats["failed"] += len(failed)
+            stats["rejected"] += len(rejected)
+            if failed and retry_from is None:
+                # Pages are in updated_at order, the first failure is the oldest
+                retry_from = min(updated_at[i] for i in failed)
+            if rate_limited or len(page) < batch_size:
+                break
+
+        stats["deleted"], last_deleted_at = _sync_tombstones(db, since, batch_size)
+        if last_deleted_at is not None:
+            newest = max(newest, last_deleted_at)
+
+        new_watermark = min(newest, retry_from) if retry_from else newest
+        db.merge(IndexSyncState(name=SYNC_NAME, watermark=new_watermark))
+        db.query(ConversationTombstone).filter(
+            ConversationTombstone.deleted_at < new_watermark - TOMBSTONE_RETENTION
+        ).delete(synchronize_session=False)
+        db.commit()
+
+    logger.info(
+        f"Synced vector index up to {new_watermark}: {stats['scanned']} changed "
+        f"rows, {stats['indexed']} re-embedded, {stats['unchanged']} unchanged, "
+        f"{stats['failed']} failed, {stats['rejected']} rejected, "
+        f"{stats['deleted']} deleted"
+    )
+    return stats
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(sync_index())
@@ -0,0 +1,253 @@
+import heapq
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from app.crud.mental_health_conversation import get_conversations_after
+from app.db.database import SessionLocal
+from app.models.mental_health_conversation import MentalHealthConversation
+from app.services.corpus_events import corpus_events
+
+# Load environment variables
+load_dotenv(".env.local")
+
+logger = logging.getLogger(__name__)
+
+# BM25 parameters
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# How often to poll the corpus change log, in seconds
+KEYWORD_INDEX_SYNC_INTERVAL = float(os.getenv("KEYWORD_INDEX_SYNC_INTERVAL", "1.0"))
+# Wait before retrying a failed load, in seconds
+KEYWORD_INDEX_RETRY_INTERVAL = float(os.getenv("KEYWORD_INDEX_RETRY_INTERVAL", "60"))
+KEYWORD_INDEX_LOAD_BATCH_SIZE = 1000
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+# Words frequent enough in counseling text to carry no ranking signal
+STOP_WORDS = frozenset("""
+    a about am an and are as at be been but by can could did do does doing
+    for from had has have having he her him his how i i'm if in into is it
+    it's its just me my myself no not of on or our so some such than that
+    the their them then there these they this those to too very was we were
+    what when where which while who why will with would you your
+    """.split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stop words."""
+    return [
+        token
+        for token in _TOKEN_PATTERN.findall(text.lower())
+        if token not in STOP_WORDS
+    ]
+
+
+class BM25Index:
+    """Okapi BM25 over question and answer text, updatable in place."""
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self._doc_lengths: Dict[int, int] = {}
+        self._docs: Dict[int, Tuple[str, str]] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, conversation_id: int, question: str, answer: str):
+        self.remove(conversation_id)
+        term_counts = Counter(tokenize(question) + tokenize(answer))
+        for term, count in term_counts.items():
+            self._postings[term][conversation_id] = count
+        length = sum(term_counts.values())
+        self._doc_lengths[conversation_id] = length
+        self._total_length += length
+        self._docs[conversation_id] = (question, answer)
+
+    def remove(self, conversation_id: int):
+        doc = self._docs.pop(conversation_id, None)
+        if doc is None:
+            return
+        for term in set(tokenize(doc[0]) + tokenize(doc[1])):
+            postings = self._postings[term]
+            postings.pop(conversation_id, None)
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._doc_lengths.pop(conversation_id)
+
+    def search(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        """Top-limit conversations by BM25 score, best first."""
+        if not self._docs:
+            return []
+        doc_count = len(self._docs)
+        average_length = self._total_length / doc_count or 1.0
+
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(
+                1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5)
+            )
+            for conversation_id, count in postings.items():
+                norm = (
+                    1
+                    - self.b
+                    + self.b * (self._doc_lengths[conversation_id] / average_length)
+                )
+                scores[conversation_id] += (
+                    idf * count * (self.k1 + 1) / (count + self.k1 * norm)
+                )
+
+        top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [
+            {
+                "question": self._docs[conversation_id][0],
+                "answer": self._docs[conversation_id][1],
+                "id": conversation_id,
+                "keyword_score": score,
+            }
+            for conversation_id, score in top
+        ]
+
+
+def _load_all_conversations() -> Iterable[Tuple[int, str, str]]:
+    after_id = 0
+    with SessionLocal() as db:
+        while True:
+            page = get_conversations_after(db, after_id, KEYWORD_INDEX_LOAD_BATCH_SIZE)
+            for conversation in page:
+                yield conversation.id, conversation.question, conversation.answer
+            if len(page) < KEYWORD_INDEX_LOAD_BATCH_SIZE:
+                return
+            after_id = page[-1].id
+
+
+def _load_conversations(ids: List[int]) -> List[Tuple[int, str, str]]:
+    with SessionLocal() as db:
+        return [
+            (c.id, c.question, c.answer)
+            for c in db.query(MentalHealthConversation)
+            .filter(MentalHealthConversation.id.in_(ids))
+            .all()
+        ]
+
+
+class KeywordIndex:
+    """BM25 index of the whole corpus, kept current from the corpus change log.
+
+    The index is built from MySQL in a background thread on first use and
+    answers with no results until it is ready, so retrieval degrades to vector
+    search instead of waiting.
+    """
+
+    def __init__(
+        self,
+        events=corpus_events,
+        sync_interval: float = KEYWORD_INDEX_SYNC_INTERVAL,
+        load_all=_load_all_conversations,
+        load_many=_load_conversations,
+    ):
+        self.events = events
+        self.sync_interval = sync_interval
+        self.load_all = load_all
+        self.load_many = load_many
+        self._index = BM25Index()
+        self._lock = threading.Lock()
+        self._cursor: Optional[str] = None
+        self._ready = False
+        self._loading = False
+        self._failed_at: Optional[float] = None
+        self._synced_at = 0.0
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    def start_loading(self):
+        """Build the index in a background thread unless already built or building."""
+        with self._lock:
+            if self._ready or self._loading:
+                return
+            if (
+                self._failed_at is not None
+                and time.monotonic() - self._failed_at < KEYWORD_INDEX_RETRY_INTERVAL
+            ):
+                return
+            self._loading = True
+        threading.Thread(
+            target=self.load, name="keyword-index-load", daemon=True
+        ).start()
+
+    def load(self):
+        """Build the index from the database, replacing the current one."""
+        try:
+            # Take the cursor first so changes made during the load are replayed
+            _, cursor = self.events.read_since(None)
+            index = BM25Index(self._index.k1, self._index.b)
+            started = time.monotonic()
+            for conversation_id, question, answer in self.load_all():
+                index.add(conversation_id, question, answer)
+            with self._lock:
+                self._index = index
+                self._cursor = cursor
+                self._ready = True
+                self._failed_at = None
+            logger.info(
+                f"Built keyword index of {len(index)} conversations "
+                f"in {time.monotonic() - started:.1f}s"
+            )
+        except Exception:
+            logger.exception("Could not build keyword index")
+            self._failed_at = time.monotonic()
+        finally:
+            self._loading = False
+
+    def _sync(self):
+        """Apply corpus changes published since the last poll."""
+        now = time.monotonic()
+        if now - self._synced_at < self.sync_interval:
+            return
+        self._synced_at = now
+
+        try:
+            changes, cursor = self.events.read_since(self._cursor)
+            if changes is None:
+                logger.warning("Corpus change log has a gap, rebuilding keyword index")
+                self._ready = False
+                self.start_loading()
+                return
+            changed = {change.conversation_id for change in changes}
+            rows = self.load_many(sorted(changed)) if changed else []
+        except Exception:
+            logger.exception("Could not sync keyword index")
+            return
+
+        with self._lock:
+            for conversation_id in changed:
+                self._index.remove(conversation_id)
+            for conversation_id, question, answer in rows:
+                self._index.add(conversation_id, question, answer)
+            self._cursor = cursor
+
+    def search(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        if not self._ready:
+            self.start_loading()
+            return []
+        self._sync()
+        with self._lock:
+            return self._index.search(query, limit)
+
+
+keyword_index = KeywordIndex()
@@ -0,0 +1,183 @@
+import logging
+import os
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence
+
+import tiktoken
+from dotenv import load_dotenv
+from jinja2 import Template
+from pydantic import BaseModel
+
+# Load environment variables
+load_dotenv(".env.local")
+
+logger = logging.getLogger(__name__)
+
+# Most tokens a rendered prompt (system and user message) may use
+PROMPT_INPUT_TOKEN_BUDGET = int(os.getenv("PROMPT_INPUT_TOKEN_BUDGET", "3000"))
+# A case that would have to be cut below this many tokens is dropped instead
+PROMPT_MIN_CASE_TOKENS = int(os.getenv("PROMPT_MIN_CASE_TOKENS", "100"))
+# Tokens the chat format adds per message, and to prime the reply
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMING_TOKENS = 3
+
+
+class PromptCase(BaseModel):
+    """A retrieved case as it is rendered into the prompt."""
+
+    question: str
+    answer: str
+    truncated: bool = False
+
+
+class AssembledPrompt(BaseModel):
+    messages: List[Dict[str, str]]
+    # Input tokens of messages as counted locally
+    prompt_tokens: int
+    budget: int
+    cases_used: int = 0
+    cases_truncated: int = 0
+    cases_dropped: int = 0
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        logger.warning("Could not load tokenizer, falling back to token estimates")
+        return None
+
+
+class PromptAssembler:
+    """Fits retrieved cases into a token budget for the chat prompt.
+
+    The system message holds the system prompt and the instructions, which are
+    the same for every request, so they form a stable prefix. The user message
+    holds the cases, best ranked first, and then the query. Cases are added in
+    rank order while they fit; the first one that does not is truncated, or
+    dropped if too little room is left for it, and all after it are dropped.
+    A query that alone does not fit is truncated.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        system_prompt: str,
+        instructions: str,
+        template: Template,
+        budget: int = PROMPT_INPUT_TOKEN_BUDGET,
+        min_case_tokens: int = PROMPT_MIN_CASE_TOKENS,
+    ):
+        self.encoding = _get_encoding(model)
+        self.system_message = f"{system_prompt}\n\n{instructions}"
+        self.template = template
+        self.budget = budget
+        self.min_case_tokens = min_case_tokens
+
+    def count_tokens(self, text: str) -> int:
+        if self.encoding is None:
+            # Roughly 4 characters per token for English; stay on the safe side
+            return len(text) // 3 + 1
+        return len(self.encoding.encode(text))
+
+    def _truncate_text(self, text: str, max_tokens: int) -> str:
+        if self.encoding is None:
+            return text[: max_tokens * 3]
+        return self.encoding.decode(self.encoding.encode(text)[:max_tokens])
+
+    def _messages(
+        self, user_query: str, cases: List[PromptCase]
+    ) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": self.system_message},
+            {
+                "role": "user",
+                "content": self.template.render(
+                    user_query=user_query, similar_conversations=cases
+                ),
+            },
+        ]
+
+    def _tokens(self, user_query: str, cases: List[PromptCase]) -> int:
+        messages = self._messages(user_query, cases)
+        return REPLY_PRIMING_TOKENS + sum(
+            self.count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+            for message in messages
+        )
+
+    def _fit(
+        self, user_query: str, cases: List[PromptCase], case: PromptCase
+    ) -> Optional[PromptCase]:
+        """case with its answer cut to the room left in the budget, or None."""
+        empty = case.model_copy(update={"answer": "", "truncated": True})
+        room = self.budget - self._tokens(user_query, cases + [empty])
+        if room < self.min_case_tokens:
+            return None
+        answer = self._truncate_text(case.answer, room)
+        fitted = empty.model_copy(update={"answer": answer})
+        # Tokens can merge differently at the cut, so check and shave off any excess
+        excess = self._tokens(user_query, cases + [fitted]) - self.budget
+        while excess > 0 and fitted.answer:
+            room -= excess
+            fitted.answer = self._truncate_text(case.answer, room)
+            excess = self._tokens(user_query, cases + [fitted]) - self.budget
+        return fitted
+
+    def _fit_query(self, user_query: str) -> str:
+        """user_query, cut so that the prompt without cases fits the budget."""
+        excess = self._tokens(user_query, []) - self.budget
+        if excess <= 0:
+            return user_query
+        logger.warning(
+            f"Query exceeds the prompt budget of {self.budget} tokens by "
+            f"{excess}, truncating it"
+        )
+        room = self.count_tokens(user_query)
+        while excess > 0 and user_query:
+            room = max(room - excess, 0)
+            user_query = self._truncate_text(user_query, room)
+            excess = self._tokens(user_query, []) - self.budget
+        return user_query
+
+    def assemble(
+        self, user_query: str, conversations: Sequence[Any]
+    ) -> AssembledPrompt:
+        """Build the chat messages for a query and its retrieved conversations.
+
+        conversations need question and answer attributes and must be ordered
+        best first.
+        """
+        user_query = self._fit_query(user_query)
+        cases: List[PromptCase] = []
+        truncated = 0
+        for conversation in conversations:
+            case = PromptCase(
+                question=conversation.question, answer=conversation.answer
+            )
+            if self._tokens(user_query, cases + [case]) <= self.budget:
+                cases.append(case)
+                continue
+            # The budget is used up: cut this case if enough room is left,
+            # and leave out every lower-ranked one even if it would fit
+            fitted = self._fit(user_query, cases, case)
+            if fitted is not None:
+                cases.append(fitted)
+                truncated = 1
+            break
+        dropped = len(conversations) - len(cases)
+
+        prompt = AssembledPrompt(
+            messages=self._messages(user_query, cases),
+            prompt_tokens=self._tokens(user_query, cases),
+            budget=self.budget,
+            cases_used=len(cases),
+            cases_truncated=truncated,
+            cases_dropped=dropped,
+        )
+        logger.info(
+            f"Assembled prompt of {prompt.prompt_tokens}/{self.budget} tokens "
+            f"with {prompt.cases_used} cases ({truncated} truncated, "
+            f"{dropped} dropped)"
+        )
+        return prompt
@@ -0,0 +1,268 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from dotenv import load_dotenv
+
+from app.services.corpus_events import CorpusChange, corpus_events
+from app.utils.embedding_cache import normalize_text
+
+# Load environment variables
+load_dotenv(".env.local")
+
+logger = logging.getLogger(__name__)
+
+# Cache configuration
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+# Minimum cosine similarity for a semantic hit
+RESPONSE_CACHE_SEMANTIC_THRESHOLD = float(
+    os.getenv("RESPONSE_CACHE_SEMANTIC_THRESHOLD", "0.97")
+)
+# How often to poll the corpus change log, in seconds
+RESPONSE_CACHE_SYNC_INTERVAL = float(os.getenv("RESPONSE_CACHE_SYNC_INTERVAL", "0.5"))
+
+
+def _unit(vector: Sequence[float]) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class _Entry:
+    __slots__ = (
+        "answer",
+        "scope",
+        "query_embedding",
+        "context_ids",
+        "min_score",
+        "expires_at",
+    )
+
+    def __init__(self, answer, scope, query_embedding, context_ids, min_score, ttl):
+        self.answer = answer
+        self.scope = scope
+        self.query_embedding = query_embedding
+        self.context_ids = context_ids
+        self.min_score = min_score
+        self.expires_at = time.monotonic() + ttl if ttl else None
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and self.expires_at <= time.monotonic()
+
+
+class ResponseCache:
+    """Two-tier cache of generated RAG answers.
+
+    The exact tier matches on a hash of the normalized query, model and
+    temperature. The semantic tier matches a query whose embedding is within
+    the cosine threshold of a cached one, for the same model and temperature.
+
+    Entries are dropped when the corpus changes in a way that could alter their
+    retrieval: one of their retrieved conversations changed or was deleted, or
+    a new or updated conversation scores at least as high against the cached
+    query as the weakest conversation that was retrieved for it.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        ttl: int = RESPONSE_CACHE_TTL,
+        semantic_threshold: float = RESPONSE_CACHE_SEMANTIC_THRESHOLD,
+        events=corpus_events,
+        sync_interval: float = RESPONSE_CACHE_SYNC_INTERVAL,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.semantic_threshold = semantic_threshold
+        self.events = events
+        self.sync_interval = sync_interval
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[str] = []
+        self._cursor: Optional[str] = None
+        self._synced_at = 0.0
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _scope(model: str, temperature: float) -> str:
+        return f"{model}:{temperature}"
+
+    def _key(self, query: str, model: str, temperature: float) -> str:
+        digest = hashlib.sha256(normalize_text(query).encode("utf-8")).hexdigest()
+        return f"{self._scope(model, temperature)}:{digest}"
+
+    def _remove(self, key: str):
+        if self._entries.pop(key, None) is not None:
+            self._matrix = None
+            self.invalidations += 1
+
+    def _semantic_index(self):
+        if self._matrix is None:
+            self._matrix_keys = list(self._entries)
+            self._matrix = (
+                np.stack([self._entries[k].query_embedding for k in self._matrix_keys])
+                if self._matrix_keys
+                else np.empty((0, 0), dtype=np.float32)
+            )
+        return self._matrix, self._matrix_keys
+
+    def _sync(self):
+        """Apply corpus changes published since the last poll.
+
+        The change log is read without holding the cache lock, so lookups in
+        other threads are not held up by a slow Redis.
+        """
+        now = time.monotonic()
+        if now - self._synced_at < self.sync_interval:
+            return
+        # One poll at a time, the other threads use the entries as they are
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            self._synced_at = now
+            try:
+                changes, cursor = self.events.read_since(self._cursor)
+            except Exception:
+                logger.exception("Could not read corpus changes")
+                return
+
+            with self._lock:
+                self._cursor = cursor
+                if changes is None:
+                    logger.warning(
+                        "Corpus change log has a gap, clearing response cache"
+                    )
+                    self.invalidations += len(self._entries)
+                    self._entries.clear()
+                    self._matrix = None
+                    return
+                for change in changes:
+                    self._apply_change(change)
+        finally:
+            self._sync_lock.release()
+
+    def _apply_change(self, change: CorpusChange):
+        for key in [
+            key
+            for key, entry in self._entries.items()
+            if change.conversation_id in entry.context_ids
+        ]:
+            self._remove(key)
+
+        if change.deleted:
+            return
+        if change.embedding is None:
+            # Without the vector we cannot tell which queries it affects
+            for key in list(self._entries):
+                self._remove(key)
+            return
+
+        matrix, keys = self._semantic_index()
+        if not keys:
+            return
+        scores = matrix @ _unit(change.embedding)
+        for key, score in zip(keys, scores):
+            entry = self._entries.get(key)
+            if entry is not None and (
+                entry.min_score is None or score >= entry.min_score
+            ):
+                self._remove(key)
+
+    def get_exact(self, query: str, model: str, temperature: float) -> Optional[str]:
+        key = self._key(query, model, temperature)
+        self._sync()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expired:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry.answer
+
+    def get_semantic(
+        self, query_embedding: Sequence[float], model: str, temperature: float
+    ) -> Optional[str]:
+        scope = self._scope(model, temperature)
+        self._sync()
+        with self._lock:
+            matrix, keys = self._semantic_index()
+            if keys:
+                scores = matrix @ _unit(query_embedding)
+                for i in np.argsort(-scores):
+                    if scores[i] < self.semantic_threshold:
+                        break
+                    entry = self._entries[keys[i]]
+                    if entry.scope == scope and not entry.expired:
+                        self._entries.move_to_end(keys[i])
+                        self.semantic_hits += 1
+                        return entry.answer
+            self.misses += 1
+            return None
+
+    def set(
+        self,
+        query: str,
+        model: str,
+        temperature: float,
+        query_embedding: Sequence[float],
+        answer: str,
+        context_ids: Sequence[Optional[int]],
+        context_scores: Sequence[Optional[float]],
+        limit: int,
+    ):
+        """Cache an answer together with the retrieval it was based on."""
+        scores = [score for score in context_scores if score is not None]
+        # A query that got fewer than limit hits is affected by any insert
+        min_score = min(scores) if len(scores) >= limit else None
+        entry = _Entry(
+            answer,
+            self._scope(model, temperature),
+            _unit(query_embedding),
+            {i for i in context_ids if i is not None},
+            min_score,
+            self.ttl,
+        )
+
+        key = self._key(query, model, temperature)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self.exact_hits = self.semantic_hits = self.misses = 0
+            self.invalidations = 0
+
+
+response_cache = ResponseCache()
@@ -4,14 +4,20 @@ from typing import AsyncGenerator, Generator
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import Session, sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool, StaticPool
 
-from app.db.database import Base, get_db
+from app.db.database import Base, get_async_db, get_db
 from app.main import app
 
-# Use in-memory SQLite for testing
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+# Use in-memory SQLite for testing. The database is shared between the sync
+# session used by tests and the async sessions used by the endpoints, and
+# lives as long as the sync engine's single connection.
+SQLALCHEMY_DATABASE_URL = "sqlite:///file:testdb?mode=memory&cache=shared&uri=true"
+ASYNC_SQLALCHEMY_DATABASE_URL = (
+    "sqlite+aiosqlite:///file:testdb?mode=memory&cache=shared&uri=true"
+)
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
@@ -20,6 +26,12 @@ engine = create_engine(
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# NullPool: every request gets a fresh connection on its own event loop
+async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
+
 
 @pytest.fixture(scope="function")
 def db() -> Generator[Session, None, None]:
@@ -43,7 +55,12 @@ def client(db: Session) -> Generator[TestClient, None, None]:
         finally:
             db.close()
 
+    async def override_get_async_db():
+        async with TestingAsyncSessionLocal() as async_db:
+            yield async_db
+
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
     with TestClient(app) as test_client:
         yield test_client
     app.dependency_overrides.clear()
@@ -71,6 +88,9 @@ def mock_milvus(monkeypatch):
         def insert(self, *args, **kwargs):
             return {"insert_count": 1}
 
+        def upsert(self, *args, **kwargs):
+            return {"upsert_count": 1}
+
         def delete(self, *args, **kwargs):
             return True
 
@@ -1,8 +1,13 @@
+from types import SimpleNamespace
+
+import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 
 from app.crud import mental_health_conversation
 from app.schemas.mental_health_conversation import MentalHealthConversationCreate
+from app.services.response_cache import response_cache
+from app.utils.rate_limiter import INTERACTIVE, RateLimitExceeded, chat_limiter
 
 
 def test_create_conversation(client: TestClient, db: Session):
@@ -73,3 +78,160 @@ def test_delete_conversation(client: TestClient, db: Session):
     # Verify it's deleted
     response = client.get(f"/api/v1/conversations/{conversation.id}")
     assert response.status_code == 404
+
+
+class FakeAsyncOpenAI:
+    class embeddings:
+        @staticmethod
+        async def create(input, model, encoding_format=None):
+            return SimpleNamespace(data=[SimpleNamespace(embedding=[0.1, 0.2])])
+
+    class chat:
+        class completions:
+            @staticmethod
+            async def create(model, messages, stream=False, **kwargs):
+                assert "Similar question" in messages[1]["content"]
+                if not stream:
+                    message = SimpleNamespace(content="Generated answer")
+                    return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+                async def chunks():
+                    for token in ["Generated", " answer"]:
+                        delta = SimpleNamespace(content=token)
+                        yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+                return chunks()
+
+
+@pytest.fixture
+def fake_rag(monkeypatch):
+    response_cache.clear()
+
+    async def fake_search(query_embedding, limit=3):
+        return [{"id": 1, "question": "Similar question", "answer": "Similar answer"}]
+
+    monkeypatch.setattr(
+        "app.services.conversation_generation.async_openai_client", FakeAsyncOpenAI
+    )
+    monkeypatch.setattr(
+        "app.services.hybrid_search.aget_similar_conversations", fake_search
+    )
+    monkeypatch.setattr(
+        "app.services.hybrid_search.keyword_index.search", lambda query, limit: []
+    )
+
+
+def test_generate_conversation_response(client: TestClient, fake_rag):
+    response = client.post(
+        "/api/v1/conversations/generate", json={"question": "I can't sleep"}
+    )
+    assert response.status_code == 200
+    assert response.json() == {"answer": "Generated answer"}
+
+
+def test_stream_conversation_response(client: TestClient, fake_rag):
+    response = client.post(
+        "/api/v1/conversations/generate/stream", json={"question": "I can't sleep"}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text == (
+        'data: {"token": "Generated"}\n\n'
+        'data: {"token": " answer"}\n\n'
+        "event: done\ndata: {}\n\n"
+    )
+
+
+def test_generate_returns_503_when_rate_limited(
+    client: TestClient, fake_rag, monkeypatch
+):
+    async def rate_limited(fn, tokens=0, priority=INTERACTIVE):
+        raise RateLimitExceeded("chat still rate limited", retry_after=2.5)
+
+    monkeypatch.setattr(chat_limiter, "acall", rate_limited)
+    response = client.post(
+        "/api/v1/conversations/generate", json={"question": "I can't sleep"}
+    )
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
+
+
+def test_create_conversations_bulk(client: TestClient, db: Session, monkeypatch):
+    enqueued = []
+    monkeypatch.setattr(
+        "app.api.endpoints.mental_health_conversation.index_conversations.delay",
+        lambda ids: enqueued.append(ids) or SimpleNamespace(id="task-1"),
+    )
+
+    response = client.post(
+        "/api/v1/conversations/bulk",
+        json={
+            "conversations": [
+                {"question": f"Question {i}", "answer": f"Answer {i}"} for i in range(5)
+            ]
+        },
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data["ids"]) == 5
+    assert data["task_id"] == "task-1"
+    assert enqueued == [data["ids"]]
+
+    for i, conversation_id in enumerate(data["ids"]):
+        conversation = mental_health_conversation.get_conversation(db, conversation_id)
+        assert conversation.question == f"Question {i}"
+
+
+def test_read_conversations_with_cursor(client: TestClient, db: Session):
+    mental_health_conversation.create_conversations(
+        db,
+        [
+            MentalHealthConversationCreate(question=f"Q{i}", answer=f"A{i}")
+            for i in range(5)
+        ],
+    )
+
+    questions = []
+    params = {"limit": 2}
+    while True:
+        response = client.get("/api/v1/conversations/", params=params)
+        assert response.status_code == 200
+        questions.extend(item["question"] for item in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        params = {"limit": 2, "cursor": cursor}
+
+    assert questions == [f"Q{i}" for i in range(5)]
+
+    response = client.get("/api/v1/conversations/", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+def test_db_pool_stats(client: TestClient):
+    response = client.get("/health/db-pool")
+    assert response.status_code == 200
+    stats = response.json()
+    assert set(stats) == {"sync", "async"}
+    assert {"size", "checked_out", "checkouts", "wait_seconds_max"} <= set(
+        stats["async"]
+    )
+
+
+def test_metrics_report_generation_stages(client: TestClient, fake_rag):
+    client.post("/api/v1/conversations/generate", json={"question": "I can't sleep"})
+    client.post("/api/v1/conversations/generate", json={"question": "I can't sleep"})
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert (
+        'rag_stage_seconds_count{cache_hit="false",model="gpt-4-turbo-preview",'
+        'outcome="success",stage="completion"}' in text
+    )
+    assert (
+        'rag_stage_seconds_count{cache_hit="true",model="gpt-4-turbo-preview",'
+        'outcome="success",stage="total"}' in text
+    )
+    assert 'crud_operation_seconds_count{operation="acreate_conversation"' in text
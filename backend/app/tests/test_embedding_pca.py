@@ -0,0 +1,45 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pytest.importorskip("dagster")
+# The Dagster code location is not a package; its modules are loaded by path
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / "dagster"))
+import embedding_assets  # noqa: E402
+
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    """Serve the given vectors as the source collection and write to tmp_path."""
+
+    def use(count, dim=8):
+        vectors = np.random.default_rng(1).normal(size=(count, dim))
+        monkeypatch.setattr(
+            embedding_assets, "load_embeddings", lambda uri, name: vectors
+        )
+
+    monkeypatch.setattr(embedding_assets, "PCA_ARTIFACT_DIR", tmp_path)
+    monkeypatch.setattr(embedding_assets, "PCA_COMPONENTS", 4)
+    return use
+
+
+def test_projection_reports_recall(source):
+    source(200)
+
+    output = embedding_assets.embedding_pca_projection()
+
+    assert output.metadata["eval_queries"].value == 20
+    assert 0 < output.metadata["recall@10"].value <= 1
+    assert Path(output.value["path"]).exists()
+
+
+def test_small_corpus_skips_recall(source):
+    source(5)
+
+    output = embedding_assets.embedding_pca_projection()
+
+    assert output.metadata["eval_queries"].value == 0
+    assert "recall@10" not in output.metadata
+    assert output.value["dim"] == 4
@@ -0,0 +1,124 @@
+import base64
+from types import SimpleNamespace
+
+import httpx
+import numpy as np
+import openai
+import pytest
+
+from app.utils import embeddings
+from app.utils.embedding_cache import EmbeddingCache, embedding_cache
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.calls = []
+
+    def _respond(self, input, model):
+        self.calls.append(list(input))
+        if any("bad" in text for text in input):
+            request = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+            raise openai.BadRequestError(
+                "invalid input",
+                response=httpx.Response(400, request=request),
+                body=None,
+            )
+        return SimpleNamespace(
+            data=[
+                SimpleNamespace(index=i, embedding=[float(len(text))])
+                for i, text in enumerate(input)
+            ]
+        )
+
+    def create(self, input, model, encoding_format=None):
+        return self._respond(input, model)
+
+
+class FakeAsyncEmbeddings(FakeEmbeddings):
+    async def create(self, input, model, encoding_format=None):
+        return self._respond(input, model)
+
+
+@pytest.fixture(autouse=True)
+def clear_embedding_cache():
+    embedding_cache.clear()
+    yield
+    embedding_cache.clear()
+
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    fake = FakeEmbeddings()
+    monkeypatch.setattr(embeddings, "openai_client", SimpleNamespace(embeddings=fake))
+    return fake
+
+
+@pytest.fixture
+def fake_async_openai(monkeypatch):
+    fake = FakeAsyncEmbeddings()
+    monkeypatch.setattr(
+        embeddings, "async_openai_client", SimpleNamespace(embeddings=fake)
+    )
+    return fake
+
+
+def test_get_embeddings_batches_and_keeps_order(fake_openai):
+    texts = [f"text number {i}" for i in range(10)]
+
+    results = embeddings.get_embeddings(texts, max_tokens_per_request=20)
+
+    assert 1 < len(fake_openai.calls) < len(texts)
+    assert [r.index for r in results] == list(range(10))
+    assert [r.embedding.tolist() for r in results] == [[float(len(t))] for t in texts]
+
+
+def test_get_embeddings_reports_per_item_errors(fake_openai):
+    texts = ["fine", "", "bad input", "also fine"]
+
+    results = embeddings.get_embeddings(texts)
+
+    assert [r.ok for r in results] == [True, False, False, True]
+    assert results[1].error == "empty input"
+    # Neither input can ever be embedded
+    assert results[1].permanent and results[2].permanent
+    assert results[3].embedding.tolist() == [9.0]
+
+
+@pytest.mark.asyncio
+async def test_aget_embeddings_matches_sync(fake_async_openai):
+    texts = ["one", "bad two", "three"]
+
+    results = await embeddings.aget_embeddings(texts, max_concurrency=2)
+
+    assert [r.ok for r in results] == [True, False, True]
+    assert results[2].embedding.tolist() == [5.0]
+
+
+def test_get_embeddings_serves_repeats_from_cache(fake_openai):
+    embeddings.get_embeddings(["I can't sleep", "I feel anxious"])
+    results = embeddings.get_embeddings(["I can't  sleep ", "something new"])
+
+    assert fake_openai.calls == [["I can't sleep", "I feel anxious"], ["something new"]]
+    assert [r.embedding.tolist() for r in results] == [[13.0], [13.0]]
+    assert embedding_cache.stats()["hits"] == 1
+
+
+def test_decode_embedding_reads_base64_as_float32():
+    vector = np.array([0.5, -1.25, 3.0], dtype=np.float32)
+
+    decoded = embeddings.decode_embedding(base64.b64encode(vector.tobytes()).decode())
+
+    assert decoded.dtype == np.float32
+    assert decoded.tolist() == [0.5, -1.25, 3.0]
+
+
+def test_embedding_cache_evicts_least_recently_used():
+    cache = EmbeddingCache(max_entries=2, ttl=0)
+    cache.set("a", "model", [1.0])
+    cache.set("b", "model", [2.0])
+    cache.get("a", "model")
+    cache.set("c", "model", [3.0])
+
+    assert cache.get("b", "model") is None
+    assert cache.get("a", "model") == [1.0]
+    assert cache.stats() == {"entries": 2, "hits": 2, "shared_hits": 0, "misses": 1}
@@ -0,0 +1,86 @@
+import csv
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app.client.api_client import APIClient
+from app.main import app
+from app.models.mental_health_conversation import MentalHealthConversation
+from app.scripts import import_conversations as importer
+
+
+class InProcessAPIClient(APIClient):
+    """APIClient calling the app in process; fails the calls listed in fail_calls."""
+
+    calls = 0
+    fail_calls = set()
+
+    def __init__(self, base_url: str):
+        super().__init__(base_url)
+        self.client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url=self.base_url
+        )
+
+    async def create_conversations_bulk(self, conversations, skip_existing=False):
+        InProcessAPIClient.calls += 1
+        if InProcessAPIClient.calls in self.fail_calls:
+            raise httpx.ConnectError("API unavailable")
+        return await super().create_conversations_bulk(conversations, skip_existing)
+
+
+# The in-memory SQLite database takes one write at a time, so the tests import
+# with concurrency=1
+
+
+@pytest.fixture
+def csv_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(importer, "APIClient", InProcessAPIClient)
+    monkeypatch.setattr(InProcessAPIClient, "calls", 0)
+    monkeypatch.setattr(
+        "app.api.endpoints.mental_health_conversation.index_conversations.delay",
+        lambda ids: SimpleNamespace(id="task-1"),
+    )
+    path = tmp_path / "conversations.csv"
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["question", "answer"])
+        for i in [0, 1, 2, 3, 4, 0]:
+            writer.writerow([f"Question {i}", f"Answer {i}"])
+    return path
+
+
+@pytest.mark.asyncio
+async def test_import_resumes_after_a_failed_batch(
+    client: TestClient, db: Session, csv_path, monkeypatch
+):
+    checkpoint_path = csv_path.with_suffix(".import-state.json")
+    monkeypatch.setattr(InProcessAPIClient, "fail_calls", {2})
+    await importer.import_conversations(csv_path, batch_size=2, concurrency=1)
+
+    # Rows 3 and 4 failed, so the checkpoint stays after row 2
+    checkpoint = importer.ImportCheckpoint(checkpoint_path)
+    assert checkpoint.committed_rows == 2
+    assert db.query(MentalHealthConversation).count() == 3
+
+    monkeypatch.setattr(InProcessAPIClient, "fail_calls", set())
+    lines = len(checkpoint_path.read_text().splitlines())
+    await importer.import_conversations(csv_path, batch_size=2, concurrency=1)
+
+    assert importer.ImportCheckpoint(checkpoint_path).committed_rows == 6
+    assert len(checkpoint_path.read_text().splitlines()) > lines
+    questions = [c.question for c in db.query(MentalHealthConversation)]
+    assert sorted(questions) == [f"Question {i}" for i in range(5)]
+
+
+@pytest.mark.asyncio
+async def test_import_without_checkpoint_skips_stored_conversations(
+    client: TestClient, db: Session, csv_path
+):
+    await importer.import_conversations(csv_path, batch_size=2, concurrency=1)
+    csv_path.with_suffix(".import-state.json").unlink()
+
+    await importer.import_conversations(csv_path, batch_size=2, concurrency=1)
+    assert db.query(MentalHealthConversation).count() == 5
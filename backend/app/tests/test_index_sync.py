@@ -0,0 +1,139 @@
+import pytest
+
+from app.crud import mental_health_conversation as crud
+from app.db.vector_store import LocalVectorStore
+from app.schemas.mental_health_conversation import MentalHealthConversationCreate
+from app.services import index_sync
+from app.tests.conftest import TestingSessionLocal
+from app.utils.embeddings import EmbeddingResult
+
+
+@pytest.fixture
+def sync_env(db, tmp_path, monkeypatch):
+    """Run the sync against the test database, a local store and fake embeddings."""
+    store = LocalVectorStore(tmp_path, dim=3, initial_capacity=4)
+    embedded = []
+
+    def fake_embeddings(pairs):
+        embedded.extend(question for question, _ in pairs)
+        return [
+            EmbeddingResult(index=i, embedding=[1.0, float(i), 0.0])
+            for i in range(len(pairs))
+        ]
+
+    monkeypatch.setattr(index_sync, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(index_sync, "vector_store", store)
+    monkeypatch.setattr(index_sync, "get_combined_embeddings", fake_embeddings)
+    return store, embedded
+
+
+def conversation(question):
+    return MentalHealthConversationCreate(question=question, answer="An answer")
+
+
+def test_sync_only_reembeds_changed_text(db, sync_env):
+    store, embedded = sync_env
+    first = crud.create_conversation(db, conversation("How do I sleep better?"))
+    second = crud.create_conversation(db, conversation("How do I relax?"))
+
+    stats = index_sync.sync_index()
+    assert stats["indexed"] == 2
+    assert store.count() == 2
+
+    # Same text again, and a real edit
+    crud.update_conversation(db, first.id, conversation("How do I sleep better?"))
+    crud.update_conversation(db, second.id, conversation("How do I calm down?"))
+    embedded.clear()
+
+    stats = index_sync.sync_index()
+    assert embedded == ["How do I calm down?"]
+    assert stats["indexed"] == 1
+    assert stats["unchanged"] >= 1
+
+
+def test_sync_applies_tombstones(db, sync_env):
+    store, _ = sync_env
+    kept = crud.create_conversation(db, conversation("Kept"))
+    removed = crud.create_conversation(db, conversation("Removed"))
+    index_sync.sync_index()
+
+    # Deleted without the delete task ever running
+    crud.delete_conversation(db, removed.id)
+    stats = index_sync.sync_index()
+
+    assert stats["deleted"] == 1
+    assert [hit["id"] for hit in store.search([1, 0, 0], limit=5)] == [kept.id]
+
+
+def test_sync_retries_rate_limited_rows_later(db, sync_env, monkeypatch):
+    store, _ = sync_env
+    first = crud.create_conversation(db, conversation("How do I sleep better?"))
+    second = crud.create_conversation(db, conversation("How do I relax?"))
+    limited = {"How do I relax?"}
+
+    def embeddings(pairs):
+        return [
+            (
+                EmbeddingResult(index=i, error="Rate limited", retry_after=5.0)
+                if question in limited
+                else EmbeddingResult(index=i, embedding=[1.0, float(i), 0.0])
+            )
+            for i, (question, _) in enumerate(pairs)
+        ]
+
+    monkeypatch.setattr(index_sync, "get_combined_embeddings", embeddings)
+    with pytest.raises(index_sync.IndexingRateLimited) as exc_info:
+        index_sync.index_rows(db, [first, second])
+    assert exc_info.value.conversation_ids == [second.id]
+    assert exc_info.value.retry_after == 5.0
+    # The rest of the batch is written
+    assert [hit["id"] for hit in store.search([1, 0, 0], limit=5)] == [first.id]
+
+    stats = index_sync.sync_index()
+    assert stats["failed"] == 1
+    assert stats["indexed"] + stats["unchanged"] == 1
+
+    # The watermark stayed before the rate limited row
+    limited.clear()
+    stats = index_sync.sync_index()
+    assert stats["indexed"] == 1
+    assert store.count() == 2
+
+
+def test_rejected_rows_do_not_hold_the_watermark(db, sync_env, monkeypatch):
+    store, _ = sync_env
+    rejected = crud.create_conversation(db, conversation("Rejected"))
+    crud.create_conversation(db, conversation("How do I relax?"))
+    embedded = []
+
+    def embeddings(pairs):
+        embedded.extend(question for question, _ in pairs)
+        return [
+            (
+                EmbeddingResult(index=i, error="Bad request", permanent=True)
+                if question == "Rejected"
+                else EmbeddingResult(index=i, embedding=[1.0, float(i), 0.0])
+            )
+            for i, (question, _) in enumerate(pairs)
+        ]
+
+    monkeypatch.setattr(index_sync, "get_combined_embeddings", embeddings)
+    stats = index_sync.sync_index()
+    assert stats["indexed"] == 1
+    assert stats["rejected"] == 1
+    assert stats["failed"] == 0
+
+    with TestingSessionLocal() as session:
+        state = session.get(index_sync.IndexSyncState, index_sync.SYNC_NAME)
+        assert state.watermark >= rejected.updated_at.replace(tzinfo=None)
+
+    # The rejected text is not sent again, an edit is
+    embedded.clear()
+    stats = index_sync.sync_index()
+    assert embedded == []
+    assert stats["rejected"] == 1
+
+    crud.update_conversation(db, rejected.id, conversation("How do I sleep?"))
+    index_sync.sync_index()
+    assert embedded == ["How do I sleep?"]
+    assert store.count() == 2
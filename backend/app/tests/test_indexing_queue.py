@@ -0,0 +1,208 @@
+from collections import defaultdict
+
+import pytest
+
+from app.services.index_sync import IndexingRateLimited
+from app.worker import tasks
+
+
+class FakeRedis:
+    """The set, flag and pipeline commands used by the batch indexing queue."""
+
+    def __init__(self):
+        self.sets = defaultdict(set)
+        self.values = {}
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def sadd(self, key, *members):
+        before = len(self.sets[key])
+        self.sets[key].update(str(member) for member in members)
+        return len(self.sets[key]) - before
+
+    def srem(self, key, *members):
+        before = len(self.sets[key])
+        self.sets[key].difference_update(str(member) for member in members)
+        return before - len(self.sets[key])
+
+    def scard(self, key):
+        return len(self.sets[key])
+
+    def spop(self, key, count):
+        members = sorted(self.sets[key])[:count]
+        self.sets[key].difference_update(members)
+        return members
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+
+        return queue
+
+    def execute(self):
+        return [
+            getattr(self.redis, name)(*args, **kwargs)
+            for name, args, kwargs in self.commands
+        ]
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    """Batch mode against a fake Redis, recording flushes and index writes."""
+    redis = FakeRedis()
+    calls = {"flush_now": 0, "flush_later": [], "indexed": [], "deleted": []}
+
+    def index_batch(ids):
+        calls["indexed"].append(ids)
+        return ids, [], []
+
+    monkeypatch.setattr(tasks, "INDEXING_MODE", "batch")
+    monkeypatch.setattr(tasks, "get_redis_client", lambda: redis)
+    monkeypatch.setattr(tasks, "_index_batch", index_batch)
+    monkeypatch.setattr(tasks, "_delete_batch", calls["deleted"].append)
+    monkeypatch.setattr(
+        tasks.flush_index_queue,
+        "delay",
+        lambda: calls.update(flush_now=calls["flush_now"] + 1),
+    )
+    monkeypatch.setattr(
+        tasks.flush_index_queue,
+        "apply_async",
+        lambda countdown, kwargs=None: calls["flush_later"].append(countdown),
+    )
+    return redis, calls
+
+
+def test_changes_are_coalesced_into_one_flush(queue):
+    redis, calls = queue
+    for conversation_id in (1, 2, 1):
+        tasks.enqueue_index(conversation_id)
+
+    assert calls["flush_later"] == [tasks.INDEX_BATCH_WINDOW]
+    assert calls["flush_now"] == 0
+
+    assert tasks.flush_index_queue() == {"indexed": 2, "deleted": 0, "failed": 0}
+    assert calls["indexed"] == [[1, 2]]
+    # The next change schedules a new flush
+    tasks.enqueue_index(3)
+    assert len(calls["flush_later"]) == 2
+
+
+def test_full_batch_flushes_at_once(queue, monkeypatch):
+    _, calls = queue
+    monkeypatch.setattr(tasks, "INDEX_BATCH_MAX_ITEMS", 2)
+    tasks.enqueue_index(1)
+    assert calls["flush_now"] == 0
+
+    tasks.enqueue_index(2)
+    assert calls["flush_now"] == 1
+
+
+def test_delete_overrides_pending_upsert(queue):
+    _, calls = queue
+    tasks.enqueue_index(1)
+    tasks.enqueue_delete(1)
+    tasks.enqueue_index(2)
+
+    tasks.flush_index_queue()
+    assert calls["indexed"] == [[2]]
+    assert calls["deleted"] == [[1]]
+
+
+def test_failed_round_is_requeued(queue, monkeypatch):
+    redis, calls = queue
+    tasks.enqueue_index(1)
+    tasks.enqueue_delete(2)
+
+    def broken(ids):
+        raise ConnectionError("vector store down")
+
+    monkeypatch.setattr(tasks, "_index_batch", broken)
+    tasks.flush_index_queue()
+
+    assert redis.sets[tasks.PENDING_UPSERTS_KEY] == {"1"}
+    assert redis.sets[tasks.PENDING_DELETES_KEY] == {"2"}
+    assert len(calls["flush_later"]) == 2
+
+
+def test_failed_embeddings_are_retried_then_left_to_the_sync(queue, monkeypatch):
+    redis, calls = queue
+    tasks.enqueue_index(1)
+    tasks.enqueue_index(2)
+    monkeypatch.setattr(tasks, "_index_batch", lambda ids: ([1], [], [2]))
+
+    assert tasks.flush_index_queue() == {"indexed": 1, "deleted": 0, "failed": 1}
+    assert redis.sets[tasks.PENDING_UPSERTS_KEY] == {"2"}
+    assert len(calls["flush_later"]) == 2
+
+    monkeypatch.setattr(tasks, "_index_batch", lambda ids: ([], [], ids))
+    tasks.flush_index_queue(retries=tasks.INDEX_TASK_MAX_RETRIES)
+    assert not redis.sets[tasks.PENDING_UPSERTS_KEY]
+    assert len(calls["flush_later"]) == 2
+
+
+def test_rate_limited_rows_wait_for_retry_after(queue, monkeypatch):
+    redis, calls = queue
+    for conversation_id in (1, 2, 3):
+        tasks.enqueue_index(conversation_id)
+    tasks.enqueue_delete(4)
+
+    def rate_limited(ids):
+        raise IndexingRateLimited([3], retry_after=30, indexed=[1, 2])
+
+    monkeypatch.setattr(tasks, "_index_batch", rate_limited)
+    assert tasks.flush_index_queue()["indexed"] == 2
+
+    # Rows already written are not queued again
+    assert redis.sets[tasks.PENDING_UPSERTS_KEY] == {"3"}
+    assert redis.sets[tasks.PENDING_DELETES_KEY] == {"4"}
+    assert 30 <= calls["flush_later"][-1] <= 60
+    # Changes in the meantime do not bring the next flush forward
+    tasks.enqueue_index(5)
+    assert len(calls["flush_later"]) == 2
+
+
+def test_retried_indexing_keeps_earlier_counts(monkeypatch):
+    monkeypatch.setattr(tasks, "INDEX_BATCH_SIZE", 2)
+    batches = []
+
+    def index_batch(ids):
+        batches.append(ids)
+        if len(batches) == 2:
+            raise IndexingRateLimited([4], retry_after=1, indexed=[3])
+        return ids[:1], [], []
+
+    retries = []
+
+    def retry(**kwargs):
+        retries.append(kwargs)
+        return RuntimeError("retry")
+
+    monkeypatch.setattr(tasks, "_index_batch", index_batch)
+    monkeypatch.setattr(tasks.index_conversations, "retry", retry)
+
+    with pytest.raises(RuntimeError):
+        tasks.index_conversations([1, 2, 3, 4, 5])
+    (retry_call,) = retries
+    assert retry_call["args"] == [[4, 5]]
+    assert retry_call["kwargs"] == {"indexed": 2, "failed": 1}
+
+    result = tasks.index_conversations([4, 5], **retry_call["kwargs"])
+    assert result == {"indexed": 3, "failed": 2}
@@ -0,0 +1,77 @@
+from app.services.corpus_events import CorpusChange, InMemoryCorpusEvents
+from app.services.hybrid_search import reciprocal_rank_fusion
+from app.services.keyword_index import BM25Index, KeywordIndex
+
+CORPUS = [
+    (1, "I feel anxious all the time", "Breathing exercises can help with anxiety."),
+    (
+        2,
+        "I keep pulling out my hair",
+        "This may be trichotillomania, talk to a doctor.",
+    ),
+    (3, "I feel sad and tired", "Depression is common, you are not alone."),
+]
+
+
+def hit(conversation_id, distance=None):
+    return {
+        "id": conversation_id,
+        "question": f"Q{conversation_id}",
+        "answer": f"A{conversation_id}",
+        "distance": distance,
+    }
+
+
+def test_bm25_ranks_rare_term_first():
+    index = BM25Index()
+    for conversation in CORPUS:
+        index.add(*conversation)
+
+    results = index.search("what is trichotillomania", limit=3)
+
+    assert [result["id"] for result in results] == [2]
+
+
+def test_bm25_update_and_remove():
+    index = BM25Index()
+    for conversation in CORPUS:
+        index.add(*conversation)
+
+    index.add(3, "Trouble sleeping", "Keep a regular bedtime.")
+    index.remove(1)
+
+    assert index.search("sad", limit=3) == []
+    assert index.search("anxious", limit=3) == []
+    assert [r["id"] for r in index.search("sleeping", limit=3)] == [3]
+    assert len(index) == 2
+
+
+def test_reciprocal_rank_fusion_prefers_agreement():
+    vector = [hit(1, 0.9), hit(2, 0.8), hit(3, 0.7)]
+    keyword = [hit(3), hit(4)]
+
+    fused = reciprocal_rank_fusion([vector, keyword], limit=3)
+
+    assert [result["id"] for result in fused] == [3, 1, 2]
+    assert fused[0]["distance"] == 0.7
+    assert reciprocal_rank_fusion([[hit(4)]], limit=1)[0]["distance"] is None
+
+
+def test_keyword_index_applies_corpus_changes():
+    events = InMemoryCorpusEvents()
+    rows = {conversation[0]: conversation for conversation in CORPUS}
+    index = KeywordIndex(
+        events=events,
+        sync_interval=0,
+        load_all=lambda: list(rows.values()),
+        load_many=lambda ids: [rows[i] for i in ids if i in rows],
+    )
+    index.load()
+
+    rows[4] = (4, "Do SSRIs have side effects?", "Some people notice nausea.")
+    del rows[2]
+    events.publish(CorpusChange(conversation_id=4))
+    events.publish(CorpusChange(conversation_id=2, deleted=True))
+
+    assert [r["id"] for r in index.search("SSRIs", limit=3)] == [4]
+    assert index.search("trichotillomania", limit=3) == []
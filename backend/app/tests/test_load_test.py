@@ -0,0 +1,45 @@
+import numpy as np
+from fastapi.testclient import TestClient
+from openai import OpenAI
+
+from app.utils.embeddings import EMBEDDING_MODEL, decode_embedding
+from scripts.fake_openai import FakeOpenAIConfig, create_app, fake_embedding
+from scripts.load_test import compare, summarize
+
+
+def test_fake_openai_is_deterministic_through_the_sdk():
+    config = FakeOpenAIConfig(
+        embedding_latency=0, completion_latency=0, completion_tokens=12
+    )
+    client = OpenAI(
+        api_key="sk-test",
+        base_url="http://testserver/v1",
+        http_client=TestClient(create_app(config)),
+    )
+
+    response = client.embeddings.create(
+        input=["I can't sleep"], model=EMBEDDING_MODEL, encoding_format="base64"
+    )
+    embedding = decode_embedding(response.data[0].embedding)
+    assert np.array_equal(embedding, fake_embedding("I can't sleep", 1536))
+
+    messages = [{"role": "user", "content": "I can't sleep"}]
+    answer = client.chat.completions.create(model="gpt-4", messages=messages)
+    stream = client.chat.completions.create(
+        model="gpt-4", messages=messages, stream=True
+    )
+    tokens = [chunk.choices[0].delta.content or "" for chunk in stream]
+    assert len(answer.choices[0].message.content.split()) == 12
+    assert "".join(tokens) == answer.choices[0].message.content
+
+
+def test_compare_flags_regressions_beyond_tolerance():
+    baseline = summarize({"read": [0.010] * 100, "generate": [0.5] * 50}, {}, 10)
+    results = summarize(
+        {"read": [0.011] * 100, "generate": [0.9] * 30}, {"generate": 10}, 10
+    )
+
+    regressions = compare(results, baseline, tolerance=0.2)
+    assert all(regression.startswith("generate:") for regression in regressions)
+    assert len(regressions) == 4  # p95, p99, throughput and error rate
+    assert compare(baseline, baseline, tolerance=0.2) == []
@@ -0,0 +1,50 @@
+import pytest
+from prometheus_client import CollectorRegistry, Histogram
+
+from app.metrics import instrumented, timed
+
+
+@pytest.fixture
+def registry():
+    return CollectorRegistry()
+
+
+@pytest.fixture
+def histogram(registry):
+    return Histogram("test_seconds", "Test", ["stage", "outcome"], registry=registry)
+
+
+def test_timed_labels_outcome(registry, histogram):
+    with timed(histogram, stage="ok"):
+        pass
+    with pytest.raises(ValueError):
+        with timed(histogram, stage="broken"):
+            raise ValueError
+
+    assert (
+        registry.get_sample_value(
+            "test_seconds_count", {"stage": "ok", "outcome": "success"}
+        )
+        == 1
+    )
+    assert (
+        registry.get_sample_value(
+            "test_seconds_count", {"stage": "broken", "outcome": "error"}
+        )
+        == 1
+    )
+
+
+@pytest.mark.asyncio
+async def test_instrumented_times_async_functions(registry, histogram):
+    @instrumented(histogram, label="stage")
+    async def load():
+        return 42
+
+    assert await load() == 42
+    assert (
+        registry.get_sample_value(
+            "test_seconds_count", {"stage": "load", "outcome": "success"}
+        )
+        == 1
+    )
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from app.db.milvus_client import to_milvus_vector
+from app.utils.projection import EmbeddingProjection
+
+
+@pytest.fixture
+def projection(tmp_path):
+    path = tmp_path / "pca-4x2-test.npz"
+    np.savez(
+        path,
+        mean=np.array([1, 1, 0, 0], dtype=np.float32),
+        components=np.array([[1, 0, 0, 0], [0, 0, 1, 0]], dtype=np.float32),
+        explained_variance_ratio=np.array([0.6, 0.3], dtype=np.float32),
+        version=np.array("test"),
+    )
+    return EmbeddingProjection.load(path)
+
+
+def test_projection_centers_and_reduces(projection):
+    assert (projection.input_dim, projection.output_dim) == (4, 2)
+    assert projection.version == "test"
+    assert projection.project([3, 5, 2, 7]).tolist() == [2, 2]
+    assert projection.project(np.ones((3, 4))).shape == (3, 2)
+
+    with pytest.raises(ValueError):
+        projection.project([1, 2, 3])
+
+
+def test_milvus_vectors_are_projected(projection):
+    vector = to_milvus_vector([3, 5, 2, 7], "FLOAT16_VECTOR", projection=projection)
+
+    assert vector.dtype == np.float16
+    assert vector.tolist() == [2, 2]
@@ -0,0 +1,82 @@
+from jinja2 import Environment, FileSystemLoader
+
+from app.services.conversation_generation import ConversationContext
+from app.services.prompt_assembly import PromptAssembler
+
+template_env = Environment(loader=FileSystemLoader("app/templates"))
+
+
+def assembler(budget, min_case_tokens=20):
+    return PromptAssembler(
+        model="gpt-4-turbo-preview",
+        system_prompt="You are a mental health counseling assistant.",
+        instructions=template_env.get_template(
+            "conversation_gen_rag_instructions.jinja"
+        ).render(),
+        template=template_env.get_template("conversation_gen_rag_prompt.jinja"),
+        budget=budget,
+        min_case_tokens=min_case_tokens,
+    )
+
+
+def case(question, words):
+    return ConversationContext(question=question, answer=" ".join(["calm"] * words))
+
+
+def test_all_cases_fit_and_instructions_come_first():
+    prompt = assembler(budget=3000).assemble(
+        "I can't sleep", [case("First", 10), case("Second", 10)]
+    )
+
+    system, user = prompt.messages
+    assert "Please provide guidance" in system["content"]
+    assert user["content"].index("Case 1:") < user["content"].index("Case 2:")
+    assert user["content"].endswith("User Query: I can't sleep")
+    assert prompt.cases_used == 2
+    assert prompt.cases_truncated == prompt.cases_dropped == 0
+
+
+def test_lowest_ranked_cases_are_truncated_then_dropped():
+    prompt_assembler = assembler(budget=3000)
+    base = prompt_assembler.assemble("I can't sleep", []).prompt_tokens
+    prompt_assembler.budget = base + 150
+
+    prompt = prompt_assembler.assemble(
+        "I can't sleep",
+        [case("First", 40), case("Second", 400), case("Third", 40)],
+    )
+
+    user = prompt.messages[1]["content"]
+    assert prompt.prompt_tokens <= prompt_assembler.budget
+    assert prompt.cases_used == 2
+    assert prompt.cases_truncated == 1
+    assert prompt.cases_dropped == 1
+    assert "Question: First" in user and "Question: Second" in user
+    assert "Question: Third" not in user
+    assert user.count("[...]") == 1
+
+
+def test_no_case_follows_a_truncated_one():
+    prompt_assembler = assembler(budget=3000)
+    base = prompt_assembler.assemble("I can't sleep", []).prompt_tokens
+    prompt_assembler.budget = base + 150
+
+    prompt = prompt_assembler.assemble(
+        "I can't sleep", [case("First", 400), case("Second", 1)]
+    )
+
+    assert prompt.cases_truncated == 1
+    assert prompt.cases_dropped == 1
+    assert "Question: Second" not in prompt.messages[1]["content"]
+
+
+def test_query_over_budget_is_truncated():
+    prompt_assembler = assembler(budget=3000)
+    base = prompt_assembler.assemble("", []).prompt_tokens
+    prompt_assembler.budget = base + 50
+
+    prompt = prompt_assembler.assemble("I can't sleep " * 200, [case("First", 10)])
+
+    assert prompt.prompt_tokens <= prompt_assembler.budget
+    assert prompt.messages[1]["content"].count("I can't sleep") < 200
+    assert prompt.cases_dropped == 1
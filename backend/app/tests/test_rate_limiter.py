@@ -0,0 +1,86 @@
+import httpx
+import openai
+import pytest
+
+from app.utils import rate_limiter
+from app.utils.rate_limiter import BACKGROUND, RateLimiter, RateLimitExceeded
+
+
+class FakeLimiter(RateLimiter):
+    """Records quota requests and backoffs instead of running them in Redis."""
+
+    def __init__(self, wait=0.0):
+        super().__init__("test", rpm=60, tpm=1000)
+        self.wait = wait
+        self.acquired = []
+        self.backoffs = 0
+
+    def _try_acquire(self, tokens, priority):
+        self.acquired.append((tokens, priority))
+        return self.wait
+
+    def backoff(self):
+        self.backoffs += 1
+
+
+def rate_limit_error(retry_after="0", code=None):
+    request = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+    response = httpx.Response(
+        429, headers={"retry-after": retry_after}, request=request
+    )
+    return openai.RateLimitError(
+        "Rate limit reached", response=response, body={"code": code}
+    )
+
+
+def test_call_retries_rate_limited_attempts():
+    limiter = FakeLimiter()
+    errors = [rate_limit_error(), rate_limit_error()]
+
+    def create():
+        if errors:
+            raise errors.pop()
+        return "embedding"
+
+    assert limiter.call(create, tokens=12, priority=BACKGROUND) == "embedding"
+    assert limiter.backoffs == 2
+    # Every attempt takes its own quota
+    assert limiter.acquired == [(12, BACKGROUND)] * 3
+
+
+@pytest.mark.asyncio
+async def test_call_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "OPENAI_MAX_RETRIES", 2)
+    limiter = FakeLimiter()
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(rate_limiter.asyncio, "sleep", sleep)
+
+    async def create():
+        raise rate_limit_error(retry_after="7")
+
+    with pytest.raises(RateLimitExceeded) as exc_info:
+        await limiter.acall(create)
+    assert exc_info.value.retry_after == 7
+    # The server's retry-after is honoured between attempts
+    assert delays == [7, 7]
+    assert len(limiter.acquired) == 3
+
+    # Out of credit is not worth retrying
+    def out_of_credit():
+        raise rate_limit_error(code="insufficient_quota")
+
+    with pytest.raises(openai.RateLimitError):
+        limiter.call(out_of_credit)
+    assert len(limiter.acquired) == 4
+
+
+def test_acquire_gives_up_past_max_wait():
+    limiter = FakeLimiter(wait=60.0)
+
+    with pytest.raises(RateLimitExceeded) as exc_info:
+        limiter.acquire()
+    assert exc_info.value.retry_after == 60
@@ -0,0 +1,149 @@
+import numpy as np
+import pytest
+from pymilvus import MilvusException
+from sqlalchemy.orm import Session
+
+from app.crud import mental_health_conversation as crud
+from app.schemas.mental_health_conversation import MentalHealthConversationCreate
+from app.scripts import reindex
+from app.tests.conftest import TestingSessionLocal
+from app.utils.embeddings import EmbeddingResult
+
+LIVE = reindex.COLLECTION_NAME
+
+
+class FakeMilvusClient:
+    """Collections as dicts of rows by id, and aliases; lost_ids are never written."""
+
+    def __init__(self, lost_ids=()):
+        self.collections = {}
+        self.aliases = {}
+        self.lost_ids = set(lost_ids)
+
+    def create_collection(self, name):
+        self.collections[name] = {}
+
+    def has_collection(self, name):
+        return name in self.collections
+
+    def rename_collection(self, old, new):
+        self.collections[new] = self.collections.pop(old)
+
+    def describe_alias(self, alias):
+        if alias not in self.aliases:
+            raise MilvusException(message=f"alias {alias} not found")
+        return {"alias": alias, "collection_name": self.aliases[alias]}
+
+    def create_alias(self, collection_name, alias):
+        self.aliases[alias] = collection_name
+
+    def alter_alias(self, collection_name, alias):
+        self.aliases[alias] = collection_name
+
+    def upsert(self, collection_name, data):
+        for row in data:
+            if row["id"] not in self.lost_ids:
+                self.collections[collection_name][row["id"]] = row
+
+    def delete(self, collection_name, ids):
+        for i in ids:
+            self.collections[collection_name].pop(i, None)
+
+    def flush(self, collection_name):
+        pass
+
+    def query(self, collection_name, **kwargs):
+        return [{"count(*)": len(self.collections[collection_name])}]
+
+    def query_iterator(self, collection_name, batch_size, output_fields):
+        rows = [{"id": i} for i in self.collections[collection_name]]
+        return FakeIterator(
+            [rows[i : i + batch_size] for i in range(0, len(rows), batch_size)]
+        )
+
+
+class FakeIterator:
+    def __init__(self, batches):
+        self.batches = batches
+
+    def next(self):
+        return self.batches.pop(0) if self.batches else []
+
+    def close(self):
+        pass
+
+
+def fake_embeddings(pairs):
+    return [
+        EmbeddingResult(index=i, embedding=np.ones(3, dtype=np.float32))
+        for i in range(len(pairs))
+    ]
+
+
+@pytest.fixture
+def milvus(db: Session, monkeypatch):
+    """A fake Milvus holding the live collection under its plain name."""
+    milvus = FakeMilvusClient()
+    milvus.create_collection(LIVE)
+    for i in range(3):
+        crud.create_conversation(
+            db, MentalHealthConversationCreate(question=f"Q{i}", answer=f"A{i}")
+        )
+    monkeypatch.setattr(reindex, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(reindex, "milvus_client", milvus)
+    monkeypatch.setattr(reindex, "create_collection", milvus.create_collection)
+    monkeypatch.setattr(reindex, "get_combined_embeddings", fake_embeddings)
+    monkeypatch.setattr(reindex, "to_milvus_vector", lambda embedding: embedding)
+    return milvus
+
+
+def test_reindex_switches_alias_and_rolls_back(milvus, tmp_path):
+    checkpoint_path = tmp_path / "reindex.json"
+    reindex.reindex(batch_size=2, concurrency=1, checkpoint_path=checkpoint_path)
+
+    new = milvus.aliases[LIVE]
+    assert new.startswith(f"{LIVE}_v")
+    assert len(milvus.collections[new]) == 3
+    # The old collection is kept under a new name so the alias can take its name
+    assert LIVE not in milvus.collections
+    assert f"{LIVE}_v0" in milvus.collections
+    assert not checkpoint_path.exists()
+
+    reindex.rollback(f"{LIVE}_v0")
+    assert milvus.aliases[LIVE] == f"{LIVE}_v0"
+
+
+def test_reindex_does_not_switch_when_counts_differ(milvus, db: Session, tmp_path):
+    milvus.lost_ids = {crud.get_conversations(db)[0].id}
+    checkpoint_path = tmp_path / "reindex.json"
+    reindex.reindex(batch_size=2, concurrency=1, checkpoint_path=checkpoint_path)
+
+    assert milvus.aliases == {}
+    assert LIVE in milvus.collections
+    # Kept, so the build can be resumed or inspected
+    assert checkpoint_path.exists()
+
+
+def test_reindex_resumes_from_checkpoint(milvus, tmp_path, monkeypatch):
+    checkpoint_path = tmp_path / "reindex.json"
+    ranges = []
+    index_range = reindex.index_range
+
+    def fail_second_range(collection_name, after_id, last_id):
+        ranges.append((after_id, last_id))
+        if len(ranges) == 2:
+            raise ConnectionError("Milvus unavailable")
+        return index_range(collection_name, after_id, last_id)
+
+    monkeypatch.setattr(reindex, "index_range", fail_second_range)
+    with pytest.raises(ConnectionError):
+        reindex.reindex(batch_size=2, concurrency=1, checkpoint_path=checkpoint_path)
+
+    checkpoint = reindex.ReindexCheckpoint(checkpoint_path)
+    assert checkpoint.done == {0}
+
+    reindex.reindex(batch_size=2, concurrency=1, checkpoint_path=checkpoint_path)
+    # Only the unfinished range ran again, into the same collection
+    assert ranges == [checkpoint.ranges[0], checkpoint.ranges[1], checkpoint.ranges[1]]
+    assert milvus.aliases[LIVE] == checkpoint.collection_name
+    assert len(milvus.collections[checkpoint.collection_name]) == 3
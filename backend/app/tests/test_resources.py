@@ -0,0 +1,46 @@
+from app.resources import ResourceRegistry
+from app.services.conversation_generation import get_rag_service
+
+
+def test_clients_are_created_once_on_first_use():
+    registry = ResourceRegistry()
+    created = []
+    client = registry.register("client", lambda: created.append(1) or "hello")
+
+    assert created == []
+    assert client.upper() == "HELLO"
+    assert client.get() == "hello"
+    assert created == [1]
+    assert registry.stats()["initialized"] == ["client"]
+
+
+def test_warm_up_reports_init_times_and_survives_failures():
+    registry = ResourceRegistry()
+    registry.register("client", lambda: object())
+    registry.register("down", lambda: 1 / 0)
+    warmed = []
+    registry.add_warmup("templates", lambda: warmed.append(1))
+
+    init_times = registry.warm_up()
+
+    assert set(init_times) == {"client", "templates"}
+    assert warmed == [1]
+    assert "down" in registry.stats()["errors"]
+
+
+def test_close_releases_clients_until_next_use():
+    registry = ResourceRegistry()
+    closed = []
+    client = registry.register("client", lambda: ["open"], close=closed.append)
+    registry.register("unused", lambda: ["open"], close=closed.append)
+
+    first = client.get()
+    registry.close()
+
+    assert closed == [first]
+    assert not client.initialized
+    assert client.get() is not first
+
+
+def test_rag_service_is_shared_across_requests():
+    assert get_rag_service() is get_rag_service()
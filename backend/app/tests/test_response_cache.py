@@ -0,0 +1,106 @@
+import threading
+
+from app.services.corpus_events import CorpusChange, InMemoryCorpusEvents
+from app.services.response_cache import ResponseCache
+
+
+def make_cache(**kwargs):
+    events = InMemoryCorpusEvents()
+    cache = ResponseCache(events=events, sync_interval=0, **kwargs)
+    # Take the change log cursor before anything is cached
+    cache.get_exact("warm up", "model", 0.7)
+    return cache, events
+
+
+def cache_answer(cache, query="I can't sleep because of stress"):
+    cache.set(
+        query,
+        "model",
+        0.7,
+        query_embedding=[1.0, 0.0, 0.0],
+        answer="Try a wind-down routine",
+        context_ids=[1, 2],
+        context_scores=[0.9, 0.8],
+        limit=2,
+    )
+
+
+def test_exact_hit_ignores_whitespace_but_not_temperature():
+    cache, _ = make_cache()
+    cache_answer(cache)
+
+    assert cache.get_exact("I can't  sleep because of stress ", "model", 0.7)
+    assert cache.get_exact("I can't sleep because of stress", "model", 0.2) is None
+    assert cache.stats()["exact_hits"] == 1
+    # The warm up lookup missed too
+    assert cache.stats()["misses"] == 2
+
+
+def test_semantic_hit_within_threshold():
+    cache, _ = make_cache(semantic_threshold=0.95)
+    cache_answer(cache)
+
+    assert cache.get_semantic([0.99, 0.05, 0.0], "model", 0.7)
+    assert cache.get_semantic([0.5, 0.5, 0.0], "model", 0.7) is None
+
+
+def test_changed_context_conversation_invalidates():
+    cache, events = make_cache()
+    cache_answer(cache)
+
+    events.publish(CorpusChange(conversation_id=2, deleted=True))
+
+    assert cache.get_exact("I can't sleep because of stress", "model", 0.7) is None
+
+
+def test_only_conversations_that_would_be_retrieved_invalidate():
+    cache, events = make_cache()
+    cache_answer(cache)
+
+    events.publish(CorpusChange(conversation_id=3, embedding=[0.0, 1.0, 0.0]))
+    assert cache.get_exact("I can't sleep because of stress", "model", 0.7)
+
+    events.publish(CorpusChange(conversation_id=4, embedding=[0.95, 0.1, 0.0]))
+    assert cache.get_exact("I can't sleep because of stress", "model", 0.7) is None
+
+
+def test_size_bound_evicts_least_recently_used():
+    cache, _ = make_cache(max_entries=1)
+    cache_answer(cache, "first")
+    cache_answer(cache, "second")
+
+    assert cache.get_exact("first", "model", 0.7) is None
+    assert cache.get_exact("second", "model", 0.7)
+
+
+class BlockingEvents(InMemoryCorpusEvents):
+    """A change log whose reads hang until released, like a stalled Redis."""
+
+    def __init__(self):
+        super().__init__()
+        self.reading = threading.Event()
+        self.release = threading.Event()
+
+    def read_since(self, cursor):
+        if cursor is not None:
+            self.reading.set()
+            self.release.wait(5)
+        return super().read_since(cursor)
+
+
+def test_slow_change_log_does_not_block_lookups():
+    events = BlockingEvents()
+    cache = ResponseCache(events=events, sync_interval=0)
+    cache.get_exact("warm up", "model", 0.7)
+    cache_answer(cache)
+
+    poller = threading.Thread(target=cache.get_exact, args=("other", "model", 0.7))
+    poller.start()
+    assert events.reading.wait(5)
+    try:
+        # Served while the other thread is still waiting on the change log
+        assert cache.get_exact("I can't sleep because of stress", "model", 0.7)
+        assert poller.is_alive()
+    finally:
+        events.release.set()
+        poller.join()
@@ -0,0 +1,106 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import conversation_generation
+from app.services.conversation_generation import AsyncConversationRAGGenerationService
+from app.services.response_cache import response_cache
+from app.utils.embedding_cache import embedding_cache
+from app.utils.single_flight import SingleFlight
+
+
+class SlowFakeAsyncOpenAI:
+    """Counts upstream calls and holds each one open so requests overlap."""
+
+    def __init__(self):
+        self.embedding_calls = 0
+        self.completion_calls = 0
+        self.embeddings = SimpleNamespace(create=self._embed)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._complete))
+
+    async def _embed(self, input, model, encoding_format=None):
+        self.embedding_calls += 1
+        await asyncio.sleep(0.05)
+        return SimpleNamespace(data=[SimpleNamespace(embedding=[0.1, 0.2])])
+
+    async def _complete(self, model, messages, **kwargs):
+        self.completion_calls += 1
+        await asyncio.sleep(0.05)
+        message = SimpleNamespace(content=f"Answer {self.completion_calls}")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+@pytest.fixture
+def slow_openai(monkeypatch):
+    response_cache.clear()
+    embedding_cache.clear()
+    fake = SlowFakeAsyncOpenAI()
+
+    async def fake_search(query_embedding, limit=3):
+        return [{"id": 1, "question": "Similar question", "answer": "Similar answer"}]
+
+    monkeypatch.setattr(conversation_generation, "async_openai_client", fake)
+    monkeypatch.setattr(
+        "app.services.hybrid_search.aget_similar_conversations", fake_search
+    )
+    monkeypatch.setattr(
+        "app.services.hybrid_search.keyword_index.search", lambda query, limit: []
+    )
+    yield fake
+    response_cache.clear()
+    embedding_cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_burst_of_identical_queries_makes_one_upstream_call(slow_openai):
+    service = AsyncConversationRAGGenerationService()
+    queries = ["I can't sleep", " I can't  sleep"] * 10
+
+    answers = await asyncio.gather(*(service.generate_response(q) for q in queries))
+
+    assert answers == ["Answer 1"] * 20
+    assert slow_openai.embedding_calls == 1
+    assert slow_openai.completion_calls == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_shared_generation(slow_openai):
+    service = AsyncConversationRAGGenerationService()
+    first = asyncio.ensure_future(service.generate_response("I feel anxious"))
+    second = asyncio.ensure_future(service.generate_response("I feel anxious"))
+    await asyncio.sleep(0.01)
+
+    first.cancel()
+
+    assert await second == "Answer 1"
+    assert slow_openai.completion_calls == 1
+
+
+def test_single_flight_shares_result_and_errors_across_threads():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [pool.submit(flight.do, "key", compute) for _ in range(8)]
+        while flight.stats()["shared"] < 7:
+            time.sleep(0.001)
+        release.set()
+        assert [f.result() for f in futures] == ["result"] * 8
+    assert len(calls) == 1
+
+    def fail():
+        raise ValueError("upstream failed")
+
+    with pytest.raises(ValueError):
+        flight.do("key", fail)
+    assert flight.stats()["in_flight"] == 0
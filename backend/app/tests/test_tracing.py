@@ -0,0 +1,94 @@
+import json
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+from app import tracing
+from app.scripts.trace_report import load_traces, searchable_latency
+from app.services import index_sync
+from app.tracing import SpanContext, current_span, start_span
+from app.worker.celery_app import _propagate_trace
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+TRACEPARENT = f"00-{TRACE_ID}-00f067aa0ba902b7-01"
+
+
+def test_traceparent_round_trip():
+    context = SpanContext.from_traceparent(TRACEPARENT)
+    assert context.trace_id == TRACE_ID
+    assert context.span_id == "00f067aa0ba902b7"
+    assert context.traceparent == TRACEPARENT
+
+    assert SpanContext.from_traceparent("not a traceparent") is None
+    assert SpanContext.from_traceparent(f"00-{'0' * 32}-00f067aa0ba902b7-01") is None
+
+
+def test_spans_nest_and_propagate_to_task_headers():
+    with start_span("outer") as outer:
+        with start_span("inner") as inner:
+            headers = {}
+            _propagate_trace(headers=headers)
+        assert current_span() is outer
+
+    assert inner.context.trace_id == outer.context.trace_id
+    assert inner.parent_id == outer.context.span_id
+    assert headers == {"traceparent": inner.context.traceparent}
+    assert current_span() is None
+
+
+def test_request_continues_callers_trace(client: TestClient, tmp_path, monkeypatch):
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(tracing, "exporter", tracing.JsonFileExporter(path))
+
+    response = client.get("/", headers={"traceparent": TRACEPARENT})
+    assert response.headers["X-Trace-Id"] == TRACE_ID
+
+    (span,) = [json.loads(line) for line in path.read_text().splitlines()]
+    assert span["traceId"] == TRACE_ID
+    assert span["parentId"] == "00f067aa0ba902b7"
+    assert span["name"] == "GET /"
+    assert span["kind"] == "SERVER"
+    assert span["tags"]["http.status_code"] == "200"
+
+
+def test_index_rows_lists_ids_of_small_batches_only(tmp_path, monkeypatch):
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(tracing, "exporter", tracing.JsonFileExporter(path))
+    monkeypatch.setattr(index_sync, "SPAN_MAX_IDS", 2)
+    monkeypatch.setattr(
+        index_sync, "_index_rows", lambda db, rows: ([r.id for r in rows], [], [], [])
+    )
+
+    index_sync.index_rows(None, [SimpleNamespace(id=i) for i in (1, 2)])
+    index_sync.index_rows(None, [SimpleNamespace(id=i) for i in (1, 2, 3)])
+
+    small, large = [json.loads(line)["tags"] for line in path.read_text().splitlines()]
+    assert small["conversations"] == "2"
+    assert small["conversation_ids"] == "[1, 2]"
+    assert large["conversations"] == "3"
+    assert "conversation_ids" not in large
+
+
+def test_searchable_latency_ends_at_last_upsert(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    spans = [
+        {
+            "traceId": TRACE_ID,
+            "name": "POST /api/v1/conversations/",
+            "timestamp": 1_000_000,
+            "duration": 50_000,
+            "tags": {},
+        },
+        {
+            "traceId": TRACE_ID,
+            "name": "vector_store.upsert",
+            "timestamp": 1_400_000,
+            "duration": 100_000,
+            "tags": {},
+        },
+    ]
+    path.write_text("".join(json.dumps(span) + "\n" for span in spans))
+
+    traces = load_traces(path)
+    assert searchable_latency(traces[TRACE_ID]) == 0.5
+    assert searchable_latency(traces[TRACE_ID][:1]) is None
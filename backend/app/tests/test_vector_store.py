@@ -0,0 +1,98 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.db.vector_store import LocalVectorStore
+
+
+def row(conversation_id, embedding):
+    return {
+        "id": conversation_id,
+        "question": f"Question {conversation_id}",
+        "answer": f"Answer {conversation_id}",
+        "embedding": embedding,
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalVectorStore(tmp_path, dim=3, initial_capacity=2)
+
+
+def test_search_ranks_by_cosine_similarity(store):
+    store.upsert(
+        [row(1, [1, 0, 0]), row(2, [0, 1, 0]), row(3, [1, 1, 0]), row(4, [0, 0, 5])]
+    )
+
+    hits = store.search([2, 0.1, 0], limit=2)
+
+    assert [hit["id"] for hit in hits] == [1, 3]
+    assert hits[0]["question"] == "Question 1"
+    assert hits[0]["distance"] == pytest.approx(0.9988, abs=1e-3)
+    assert hits[0]["distance"] > hits[1]["distance"]
+
+
+def test_upsert_replaces_and_delete_removes(store):
+    store.upsert([row(1, [1, 0, 0]), row(2, [0, 1, 0])])
+    store.upsert([row(1, [0, 0, 1])])
+    store.delete([2])
+
+    assert store.count() == 1
+    assert [hit["id"] for hit in store.search([0, 0, 1], limit=5)] == [1]
+    assert store.search([0, 1, 0], limit=5)[0]["distance"] == pytest.approx(0)
+
+
+def test_reopened_store_sees_writes(tmp_path):
+    writer = LocalVectorStore(tmp_path, dim=3, initial_capacity=1)
+    reader = LocalVectorStore(tmp_path, dim=3, initial_capacity=1)
+
+    writer.upsert([row(i, np.eye(3)[i % 3].tolist()) for i in range(5)])
+
+    assert reader.count() == 5
+    assert reader.search([0, 0, 1], limit=1)[0]["id"] == 2
+
+
+def test_forked_child_opens_its_own_connection(store):
+    store.upsert([row(1, [1, 0, 0])])
+    parent_db = store._db()
+
+    pid = os.fork()
+    if pid == 0:
+        # Without the reset the child would write through the parent's connection
+        store.reset_after_fork()
+        ok = store._db() is not parent_db
+        store.upsert([row(2, [0, 1, 0])])
+        os._exit(0 if ok else 1)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert store.search([0, 1, 0], limit=1)[0]["question"] == "Question 2"
+
+
+def test_float16_store_halves_vector_file(tmp_path):
+    store = LocalVectorStore(tmp_path, dim=3, initial_capacity=4, dtype="float16")
+    store.upsert([row(1, [1, 0, 0]), row(2, [0, 1, 0]), row(3, [1, 1, 0])])
+
+    hits = store.search([2, 0.1, 0], limit=2)
+
+    assert [hit["id"] for hit in hits] == [1, 3]
+    assert hits[0]["distance"] == pytest.approx(0.9988, abs=1e-3)
+    assert (tmp_path / "vectors.f16").stat().st_size == 4 * 3 * 2
+
+
+def test_reopening_with_other_dtype_converts_vectors(tmp_path):
+    store = LocalVectorStore(tmp_path, dim=3, initial_capacity=4)
+    store.upsert([row(1, [1, 0, 0]), row(2, [0, 1, 0]), row(3, [1, 1, 0])])
+
+    reopened = LocalVectorStore(tmp_path, dim=3, initial_capacity=4, dtype="float16")
+
+    assert not (tmp_path / "vectors.f32").exists()
+    assert (tmp_path / "vectors.f16").stat().st_size == 4 * 3 * 2
+    hits = reopened.search([2, 0.1, 0], limit=2)
+    assert [hit["id"] for hit in hits] == [1, 3]
+    assert hits[0]["distance"] == pytest.approx(0.9988, abs=1e-3)
+
+    (tmp_path / "vectors.f16").unlink()
+    with pytest.raises(RuntimeError, match="reindex"):
+        LocalVectorStore(tmp_path, dim=3, dtype="float16")
@@ -0,0 +1,282 @@
+import json
+import logging
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, MutableMapping, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv(".env.local")
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = Path(__file__).parent.parent
+
+# "none" only propagates trace context, "json" appends finished spans to
+# TRACE_JSON_PATH, "zipkin" sends them to a Zipkin-compatible collector
+# (Zipkin, Jaeger, or an OpenTelemetry collector with the zipkin receiver)
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none")
+TRACE_JSON_PATH = Path(os.getenv("TRACE_JSON_PATH", ROOT_DIR / "data" / "traces.jsonl"))
+TRACE_ZIPKIN_URL = os.getenv("TRACE_ZIPKIN_URL", "http://localhost:9411/api/v2/spans")
+# Name of this process in exported spans
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "mental-health-api")
+
+# W3C Trace Context header, also used as the Celery message header
+TRACEPARENT_HEADER = "traceparent"
+_TRACEPARENT_PATTERN = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+
+class SpanContext:
+    """Identifies a span within a trace, as carried between processes."""
+
+    __slots__ = ("trace_id", "span_id")
+
+    def __init__(self, trace_id: str, span_id: str):
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    @classmethod
+    def from_traceparent(cls, value: Optional[str]) -> Optional["SpanContext"]:
+        match = _TRACEPARENT_PATTERN.match((value or "").strip().lower())
+        if match is None or set(match.group(1)) == {"0"}:
+            return None
+        return cls(match.group(1), match.group(2))
+
+
+service_name = TRACE_SERVICE_NAME
+
+
+def set_service_name(name: str):
+    """Name spans of this process, unless TRACE_SERVICE_NAME says otherwise."""
+    global service_name
+    if "TRACE_SERVICE_NAME" not in os.environ:
+        service_name = name
+
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    """A timed operation; finished spans are handed to the exporter."""
+
+    __slots__ = (
+        "name",
+        "context",
+        "parent_id",
+        "kind",
+        "start",
+        "duration",
+        "tags",
+        "_started",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        parent: Optional[SpanContext] = None,
+        kind: Optional[str] = None,
+        **tags: Any,
+    ):
+        self.name = name
+        self.context = SpanContext(
+            parent.trace_id if parent else secrets.token_hex(16),
+            secrets.token_hex(8),
+        )
+        self.parent_id = parent.span_id if parent else None
+        self.kind = kind
+        self.start = time.time()
+        self.duration: Optional[float] = None
+        self.tags: Dict[str, str] = {}
+        self._started = time.perf_counter()
+        for key, value in tags.items():
+            self.set_tag(key, value)
+
+    def set_tag(self, key: str, value: Any):
+        self.tags[key] = value if isinstance(value, str) else json.dumps(value)
+
+    def finish(self):
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._started
+            exporter.export(self)
+
+    def to_zipkin(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.context.trace_id,
+            "id": self.context.span_id,
+            "name": self.name,
+            "timestamp": int(self.start * 1_000_000),
+            "duration": max(int((self.duration or 0) * 1_000_000), 1),
+            "localEndpoint": {"serviceName": service_name},
+            "tags": self.tags,
+        }
+        if self.parent_id:
+            span["parentId"] = self.parent_id
+        if self.kind:
+            span["kind"] = self.kind
+        return span
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def activate(span: Span) -> Token:
+    """Make span the parent of spans started in this context."""
+    return _current_span.set(span)
+
+
+def deactivate(token: Token):
+    _current_span.reset(token)
+
+
+@contextmanager
+def start_span(
+    name: str,
+    parent: Optional[SpanContext] = None,
+    kind: Optional[str] = None,
+    **tags: Any,
+) -> Iterator[Span]:
+    """Record the block as a span, a child of parent or of the current span.
+
+    Tasks and threads started with asyncio.create_task or asyncio.to_thread
+    inherit the current span; plain thread pools do not.
+    """
+    if parent is None and current_span() is not None:
+        parent = current_span().context
+    span = Span(name, parent, kind, **tags)
+    token = activate(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.set_tag("error", f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        deactivate(token)
+        span.finish()
+
+
+def inject(headers: MutableMapping[str, Any]) -> MutableMapping[str, Any]:
+    """Add the current span's traceparent to outgoing headers."""
+    span = current_span()
+    if span is not None:
+        headers[TRACEPARENT_HEADER] = span.context.traceparent
+    return headers
+
+
+def extract(headers: Optional[MutableMapping[str, Any]]) -> Optional[SpanContext]:
+    """The remote parent carried in incoming headers, if any."""
+    if not headers:
+        return None
+    return SpanContext.from_traceparent(headers.get(TRACEPARENT_HEADER))
+
+
+class NoopExporter:
+    def export(self, span: Span):
+        pass
+
+
+class JsonFileExporter:
+    """Appends finished spans to a file as Zipkin v2 JSON, one per line.
+
+    Lines are written with a single append, so processes can share the file.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_zipkin()) + "\n"
+        try:
+            with self._lock:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+        except OSError:
+            logger.exception("Could not write span")
+
+
+class ZipkinExporter:
+    """Sends finished spans to a Zipkin v2 endpoint in the background.
+
+    Spans are batched by a thread that is started on first use in each
+    process; when the collector falls behind, new spans are dropped rather
+    than slowing requests down.
+    """
+
+    def __init__(self, url: str, batch_size: int = 100, interval: float = 1.0):
+        self.url = url
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=10000)
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def export(self, span: Span):
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # A forked child inherits neither the thread nor a usable queue
+            self._queue = queue.Queue(maxsize=10000)
+            self._thread = threading.Thread(
+                target=self._run, name="zipkin-exporter", daemon=True
+            )
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def _run(self):
+        with httpx.Client(timeout=5.0) as client:
+            while True:
+                batch: List[Span] = [self._queue.get()]
+                deadline = time.monotonic() + self.interval
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(
+                            self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                        )
+                    except queue.Empty:
+                        break
+                try:
+                    client.post(
+                        self.url, json=[span.to_zipkin() for span in batch]
+                    ).raise_for_status()
+                except httpx.HTTPError as e:
+                    logger.warning(f"Could not send {len(batch)} spans: {e}")
+
+
+def create_exporter(name: str = TRACE_EXPORTER):
+    if name == "json":
+        return JsonFileExporter(TRACE_JSON_PATH)
+    if name == "zipkin":
+        return ZipkinExporter(TRACE_ZIPKIN_URL)
+    if name != "none":
+        raise ValueError(
+            f"Unsupported TRACE_EXPORTER {name}, expected none, json or zipkin"
+        )
+    return NoopExporter()
+
+
+exporter = create_exporter()
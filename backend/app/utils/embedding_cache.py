@@ -0,0 +1,350 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from dotenv import load_dotenv
+
+from app.db.redis_client import get_redis_client
+
+# Load environment variables
+load_dotenv(".env.local")
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = Path(__file__).parent.parent.parent
+
+# Cache configuration
+EMBEDDING_CACHE_BACKEND = os.getenv("EMBEDDING_CACHE_BACKEND", "memory")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "10000"))
+EMBEDDING_CACHE_SHARED_MAX_ENTRIES = int(
+    os.getenv("EMBEDDING_CACHE_SHARED_MAX_ENTRIES", "200000")
+)
+EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", str(7 * 24 * 3600)))
+EMBEDDING_CACHE_PATH = Path(
+    os.getenv("EMBEDDING_CACHE_PATH", ROOT_DIR / "data" / "embedding_cache.sqlite3")
+)
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text so trivially different inputs share a cache entry."""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def cache_key(text: str, model: str) -> str:
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"emb:{model}:{digest}"
+
+
+def content_hash(question: str, answer: str) -> str:
+    """Hash of a conversation's normalized text.
+
+    Used to skip duplicate imports and to tell whether an updated row needs
+    a new embedding.
+    """
+    text = f"{normalize_text(question)}\x1f{normalize_text(answer)}"
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _pack(embedding: Sequence[float]) -> bytes:
+    return np.asarray(embedding, dtype=np.float32).tobytes()
+
+
+def _unpack(data: bytes) -> np.ndarray:
+    # Read-only view of the bytes, so cached vectors cannot be changed in place
+    return np.frombuffer(data, dtype=np.float32)
+
+
+class RedisEmbeddingStore:
+    """Shared cache tier in Redis.
+
+    Size is bounded by the server's maxmemory policy (use allkeys-lru).
+    """
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self.redis = get_redis_client()
+
+    def get_many(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        return [
+            _unpack(value) if value is not None else None
+            for value in self.redis.mget(keys)
+        ]
+
+    def set_many(self, items: Dict[str, Sequence[float]]):
+        pipe = self.redis.pipeline(transaction=False)
+        for key, embedding in items.items():
+            pipe.set(key, _pack(embedding), ex=self.ttl or None)
+        pipe.execute()
+
+    def clear(self):
+        keys = list(self.redis.scan_iter("emb:*"))
+        if keys:
+            self.redis.delete(*keys)
+
+
+class DiskEmbeddingStore:
+    """Shared cache tier in a local SQLite file, usable across processes."""
+
+    def __init__(self, path: Path, ttl: int, max_entries: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(
+                self.path, check_same_thread=False, isolation_level=None
+            )
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "expires_at REAL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_embeddings_accessed_at "
+                "ON embeddings (accessed_at)"
+            )
+        return self._conn
+
+    def get_many(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            placeholders = ",".join("?" * len(keys))
+            rows = dict(
+                conn.execute(
+                    f"SELECT key, value FROM embeddings WHERE key IN ({placeholders}) "
+                    "AND (expires_at IS NULL OR expires_at > ?)",
+                    [*keys, now],
+                ).fetchall()
+            )
+            if rows:
+                conn.executemany(
+                    "UPDATE embeddings SET accessed_at = ? WHERE key = ?",
+                    [(now, key) for key in rows],
+                )
+        return [_unpack(rows[key]) if key in rows else None for key in keys]
+
+    def set_many(self, items: Dict[str, Sequence[float]]):
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl else None
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)",
+                [
+                    (key, _pack(embedding), expires_at, now)
+                    for key, embedding in items.items()
+                ],
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        conn.execute("DELETE FROM embeddings WHERE expires_at <= ?", (now,))
+        (count,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM embeddings WHERE key IN ("
+                "SELECT key FROM embeddings ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def clear(self):
+        with self._lock:
+            self._connection().execute("DELETE FROM embeddings")
+
+
+class EmbeddingCache:
+    """Two-tier embedding cache keyed by model and a hash of the normalized text.
+
+    The first tier is an in-process LRU, the optional second tier is shared
+    between processes. Errors in the shared tier are logged and treated as
+    misses so the cache can never fail an embedding request.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+        ttl: int = EMBEDDING_CACHE_TTL,
+        shared=None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> "EmbeddingCache":
+        shared = None
+        if EMBEDDING_CACHE_BACKEND == "redis":
+            shared = RedisEmbeddingStore(EMBEDDING_CACHE_TTL)
+        elif EMBEDDING_CACHE_BACKEND == "disk":
+            shared = DiskEmbeddingStore(
+                EMBEDDING_CACHE_PATH,
+                EMBEDDING_CACHE_TTL,
+                EMBEDDING_CACHE_SHARED_MAX_ENTRIES,
+            )
+        return cls(shared=shared)
+
+    def _get_local(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            embedding, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return embedding
+
+    def _set_local(self, key: str, embedding: np.ndarray):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (embedding, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_many(self, texts: Sequence[str], model: str) -> List[Optional[np.ndarray]]:
+        """Look up embeddings for texts, None marks a miss."""
+        keys = [cache_key(text, model) for text in texts]
+        found = [self._get_local(key) for key in keys]
+        local_hits = sum(embedding is not None for embedding in found)
+
+        missing = [i for i, embedding in enumerate(found) if embedding is None]
+        shared_hits = 0
+        if missing and self.shared is not None:
+            try:
+                shared_values = self.shared.get_many([keys[i] for i in missing])
+            except Exception:
+                logger.exception("Shared embedding cache lookup failed")
+                shared_values = [None] * len(missing)
+            for i, embedding in zip(missing, shared_values):
+                if embedding is not None:
+                    found[i] = embedding
+                    self._set_local(keys[i], embedding)
+                    shared_hits += 1
+
+        with self._lock:
+            self.hits += local_hits
+            self.shared_hits += shared_hits
+            self.misses += len(texts) - local_hits - shared_hits
+        return found
+
+    def get(self, text: str, model: str) -> Optional[np.ndarray]:
+        return self.get_many([text], model)[0]
+
+    def set_many(self, texts: Sequence[str], embeddings, model: str):
+        items = {}
+        for text, embedding in zip(texts, embeddings):
+            key = cache_key(text, model)
+            embedding = np.asarray(embedding, dtype=np.float32).view()
+            embedding.flags.writeable = False
+            self._set_local(key, embedding)
+            items[key] = embedding
+
+        if items and self.shared is not None:
+            try:
+                self.shared.set_many(items)
+            except Exception:
+                logger.exception("Shared embedding cache write failed")
+
+    def set(self, text: str, model: str, embedding: Sequence[float]):
+        self.set_many([text], [embedding], model)
+
+    def get_or_compute(
+        self, text: str, model: str, compute: Callable[[str], Sequence[float]]
+    ) -> np.ndarray:
+        """Return the cached embedding for text, computing it on a miss."""
+        embedding = self.get(text, model)
+        if embedding is None:
+            embedding = np.asarray(compute(text), dtype=np.float32)
+            self.set(text, model, embedding)
+        return embedding
+
+    async def aget_or_compute(
+        self,
+        text: str,
+        model: str,
+        compute: Callable[[str], Awaitable[Sequence[float]]],
+    ) -> np.ndarray:
+        """Async variant of get_or_compute.
+
+        Shared tier I/O runs in a worker thread so it never blocks the event loop.
+        """
+        if self.shared is None:
+            embedding = self.get(text, model)
+        else:
+            embedding = await asyncio.to_thread(self.get, text, model)
+
+        if embedding is None:
+            embedding = np.asarray(await compute(text), dtype=np.float32)
+            if self.shared is None:
+                self.set(text, model, embedding)
+            else:
+                await asyncio.to_thread(self.set, text, model, embedding)
+        return embedding
+
+    def prewarm(
+        self,
+        texts: Sequence[str],
+        model: str,
+        compute_many: Callable[[List[str]], List[Optional[np.ndarray]]],
+    ) -> int:
+        """Fill the cache for texts that are not cached yet.
+
+        compute_many returns one embedding (or None on failure) per text.
+        Returns the number of entries added.
+        """
+        cached = self.get_many(texts, model)
+        missing = [t for t, e in zip(texts, cached) if e is None]
+        if not missing:
+            return 0
+
+        computed = compute_many(missing)
+        pairs = [(t, e) for t, e in zip(missing, computed) if e is not None]
+        self.set_many([t for t, _ in pairs], [e for _, e in pairs], model)
+        return len(pairs)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.shared_hits = self.misses = 0
+        if self.shared is not None:
+            self.shared.clear()
+
+
+embedding_cache = EmbeddingCache.from_env()
+
+
+def load_prewarm_queries(path: Path) -> List[str]:
+    """Read one query per line, skipping blank lines."""
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
@@ -1,24 +1,407 @@
+import asyncio
+import base64
+import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
 
+import numpy as np
+import openai
+import tiktoken
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
+from pydantic import BaseModel, ConfigDict, field_validator
+
+from app.resources import resources
+from app.utils.embedding_cache import embedding_cache
+from app.utils.rate_limiter import (
+    BACKGROUND,
+    RateLimitExceeded,
+    embedding_limiter,
+)
 
 # Load environment variables
 load_dotenv(".env.local")
 
-# Initialize OpenAI client
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+logger = logging.getLogger(__name__)
 
+# OpenAI clients, created on first use. Calls are retried by embedding_limiter
+openai_client = resources.register(
+    "openai",
+    lambda: OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0),
+    close=OpenAI.close,
+)
+async_openai_client = resources.register(
+    "async_openai",
+    lambda: AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0),
+)
 
-def get_embedding(text: str) -> list:
-    """Get OpenAI embedding for text."""
-    response = openai_client.embeddings.create(
-        input=text, model="text-embedding-ada-002"
+EMBEDDING_MODEL = "text-embedding-ada-002"
+# Per-input limit of the embedding model
+EMBEDDING_MAX_INPUT_TOKENS = 8191
+# Per-request limit on the number of inputs
+EMBEDDING_MAX_BATCH_SIZE = 2048
+# Embeddings are requested base64-encoded and kept as float32 arrays, about
+# 6 KB per vector instead of some 50 KB as a list of Python floats.
+EMBEDDING_ENCODING_FORMAT = "base64"
+EMBEDDING_DTYPE = np.float32
+
+# Batching configuration
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "100000"))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+
+
+def decode_embedding(data) -> np.ndarray:
+    """float32 array from a base64 API embedding, raw bytes or a list of floats."""
+    if isinstance(data, str):
+        data = base64.b64decode(data)
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return np.frombuffer(data, dtype=EMBEDDING_DTYPE)
+    return np.asarray(data, dtype=EMBEDDING_DTYPE)
+
+
+class EmbeddingResult(BaseModel):
+    """Embedding for a single input of a batch, or the reason it failed."""
+
+    index: int
+    embedding: Optional[np.ndarray] = None
+    error: Optional[str] = None
+    # Seconds to wait before retrying, if OpenAI kept rate limiting the input
+    retry_after: Optional[float] = None
+    # The input itself was rejected (empty, too long, refused by the API), so
+    # retrying the same text cannot succeed
+    permanent: bool = False
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    @field_validator("embedding", mode="before")
+    @classmethod
+    def _to_array(cls, value):
+        return None if value is None else decode_embedding(value)
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    try:
+        return tiktoken.encoding_for_model(EMBEDDING_MODEL)
+    except Exception:
+        logger.warning("Could not load tokenizer, falling back to token estimates")
+        return None
+
+
+resources.add_warmup("embedding_tokenizer", _get_encoding)
+# The SDK imports its API resources on first access, which takes longer than
+# creating the client
+resources.add_warmup("openai_embeddings", lambda: openai_client.embeddings)
+
+
+def count_tokens(text: str) -> int:
+    """Count the tokens the embedding model will see for text."""
+    encoding = _get_encoding()
+    if encoding is None:
+        # Roughly 4 characters per token for English; stay on the safe side
+        return len(text) // 3 + 1
+    return len(encoding.encode(text))
+
+
+def combine_question_answer(question: str, answer: str) -> str:
+    """Build the text that is embedded for a question/answer pair."""
+    return f"Question: {question}\nAnswer: {answer}"
+
+
+def _create_embedding(text: str) -> np.ndarray:
+    response = embedding_limiter.call(
+        lambda: openai_client.embeddings.create(
+            input=text,
+            model=EMBEDDING_MODEL,
+            encoding_format=EMBEDDING_ENCODING_FORMAT,
+        ),
+        tokens=count_tokens(text),
     )
-    return response.data[0].embedding
+    return decode_embedding(response.data[0].embedding)
 
 
-def get_combined_embedding(question: str, answer: str) -> list:
+def get_embedding(text: str) -> np.ndarray:
+    """Get OpenAI embedding for text."""
+    return embedding_cache.get_or_compute(text, EMBEDDING_MODEL, _create_embedding)
+
+
+def get_combined_embedding(question: str, answer: str) -> np.ndarray:
     """Get embedding for combined question and answer."""
-    combined_text = f"Question: {question}\nAnswer: {answer}"
-    return get_embedding(combined_text)
+    return get_embedding(combine_question_answer(question, answer))
+
+
+def _plan_batches(
+    texts: Sequence[str], max_tokens_per_request: int
+) -> Tuple[List[List[int]], List[EmbeddingResult]]:
+    """Split texts into request-sized batches of indices.
+
+    Inputs that can never be embedded are returned as failed results instead of
+    being placed in a batch.
+    """
+    batches: List[List[int]] = []
+    rejected: List[EmbeddingResult] = []
+    current: List[int] = []
+    current_tokens = 0
+
+    for index, text in enumerate(texts):
+        if not text or not text.strip():
+            rejected.append(
+                EmbeddingResult(index=index, error="empty input", permanent=True)
+            )
+            continue
+
+        tokens = count_tokens(text)
+        if tokens > EMBEDDING_MAX_INPUT_TOKENS:
+            rejected.append(
+                EmbeddingResult(
+                    index=index,
+                    error=f"input has {tokens} tokens, "
+                    f"limit is {EMBEDDING_MAX_INPUT_TOKENS}",
+                    permanent=True,
+                )
+            )
+            continue
+
+        if current and (
+            current_tokens + tokens > max_tokens_per_request
+            or len(current) >= EMBEDDING_MAX_BATCH_SIZE
+        ):
+            batches.append(current)
+            current, current_tokens = [], 0
+
+        current.append(index)
+        current_tokens += tokens
+
+    if current:
+        batches.append(current)
+
+    return batches, rejected
+
+
+def _rate_limited(
+    indices: List[int], error: RateLimitExceeded
+) -> List[EmbeddingResult]:
+    logger.warning("Embedding batch of %d inputs rate limited: %s", len(indices), error)
+    return [
+        EmbeddingResult(index=i, error=str(error), retry_after=error.retry_after)
+        for i in indices
+    ]
+
+
+def _embed_batch(
+    texts: Sequence[str], indices: List[int], priority: str
+) -> List[EmbeddingResult]:
+    inputs = [texts[i] for i in indices]
+    try:
+        response = embedding_limiter.call(
+            lambda: openai_client.embeddings.create(
+                input=inputs,
+                model=EMBEDDING_MODEL,
+                encoding_format=EMBEDDING_ENCODING_FORMAT,
+            ),
+            tokens=sum(count_tokens(text) for text in inputs),
+            priority=priority,
+        )
+    except openai.BadRequestError as e:
+        if len(indices) == 1:
+            return [EmbeddingResult(index=indices[0], error=str(e), permanent=True)]
+        # Split the batch to isolate the input(s) the API rejected
+        middle = len(indices) // 2
+        return _embed_batch(texts, indices[:middle], priority) + _embed_batch(
+            texts, indices[middle:], priority
+        )
+    except RateLimitExceeded as e:
+        return _rate_limited(indices, e)
+    except Exception as e:
+        logger.exception("Embedding batch of %d inputs failed", len(indices))
+        return [EmbeddingResult(index=i, error=str(e)) for i in indices]
+
+    return [
+        EmbeddingResult(index=indices[item.index], embedding=item.embedding)
+        for item in response.data
+    ]
+
+
+async def _aembed_batch(
+    texts: Sequence[str],
+    indices: List[int],
+    semaphore: asyncio.Semaphore,
+    priority: str,
+) -> List[EmbeddingResult]:
+    inputs = [texts[i] for i in indices]
+    try:
+        async with semaphore:
+            response = await embedding_limiter.acall(
+                lambda: async_openai_client.embeddings.create(
+                    input=inputs,
+                    model=EMBEDDING_MODEL,
+                    encoding_format=EMBEDDING_ENCODING_FORMAT,
+                ),
+                tokens=sum(count_tokens(text) for text in inputs),
+                priority=priority,
+            )
+    except openai.BadRequestError as e:
+        if len(indices) == 1:
+            return [EmbeddingResult(index=indices[0], error=str(e), permanent=True)]
+        middle = len(indices) // 2
+        halves = await asyncio.gather(
+            _aembed_batch(texts, indices[:middle], semaphore, priority),
+            _aembed_batch(texts, indices[middle:], semaphore, priority),
+        )
+        return halves[0] + halves[1]
+    except RateLimitExceeded as e:
+        return _rate_limited(indices, e)
+    except Exception as e:
+        logger.exception("Embedding batch of %d inputs failed", len(indices))
+        return [EmbeddingResult(index=i, error=str(e)) for i in indices]
+
+    return [
+        EmbeddingResult(index=indices[item.index], embedding=item.embedding)
+        for item in response.data
+    ]
+
+
+def _in_input_order(
+    count: int, results: Sequence[EmbeddingResult]
+) -> List[EmbeddingResult]:
+    ordered: List[Optional[EmbeddingResult]] = [None] * count
+    for result in results:
+        ordered[result.index] = result
+    return [
+        result or EmbeddingResult(index=i, error="no embedding returned")
+        for i, result in enumerate(ordered)
+    ]
+
+
+def _split_cached(
+    texts: Sequence[str],
+) -> Tuple[List[EmbeddingResult], List[int]]:
+    """Resolve texts from the embedding cache.
+
+    Returns the cached results and the indices that still need embedding.
+    """
+    cached = embedding_cache.get_many(texts, EMBEDDING_MODEL)
+    hits = [
+        EmbeddingResult(index=i, embedding=embedding)
+        for i, embedding in enumerate(cached)
+        if embedding is not None
+    ]
+    return hits, [i for i, embedding in enumerate(cached) if embedding is None]
+
+
+def _merge_computed(
+    texts: Sequence[str], missing: List[int], computed: List[EmbeddingResult]
+) -> List[EmbeddingResult]:
+    results = [
+        result.model_copy(update={"index": missing[result.index]})
+        for result in computed
+    ]
+    successful = [result for result in results if result.ok]
+    embedding_cache.set_many(
+        [texts[result.index] for result in successful],
+        [result.embedding for result in successful],
+        EMBEDDING_MODEL,
+    )
+    return results
+
+
+def _get_embeddings_uncached(
+    texts: Sequence[str],
+    max_tokens_per_request: int,
+    max_concurrency: int,
+    priority: str,
+) -> List[EmbeddingResult]:
+    batches, results = _plan_batches(texts, max_tokens_per_request)
+
+    if len(batches) == 1:
+        # The usual case for a single conversation, no threads needed
+        results.extend(_embed_batch(texts, batches[0], priority))
+    elif batches:
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            for batch_results in executor.map(
+                lambda indices: _embed_batch(texts, indices, priority), batches
+            ):
+                results.extend(batch_results)
+
+    return results
+
+
+async def _aget_embeddings_uncached(
+    texts: Sequence[str],
+    max_tokens_per_request: int,
+    max_concurrency: int,
+    priority: str,
+) -> List[EmbeddingResult]:
+    batches, results = _plan_batches(texts, max_tokens_per_request)
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    for batch_results in await asyncio.gather(
+        *(_aembed_batch(texts, indices, semaphore, priority) for indices in batches)
+    ):
+        results.extend(batch_results)
+
+    return results
+
+
+def get_embeddings(
+    texts: Sequence[str],
+    max_tokens_per_request: int = EMBEDDING_BATCH_MAX_TOKENS,
+    max_concurrency: int = EMBEDDING_MAX_CONCURRENCY,
+    priority: str = BACKGROUND,
+) -> List[EmbeddingResult]:
+    """Embed many texts using batched, concurrent requests.
+
+    Cached texts are served from the embedding cache. Results are returned in
+    input order. A failure only marks the affected inputs as failed, it never
+    raises. Requests wait for quota of the shared rate limiter at priority.
+    """
+    results, missing = _split_cached(texts)
+    if missing:
+        computed = _get_embeddings_uncached(
+            [texts[i] for i in missing],
+            max_tokens_per_request,
+            max_concurrency,
+            priority,
+        )
+        results.extend(_merge_computed(texts, missing, computed))
+
+    return _in_input_order(len(texts), results)
+
+
+async def aget_embeddings(
+    texts: Sequence[str],
+    max_tokens_per_request: int = EMBEDDING_BATCH_MAX_TOKENS,
+    max_concurrency: int = EMBEDDING_MAX_CONCURRENCY,
+    priority: str = BACKGROUND,
+) -> List[EmbeddingResult]:
+    """Async variant of get_embeddings."""
+    # The shared cache tiers (Redis, SQLite) block, keep them off the loop
+    results, missing = await asyncio.to_thread(_split_cached, texts)
+    if missing:
+        computed = await _aget_embeddings_uncached(
+            [texts[i] for i in missing],
+            max_tokens_per_request,
+            max_concurrency,
+            priority,
+        )
+        results.extend(
+            await asyncio.to_thread(_merge_computed, texts, missing, computed)
+        )
+
+    return _in_input_order(len(texts), results)
+
+
+def get_combined_embeddings(
+    pairs: Sequence[Tuple[str, str]], **kwargs
+) -> List[EmbeddingResult]:
+    """Embed many question/answer pairs, see get_embeddings."""
+    return get_embeddings(
+        [combine_question_answer(question, answer) for question, answer in pairs],
+        **kwargs,
+    )
@@ -0,0 +1,59 @@
+import os
+from pathlib import Path
+from typing import Optional, Sequence
+
+import numpy as np
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv(".env.local")
+
+# .npz written by the embedding_pca_projection Dagster asset. When set, Milvus
+# stores and searches projected vectors, so MILVUS_COLLECTION_NAME must name
+# a collection built with it (app.scripts.reindex creates one).
+EMBEDDING_PROJECTION_PATH = os.getenv("EMBEDDING_PROJECTION_PATH")
+
+
+class EmbeddingProjection:
+    """PCA projection from the embedding model's space to fewer dimensions."""
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray, version: str):
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.asarray(components, dtype=np.float32)
+        self.version = version
+        if self.components.shape[1] != self.mean.shape[0]:
+            raise ValueError(
+                f"Projection components {self.components.shape} do not match "
+                f"mean {self.mean.shape}"
+            )
+
+    @classmethod
+    def load(cls, path: Path) -> "EmbeddingProjection":
+        with np.load(path) as artifact:
+            return cls(
+                artifact["mean"], artifact["components"], str(artifact["version"])
+            )
+
+    @property
+    def input_dim(self) -> int:
+        return self.components.shape[1]
+
+    @property
+    def output_dim(self) -> int:
+        return self.components.shape[0]
+
+    def project(self, embeddings: Sequence[float]) -> np.ndarray:
+        """Project one embedding, or a matrix of them, to output_dim."""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.shape[-1] != self.input_dim:
+            raise ValueError(
+                f"Expected {self.input_dim}-d embeddings, got {embeddings.shape[-1]}"
+            )
+        return (embeddings - self.mean) @ self.components.T
+
+
+embedding_projection: Optional[EmbeddingProjection] = (
+    EmbeddingProjection.load(Path(EMBEDDING_PROJECTION_PATH))
+    if EMBEDDING_PROJECTION_PATH
+    else None
+)
@@ -0,0 +1,308 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Awaitable, Callable, TypeVar
+
+import openai
+from dotenv import load_dotenv
+
+from app.db.redis_client import get_redis_client
+from app.metrics import OPENAI_RETRIES, RATE_LIMIT_WAIT_SECONDS
+
+# Load environment variables
+load_dotenv(".env.local")
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Requests and tokens per minute of the OpenAI quota, shared by every API and
+# worker process through Redis. 0 disables a limit.
+EMBEDDING_RPM_LIMIT = int(os.getenv("EMBEDDING_RPM_LIMIT", "0"))
+EMBEDDING_TPM_LIMIT = int(os.getenv("EMBEDDING_TPM_LIMIT", "0"))
+CHAT_RPM_LIMIT = int(os.getenv("CHAT_RPM_LIMIT", "0"))
+CHAT_TPM_LIMIT = int(os.getenv("CHAT_TPM_LIMIT", "0"))
+# Share of each limit that background work (indexing) leaves to interactive
+# requests, so a bulk import does not slow down /generate
+RATE_LIMIT_INTERACTIVE_RESERVE = float(
+    os.getenv("RATE_LIMIT_INTERACTIVE_RESERVE", "0.2")
+)
+# Seconds of quota that can be spent at once; smaller keeps the rate smooth
+RATE_LIMIT_BURST_SECONDS = float(os.getenv("RATE_LIMIT_BURST_SECONDS", "5"))
+# Longest a call waits for quota before giving up
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "30"))
+# A 429 means the real quota is below the configured one (it may be shared
+# with other applications): the rate is cut by this factor, at most once per
+# RATE_LIMIT_COOLDOWN seconds, and recovers by RATE_LIMIT_RECOVERY per second.
+RATE_LIMIT_DECREASE = float(os.getenv("RATE_LIMIT_DECREASE", "0.7"))
+RATE_LIMIT_COOLDOWN = float(os.getenv("RATE_LIMIT_COOLDOWN", "2"))
+RATE_LIMIT_RECOVERY = float(os.getenv("RATE_LIMIT_RECOVERY", "0.01"))
+RATE_LIMIT_MIN_SCALE = 0.1
+
+# Retries of a call that failed with a 429, a 5xx or a connection error.
+# The OpenAI clients do not retry themselves, so every attempt is counted.
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+OPENAI_RETRY_BASE_DELAY = float(os.getenv("OPENAI_RETRY_BASE_DELAY", "0.5"))
+OPENAI_RETRY_MAX_DELAY = float(os.getenv("OPENAI_RETRY_MAX_DELAY", "30"))
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+# Takes one request and ARGV[3] tokens from both buckets, or returns the
+# seconds until they would be available. Levels refill continuously at the
+# per-minute limits times the adaptive scale, up to RATE_LIMIT_BURST_SECONDS
+# of quota. Uses the Redis clock, so processes need not agree on the time.
+_ACQUIRE_SCRIPT = """
+local rpm, tpm = tonumber(ARGV[1]), tonumber(ARGV[2])
+local cost, reserve = tonumber(ARGV[3]), tonumber(ARGV[4])
+local burst, recovery = tonumber(ARGV[5]), tonumber(ARGV[6])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'requests', 'tokens', 'ts', 'scale')
+local elapsed = math.max(now - (tonumber(state[3]) or now), 0)
+local scale = math.min(1, (tonumber(state[4]) or 1) + elapsed * recovery)
+local wait = 0
+
+local function capacity(limit)
+  return math.max(limit / 60 * burst, 1)
+end
+
+local function refill(limit, level, amount)
+  if limit <= 0 then return 0 end
+  local rate = limit / 60 * scale
+  level = math.min(capacity(limit), (level or capacity(limit)) + elapsed * rate)
+  -- Background requests leave the reserve untouched
+  local needed = math.min(amount + reserve * capacity(limit), capacity(limit))
+  if level < needed then
+    wait = math.max(wait, (needed - level) / rate)
+  end
+  return level
+end
+
+-- A call larger than the bucket waits for a full bucket and empties it
+if tpm > 0 then cost = math.min(cost, capacity(tpm)) end
+local requests = refill(rpm, tonumber(state[1]), 1)
+local tokens = refill(tpm, tonumber(state[2]), cost)
+if wait == 0 then
+  requests = requests - 1
+  tokens = tokens - cost
+end
+redis.call('HSET', KEYS[1], 'requests', requests, 'tokens', tokens,
+           'ts', now, 'scale', scale)
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(wait)
+"""
+
+# Cuts the rate after a 429 and empties the buckets, so every process pauses
+# until the quota has refilled at the lower rate. Returns the new scale.
+_BACKOFF_SCRIPT = """
+local decrease, cooldown = tonumber(ARGV[1]), tonumber(ARGV[2])
+local min_scale = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'scale', 'decreased')
+local scale = tonumber(state[1]) or 1
+if now - (tonumber(state[2]) or 0) >= cooldown then
+  scale = math.max(scale * decrease, min_scale)
+  redis.call('HSET', KEYS[1], 'scale', scale, 'decreased', now,
+             'requests', 0, 'tokens', 0, 'ts', now)
+  redis.call('EXPIRE', KEYS[1], 3600)
+end
+return tostring(scale)
+"""
+
+
+class RateLimitExceeded(Exception):
+    """OpenAI quota was not available in time, or calls kept getting 429s."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """Seconds before the next attempt: the server's hint, else jittered backoff."""
+    response = getattr(error, "response", None)
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        try:
+            if retry_after is not None:
+                return min(float(retry_after), OPENAI_RETRY_MAX_DELAY)
+        except ValueError:
+            pass
+    delay = min(OPENAI_RETRY_BASE_DELAY * 2**attempt, OPENAI_RETRY_MAX_DELAY)
+    return delay * random.uniform(0.5, 1.0)
+
+
+class RateLimiter:
+    """Token buckets for requests and tokens per minute of one OpenAI endpoint.
+
+    The buckets live in Redis so every API and worker process draws from the
+    same quota. Interactive callers may use all of it; background callers
+    wait while less than RATE_LIMIT_INTERACTIVE_RESERVE of a bucket is left.
+    When Redis is unavailable calls go through unlimited.
+    """
+
+    def __init__(self, name: str, rpm: int, tpm: int):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self.key = f"ratelimit:openai:{name}"
+        self._acquire_script = None
+        self._backoff_script = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.rpm > 0 or self.tpm > 0
+
+    def _try_acquire(self, tokens: int, priority: str) -> float:
+        """Take quota for one call, or return the seconds to wait for it."""
+        reserve = RATE_LIMIT_INTERACTIVE_RESERVE if priority == BACKGROUND else 0
+        try:
+            if self._acquire_script is None:
+                self._acquire_script = get_redis_client().register_script(
+                    _ACQUIRE_SCRIPT
+                )
+            return float(
+                self._acquire_script(
+                    keys=[self.key],
+                    args=[
+                        self.rpm,
+                        self.tpm,
+                        tokens,
+                        reserve,
+                        RATE_LIMIT_BURST_SECONDS,
+                        RATE_LIMIT_RECOVERY,
+                    ],
+                )
+            )
+        except Exception as e:
+            logger.warning(f"Rate limiter {self.name} unavailable, not limiting: {e}")
+            return 0.0
+
+    def _check_deadline(self, started: float, wait: float):
+        if time.monotonic() + wait - started > RATE_LIMIT_MAX_WAIT:
+            raise RateLimitExceeded(
+                f"No {self.name} quota within {RATE_LIMIT_MAX_WAIT}s", retry_after=wait
+            )
+
+    def acquire(self, tokens: int = 0, priority: str = INTERACTIVE):
+        """Wait until the quota allows a call of tokens tokens."""
+        if not self.enabled:
+            return
+        started = time.monotonic()
+        wait = self._try_acquire(tokens, priority)
+        while wait > 0:
+            self._check_deadline(started, wait)
+            time.sleep(wait)
+            wait = self._try_acquire(tokens, priority)
+        RATE_LIMIT_WAIT_SECONDS.labels(limiter=self.name, priority=priority).observe(
+            time.monotonic() - started
+        )
+
+    async def aacquire(self, tokens: int = 0, priority: str = INTERACTIVE):
+        """Async variant of acquire."""
+        if not self.enabled:
+            return
+        started = time.monotonic()
+        wait = await asyncio.to_thread(self._try_acquire, tokens, priority)
+        while wait > 0:
+            self._check_deadline(started, wait)
+            await asyncio.sleep(wait)
+            wait = await asyncio.to_thread(self._try_acquire, tokens, priority)
+        RATE_LIMIT_WAIT_SECONDS.labels(limiter=self.name, priority=priority).observe(
+            time.monotonic() - started
+        )
+
+    def backoff(self):
+        """Lower the shared rate after a 429."""
+        if not self.enabled:
+            return
+        try:
+            if self._backoff_script is None:
+                self._backoff_script = get_redis_client().register_script(
+                    _BACKOFF_SCRIPT
+                )
+            scale = float(
+                self._backoff_script(
+                    keys=[self.key],
+                    args=[
+                        RATE_LIMIT_DECREASE,
+                        RATE_LIMIT_COOLDOWN,
+                        RATE_LIMIT_MIN_SCALE,
+                    ],
+                )
+            )
+            logger.warning(f"Rate limited by OpenAI, {self.name} rate now x{scale:.2f}")
+        except Exception as e:
+            logger.warning(f"Rate limiter {self.name} unavailable: {e}")
+
+    def _on_error(self, error: Exception, attempt: int) -> float:
+        """Record a failed attempt; returns the delay before the next one."""
+        rate_limited = isinstance(error, openai.RateLimitError)
+        if rate_limited and getattr(error, "code", None) == "insufficient_quota":
+            # Out of credit, retrying will not help
+            raise error
+        if rate_limited:
+            self.backoff()
+        if attempt >= OPENAI_MAX_RETRIES:
+            if rate_limited:
+                raise RateLimitExceeded(
+                    f"{self.name} still rate limited after {attempt + 1} attempts",
+                    retry_after=_retry_delay(error, attempt),
+                ) from error
+            raise error
+        OPENAI_RETRIES.labels(
+            limiter=self.name,
+            reason="rate_limited" if rate_limited else type(error).__name__,
+        ).inc()
+        delay = _retry_delay(error, attempt)
+        logger.warning(
+            f"OpenAI {self.name} call failed ({error}), retry {attempt + 1} "
+            f"of {OPENAI_MAX_RETRIES} in {delay:.1f}s"
+        )
+        return delay
+
+    def call(
+        self, fn: Callable[[], T], tokens: int = 0, priority: str = INTERACTIVE
+    ) -> T:
+        """Call fn within the quota, retrying 429s, 5xx and connection errors.
+
+        Raises RateLimitExceeded when no quota was available within
+        RATE_LIMIT_MAX_WAIT or the API still answered 429 after the retries.
+        """
+        attempt = 0
+        while True:
+            self.acquire(tokens, priority)
+            try:
+                return fn()
+            except RETRYABLE_ERRORS as e:
+                time.sleep(self._on_error(e, attempt))
+                attempt += 1
+
+    async def acall(
+        self,
+        fn: Callable[[], Awaitable[T]],
+        tokens: int = 0,
+        priority: str = INTERACTIVE,
+    ) -> T:
+        """Async variant of call."""
+        attempt = 0
+        while True:
+            await self.aacquire(tokens, priority)
+            try:
+                return await fn()
+            except RETRYABLE_ERRORS as e:
+                await asyncio.sleep(self._on_error(e, attempt))
+                attempt += 1
+
+
+embedding_limiter = RateLimiter("embeddings", EMBEDDING_RPM_LIMIT, EMBEDDING_TPM_LIMIT)
+chat_limiter = RateLimiter("chat", CHAT_RPM_LIMIT, CHAT_TPM_LIMIT)
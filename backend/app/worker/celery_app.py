@@ -1,9 +1,40 @@
 import logging
 import os
+import time
+from pathlib import Path
 
 from celery import Celery
+from celery.signals import (
+    before_task_publish,
+    task_postrun,
+    task_prerun,
+    worker_init,
+    worker_process_init,
+    worker_process_shutdown,
+)
 from dotenv import load_dotenv
 
+from app.db.database import engine
+from app.db.vector_store import VECTOR_STORE_BACKEND
+from app.metrics import (
+    PROMETHEUS_MULTIPROC_DIR,
+    TASK_SECONDS,
+    WORKER_METRICS_PORT,
+    mark_process_dead,
+    start_metrics_server,
+)
+from app.resources import resources
+from app.tracing import (
+    TRACEPARENT_HEADER,
+    Span,
+    SpanContext,
+    activate,
+    current_span,
+    deactivate,
+    inject,
+    set_service_name,
+)
+
 # Load environment variables
 load_dotenv(".env.local")
 
@@ -18,6 +49,17 @@ celery_app = Celery(
 # Optional configurations
 celery_app.conf.task_routes = {"app.worker.tasks.*": {"queue": "main-queue"}}
 
+# Seconds between runs of the MySQL -> vector index sync, 0 disables it.
+# Scheduled by `celery -A app.worker beat`.
+INDEX_SYNC_INTERVAL = float(os.getenv("INDEX_SYNC_INTERVAL", "60"))
+if INDEX_SYNC_INTERVAL > 0:
+    celery_app.conf.beat_schedule = {
+        "sync-vector-index": {
+            "task": "app.worker.tasks.sync_vector_index",
+            "schedule": INDEX_SYNC_INTERVAL,
+        }
+    }
+
 # Configure logging
 celery_app.conf.update(
     task_track_started=True,
@@ -32,3 +74,91 @@ celery_app.conf.update(
 
 # Add this logging configuration
 logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Clients created in each pool process before it takes its first task
+WORKER_RESOURCES = ["openai", "openai_embeddings", "embedding_tokenizer"]
+if VECTOR_STORE_BACKEND == "milvus":
+    WORKER_RESOURCES.append("milvus")
+
+
+# Start time, span and span activation of running tasks by task id
+_running_tasks = {}
+
+
+@before_task_publish.connect
+def _propagate_trace(headers=None, **kwargs):
+    """Carry the publisher's trace in the message to the worker."""
+    if headers is not None:
+        inject(headers)
+
+
+@task_prerun.connect
+def _start_task(task_id=None, task=None, **kwargs):
+    parent = SpanContext.from_traceparent(
+        getattr(task.request, TRACEPARENT_HEADER, None)
+    )
+    if parent is None and current_span() is not None:
+        # Run eagerly, in the caller's trace
+        parent = current_span().context
+    span = Span(f"task {task.name}", parent, kind="CONSUMER", task_id=task_id)
+    _running_tasks[task_id] = (time.perf_counter(), span, activate(span))
+
+
+@task_postrun.connect
+def _finish_task(task_id=None, task=None, retval=None, state=None, **kwargs):
+    running = _running_tasks.pop(task_id, None)
+    if running is None:
+        return
+    started, span, token = running
+    # Tasks report handled failures by returning False
+    if state == "SUCCESS" and retval is not False:
+        outcome = "success"
+    else:
+        outcome = "retry" if state == "RETRY" else "error"
+    TASK_SECONDS.labels(task=task.name, outcome=outcome).observe(
+        time.perf_counter() - started
+    )
+    span.set_tag("outcome", outcome)
+    deactivate(token)
+    span.finish()
+
+
+@worker_init.connect
+def _init_worker(sender=None, **kwargs):
+    """Name the worker's spans and serve /metrics from its main process.
+
+    Tasks run in forked pool processes, so with the prefork pool set
+    PROMETHEUS_MULTIPROC_DIR to have their samples collected here.
+    """
+    set_service_name("mental-health-worker")
+    if PROMETHEUS_MULTIPROC_DIR:
+        # Samples of a previous run would otherwise be added to this one's
+        for path in Path(PROMETHEUS_MULTIPROC_DIR).glob("*.db"):
+            path.unlink()
+    elif WORKER_METRICS_PORT and "prefork" in str(getattr(sender, "pool_cls", "")):
+        logger.warning(
+            "PROMETHEUS_MULTIPROC_DIR is not set, task metrics of the prefork "
+            "pool processes will not show up on /metrics"
+        )
+    if WORKER_METRICS_PORT:
+        start_metrics_server(WORKER_METRICS_PORT)
+
+
+@worker_process_init.connect
+def _init_worker_process(**kwargs):
+    """Create the clients tasks use, so no task pays for connecting.
+
+    The database connections pooled by the parent are dropped without being
+    closed, as closing them would close them for the parent too.
+    """
+    engine.dispose(close=False)
+    init_times = resources.warm_up(WORKER_RESOURCES)
+    logger.info(f"Worker process {os.getpid()} ready, init times in ms: {init_times}")
+
+
+@worker_process_shutdown.connect
+def _close_worker_process(pid=None, **kwargs):
+    resources.close()
+    engine.dispose()
+    mark_process_dead(pid or os.getpid())
@@ -1,14 +1,73 @@
-import asyncio
+import os
+import random
+from typing import List, Tuple
 
 from celery.utils.log import get_task_logger
 
-from app.client.api_client import APIClient
-from app.db.milvus_client import milvus_client
-from app.utils.embeddings import get_combined_embedding
+from app.db.database import SessionLocal
+from app.db.redis_client import get_redis_client
+from app.models.mental_health_conversation import MentalHealthConversation
+from app.services.index_sync import (
+    IndexingRateLimited,
+    delete_rows,
+    index_rows,
+    sync_index,
+)
 from app.worker.celery_app import celery_app
 
 logger = get_task_logger(__name__)
 
+# Rows embedded and written to the vector store per round in index_conversations
+INDEX_BATCH_SIZE = 500
+
+# "immediate" enqueues one task per change, "batch" collects changes in Redis
+# and flushes them together every INDEX_BATCH_WINDOW seconds or as soon as
+# INDEX_BATCH_MAX_ITEMS are pending.
+INDEXING_MODE = os.getenv("INDEXING_MODE", "immediate")
+INDEX_BATCH_WINDOW = float(os.getenv("INDEX_BATCH_WINDOW", "2.0"))
+INDEX_BATCH_MAX_ITEMS = int(os.getenv("INDEX_BATCH_MAX_ITEMS", "500"))
+
+PENDING_UPSERTS_KEY = "index:pending:upsert"
+PENDING_DELETES_KEY = "index:pending:delete"
+FLUSH_SCHEDULED_KEY = "index:flush:scheduled"
+SYNC_LOCK_KEY = "index:sync:lock"
+# Longest a sync may hold the lock before another run can take over
+SYNC_LOCK_TIMEOUT = int(os.getenv("INDEX_SYNC_LOCK_TIMEOUT", "3600"))
+# Retries of an indexing task whose embeddings OpenAI kept rate limiting
+INDEX_TASK_MAX_RETRIES = int(os.getenv("INDEX_TASK_MAX_RETRIES", "8"))
+
+
+def _retry_countdown(retry_after: float, retries: int) -> float:
+    """Seconds until a rate limited task runs again, spread out between tasks."""
+    return max(retry_after, 2**retries) * random.uniform(1, 2)
+
+
+def _index_batch(
+    conversation_ids: List[int],
+) -> Tuple[List[int], List[int], List[int]]:
+    """Embed and upsert conversations with one query, embedding run and write.
+
+    Returns the ids that are indexed, the ids that no longer exist and the ids
+    whose embedding failed and may succeed later. Conversations whose text is
+    already in the index are not embedded again, and those whose text the API
+    rejected are left out (see index_rows).
+    """
+    with SessionLocal() as db:
+        conversations = (
+            db.query(MentalHealthConversation)
+            .filter(MentalHealthConversation.id.in_(conversation_ids))
+            .all()
+        )
+        found = {conversation.id for conversation in conversations}
+        missing = [i for i in conversation_ids if i not in found]
+        indexed, unchanged, failed, _ = index_rows(db, conversations)
+
+    return indexed + unchanged, missing, failed
+
+
+def _delete_batch(conversation_ids: List[int]):
+    delete_rows(conversation_ids)
+
 
 @celery_app.task(name="app.worker.tasks.index_conversation", bind=True)
 def index_conversation(self, conversation_id: int):
@@ -16,46 +75,19 @@ def index_conversation(self, conversation_id: int):
     logger.info(f"Task ID: {self.request.id}")
     logger.info(f"Starting to index conversation {conversation_id}")
 
-    async def _index():
-        async with APIClient() as client:
-            try:
-                logger.info("Attempting to get conversation from API")
-                conversation = await client.get_conversation(conversation_id)
-                if not conversation:
-                    logger.error(f"Conversation {conversation_id} not found")
-                    return False
-
-                logger.info("Generating embedding")
-                embedding = get_combined_embedding(
-                    question=conversation.question, answer=conversation.answer
-                )
-
-                logger.info("Preparing data for Milvus")
-                data = [
-                    {
-                        "id": conversation_id,
-                        "question": conversation.question,
-                        "answer": conversation.answer,
-                        "embedding": embedding,
-                    }
-                ]
-
-                logger.info("Attempting to insert into Milvus")
-                result = milvus_client.insert(
-                    collection_name="mental_health_conversations", data=data
-                )
-                logger.info(f"Milvus insert result: {result}")
-
-                return True
-
-            except Exception as e:
-                logger.exception(f"Error indexing conversation {conversation_id}")
-                return False
-
     try:
-        return asyncio.run(_index())
+        indexed, missing, _ = _index_batch([conversation_id])
+        if missing:
+            logger.error(f"Conversation {conversation_id} not found")
+        return bool(indexed)
+    except IndexingRateLimited as e:
+        raise self.retry(
+            exc=e,
+            countdown=_retry_countdown(e.retry_after, self.request.retries),
+            max_retries=INDEX_TASK_MAX_RETRIES,
+        )
     except Exception as e:
-        logger.exception("Error in task execution")
+        logger.exception(f"Error indexing conversation {conversation_id}")
         return False
 
 
@@ -65,13 +97,218 @@ def delete_conversation_index(conversation_id: int):
     logger.info(f"Deleting conversation {conversation_id} from vector index")
 
     try:
-        # Delete from Milvus
-        result = milvus_client.delete(
-            collection_name="mental_health_conversations", pks=[conversation_id]
-        )
-        logger.info(f"Deleted conversation {conversation_id} from Milvus")
+        _delete_batch([conversation_id])
+        logger.info(f"Deleted conversation {conversation_id} from vector index")
         return True
 
     except Exception as e:
         logger.error(f"Error deleting conversation {conversation_id}: {e}")
         return False
+
+
+@celery_app.task(name="app.worker.tasks.index_conversations", bind=True)
+def index_conversations(
+    self, conversation_ids: List[int], indexed: int = 0, failed: int = 0
+):
+    """Index many conversations with batched embedding and vector store writes.
+
+    indexed and failed carry the counts of earlier attempts over to a retry.
+    """
+    logger.info(f"Task ID: {self.request.id}")
+    logger.info(f"Starting to index {len(conversation_ids)} conversations")
+
+    for start in range(0, len(conversation_ids), INDEX_BATCH_SIZE):
+        batch_ids = conversation_ids[start : start + INDEX_BATCH_SIZE]
+        try:
+            batch_indexed, _, _ = _index_batch(batch_ids)
+            indexed += len(batch_indexed)
+            failed += len(batch_ids) - len(batch_indexed)
+            logger.info(f"Indexed {indexed} conversations, {failed} failed")
+
+        except IndexingRateLimited as e:
+            # Carry on later with what is left; the rest of this batch is written
+            indexed += len(e.indexed)
+            failed += len(batch_ids) - len(e.indexed) - len(e.conversation_ids)
+            remaining = (
+                e.conversation_ids + conversation_ids[start + INDEX_BATCH_SIZE :]
+            )
+            logger.warning(
+                f"Rate limited, retrying {len(remaining)} conversations later"
+            )
+            raise self.retry(
+                args=[remaining],
+                kwargs={"indexed": indexed, "failed": failed},
+                exc=e,
+                countdown=_retry_countdown(e.retry_after, self.request.retries),
+                max_retries=INDEX_TASK_MAX_RETRIES,
+            )
+
+        except Exception:
+            logger.exception(f"Error indexing batch starting at {batch_ids[0]}")
+            failed += len(batch_ids)
+
+    return {"indexed": indexed, "failed": failed}
+
+
+def _schedule_flush(pending: int):
+    """Make sure a flush runs within the batch window, or now if the batch is full."""
+    redis = get_redis_client()
+    if pending >= INDEX_BATCH_MAX_ITEMS:
+        flush_index_queue.delay()
+    elif redis.set(FLUSH_SCHEDULED_KEY, 1, nx=True, ex=int(INDEX_BATCH_WINDOW) + 60):
+        flush_index_queue.apply_async(countdown=INDEX_BATCH_WINDOW)
+
+
+def enqueue_index(conversation_id: int):
+    """Queue a conversation for (re-)indexing according to INDEXING_MODE.
+
+    A failure to enqueue is logged rather than raised: the change is already
+    committed and sync_vector_index picks it up from updated_at.
+    """
+    try:
+        _enqueue_index(conversation_id)
+    except Exception:
+        logger.exception(
+            f"Could not queue conversation {conversation_id} for indexing, "
+            "leaving it to the index sync"
+        )
+
+
+def _enqueue_index(conversation_id: int):
+    if INDEXING_MODE != "batch":
+        index_conversation.delay(conversation_id)
+        return
+
+    redis = get_redis_client()
+    pipe = redis.pipeline()
+    pipe.srem(PENDING_DELETES_KEY, conversation_id)
+    pipe.sadd(PENDING_UPSERTS_KEY, conversation_id)
+    pipe.scard(PENDING_UPSERTS_KEY)
+    _schedule_flush(pipe.execute()[-1])
+
+
+def enqueue_delete(conversation_id: int):
+    """Queue a conversation for removal from the index according to INDEXING_MODE.
+
+    Like enqueue_index, failures are left to sync_vector_index, which removes
+    deleted conversations from their tombstones.
+    """
+    try:
+        _enqueue_delete(conversation_id)
+    except Exception:
+        logger.exception(
+            f"Could not queue deletion of conversation {conversation_id}, "
+            "leaving it to the index sync"
+        )
+
+
+def _enqueue_delete(conversation_id: int):
+    if INDEXING_MODE != "batch":
+        delete_conversation_index.delay(conversation_id)
+        return
+
+    redis = get_redis_client()
+    pipe = redis.pipeline()
+    pipe.srem(PENDING_UPSERTS_KEY, conversation_id)
+    pipe.sadd(PENDING_DELETES_KEY, conversation_id)
+    pipe.scard(PENDING_DELETES_KEY)
+    _schedule_flush(pipe.execute()[-1])
+
+
+@celery_app.task(name="app.worker.tasks.flush_index_queue")
+def flush_index_queue(retries: int = 0):
+    """Apply all pending index/delete requests in batches.
+
+    Each round loads up to INDEX_BATCH_MAX_ITEMS rows with one query, embeds
+    them in one batch and writes them with one upsert and one delete call.
+    Ids of a failed round are put back and a new flush is scheduled.
+    Conversations whose embedding was rate limited or failed for another
+    passing reason are put back for a later flush, which waits longer each
+    time; retries counts the flushes in a row that left such rows. After
+    INDEX_TASK_MAX_RETRIES they are left to sync_vector_index. Conversations
+    whose text the API rejected are not retried.
+    """
+    redis = get_redis_client()
+    # Let new requests schedule their own flush from here on
+    redis.delete(FLUSH_SCHEDULED_KEY)
+
+    indexed = deleted = failed = 0
+    retry_ids: List[int] = []
+    retry_after = 0.0
+    while True:
+        pipe = redis.pipeline()
+        pipe.spop(PENDING_UPSERTS_KEY, INDEX_BATCH_MAX_ITEMS)
+        pipe.spop(PENDING_DELETES_KEY, INDEX_BATCH_MAX_ITEMS)
+        upsert_ids, delete_ids = pipe.execute()
+        upsert_ids = sorted(int(i) for i in upsert_ids or [])
+        delete_ids = sorted(int(i) for i in delete_ids or [])
+        if not upsert_ids and not delete_ids:
+            break
+
+        try:
+            missing = []
+            if upsert_ids:
+                batch_indexed, missing, batch_failed = _index_batch(upsert_ids)
+                indexed += len(batch_indexed)
+                failed += len(batch_failed)
+                retry_ids += batch_failed
+            # Rows deleted since they were queued are removed as well
+            delete_ids = sorted(set(delete_ids) | set(missing))
+            if delete_ids:
+                _delete_batch(delete_ids)
+                deleted += len(delete_ids)
+        except IndexingRateLimited as e:
+            # Only the rate limited rows and the deletes of this round are left
+            indexed += len(e.indexed)
+            logger.warning(str(e))
+            retry_ids += e.conversation_ids
+            retry_after = e.retry_after
+            if delete_ids:
+                redis.sadd(PENDING_DELETES_KEY, *delete_ids)
+            break
+        except Exception:
+            logger.exception("Error flushing index queue, re-queueing batch")
+            if upsert_ids:
+                redis.sadd(PENDING_UPSERTS_KEY, *upsert_ids)
+            if delete_ids:
+                redis.sadd(PENDING_DELETES_KEY, *delete_ids)
+            _schedule_flush(0)
+            break
+
+    if retry_ids and retries < INDEX_TASK_MAX_RETRIES:
+        logger.warning(f"Could not embed conversations {retry_ids}, retrying later")
+        redis.sadd(PENDING_UPSERTS_KEY, *retry_ids)
+        countdown = _retry_countdown(retry_after, retries)
+        # Flushes requested in the meantime would only fail the same way
+        redis.set(FLUSH_SCHEDULED_KEY, 1, ex=int(countdown) + 60)
+        flush_index_queue.apply_async(
+            countdown=countdown, kwargs={"retries": retries + 1}
+        )
+    elif retry_ids:
+        logger.warning(
+            f"Could not embed conversations {retry_ids} after {retries} retries, "
+            "leaving them to the index sync"
+        )
+
+    logger.info(
+        f"Flushed index queue: {indexed} indexed, {deleted} deleted, "
+        f"{failed} failed"
+    )
+    return {"indexed": indexed, "deleted": deleted, "failed": failed}
+
+
+@celery_app.task(name="app.worker.tasks.sync_vector_index")
+def sync_vector_index():
+    """Reconcile the vector index with MySQL from the updated_at watermark.
+
+    Scheduled by Celery beat every INDEX_SYNC_INTERVAL seconds; overlapping
+    runs are skipped.
+    """
+    lock = get_redis_client().lock(SYNC_LOCK_KEY, timeout=SYNC_LOCK_TIMEOUT)
+    if not lock.acquire(blocking=False):
+        logger.info("Index sync already running, skipping")
+        return None
+    try:
+        return sync_index()
+    finally:
+        lock.release()
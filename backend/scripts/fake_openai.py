@@ -0,0 +1,252 @@
+"""Local stand-in for the OpenAI embeddings and chat completions API.
+
+Run from the backend directory:
+
+    poetry run python -m scripts.fake_openai --port 8100 --completion-latency-ms 400
+
+and point the API and the worker at it with OPENAI_BASE_URL=http://localhost:8100/v1.
+
+Embeddings are unit vectors seeded by a hash of the input, so the same text
+always gets the same vector. Completions are made of words picked with a hash
+of the messages, streamed one word per chunk when requested. Latencies are
+simulated with sleeps and can be made to vary by --jitter, and a share of the
+requests can be answered with 429 to exercise rate limit handling.
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import time
+from typing import Any, Dict, List, Union
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+WORDS = (
+    "it sounds like you are carrying a lot right now and that is okay "
+    "many people feel this way when sleep stress and worry build up together "
+    "try to notice what helps even a little and talk with someone you trust "
+    "a counselor can help you find small steps that fit your life"
+).split()
+
+
+class FakeOpenAIConfig(BaseModel):
+    embedding_latency: float = 0.05
+    # Until the first token
+    completion_latency: float = 0.3
+    # Between streamed tokens, and per token of a non-streamed completion
+    token_latency: float = 0.0
+    completion_tokens: int = 60
+    dim: int = 1536
+    # Latencies vary uniformly by +- this fraction
+    jitter: float = 0.0
+    # Share of requests answered with 429
+    error_rate: float = 0.0
+
+
+def _seed(*parts: str) -> int:
+    digest = hashlib.sha256("\x00".join(parts).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "little")
+
+
+def fake_embedding(text: str, dim: int) -> np.ndarray:
+    vector = np.random.default_rng(_seed(text)).standard_normal(dim)
+    return (vector / np.linalg.norm(vector)).astype(np.float32)
+
+
+def fake_completion(messages: List[Dict[str, Any]], tokens: int) -> List[str]:
+    """Words of the completion; the same messages always get the same words."""
+    rng = random.Random(_seed(json.dumps(messages, sort_keys=True)))
+    return [rng.choice(WORDS) + " " for _ in range(tokens)]
+
+
+def _count_tokens(text: Union[str, List[str]]) -> int:
+    texts = [text] if isinstance(text, str) else text
+    return sum(len(text.split()) for text in texts)
+
+
+def create_app(config: FakeOpenAIConfig = FakeOpenAIConfig()) -> FastAPI:
+    app = FastAPI(title="Fake OpenAI")
+    app.state.config = config
+    app.state.requests = {"embeddings": 0, "chat": 0, "rate_limited": 0}
+
+    async def sleep(seconds: float):
+        if config.jitter:
+            seconds *= random.uniform(1 - config.jitter, 1 + config.jitter)
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+    def rate_limited() -> bool:
+        if config.error_rate and random.random() < config.error_rate:
+            app.state.requests["rate_limited"] += 1
+            return True
+        return False
+
+    def too_many_requests() -> JSONResponse:
+        return JSONResponse(
+            status_code=429,
+            headers={"retry-after": "1"},
+            content={
+                "error": {
+                    "message": "Rate limit reached (fake)",
+                    "type": "requests",
+                    "code": "rate_limit_exceeded",
+                }
+            },
+        )
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        if rate_limited():
+            return too_many_requests()
+        app.state.requests["embeddings"] += 1
+        inputs = body["input"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dim = body.get("dimensions") or config.dim
+        await sleep(config.embedding_latency)
+
+        data = []
+        for index, text in enumerate(inputs):
+            vector = fake_embedding(text, dim)
+            embedding = (
+                base64.b64encode(vector.tobytes()).decode("ascii")
+                if body.get("encoding_format") == "base64"
+                else vector.tolist()
+            )
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        tokens = _count_tokens(inputs)
+        return {
+            "object": "list",
+            "data": data,
+            "model": body["model"],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        if rate_limited():
+            return too_many_requests()
+        app.state.requests["chat"] += 1
+        count = config.completion_tokens
+        if body.get("max_tokens"):
+            count = min(count, body["max_tokens"])
+        tokens = fake_completion(body["messages"], count)
+        prompt_tokens = _count_tokens(
+            [str(message.get("content", "")) for message in body["messages"]]
+        )
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens),
+        }
+        completion_id = f"chatcmpl-fake-{_seed(*tokens):x}"
+        created = int(time.time())
+        await sleep(config.completion_latency)
+
+        if not body.get("stream"):
+            await sleep(config.token_latency * len(tokens))
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": body["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "".join(tokens)},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": usage,
+            }
+
+        def chunk(choices: List[Dict[str, Any]], **fields) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": body["model"],
+                "choices": choices,
+                **fields,
+            }
+            return f"data: {json.dumps(payload)}\n\n"
+
+        def choice(delta: Dict[str, Any], finish_reason=None) -> Dict[str, Any]:
+            return {"index": 0, "delta": delta, "finish_reason": finish_reason}
+
+        async def events():
+            yield chunk([choice({"role": "assistant", "content": ""})])
+            for i, token in enumerate(tokens):
+                if i:
+                    await sleep(config.token_latency)
+                yield chunk([choice({"content": token})])
+            yield chunk([choice({}, "stop")])
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield chunk([], usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        return app.state.requests
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--embedding-latency-ms", type=float, default=50)
+    parser.add_argument(
+        "--completion-latency-ms",
+        type=float,
+        default=300,
+        help="Time to the first token (default: 300)",
+    )
+    parser.add_argument(
+        "--token-latency-ms",
+        type=float,
+        default=0,
+        help="Time per further token (default: 0)",
+    )
+    parser.add_argument("--completion-tokens", type=int, default=60)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=0.0,
+        help="Vary latencies uniformly by +- this fraction (default: 0)",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Share of requests answered with 429 (default: 0)",
+    )
+    args = parser.parse_args()
+
+    config = FakeOpenAIConfig(
+        embedding_latency=args.embedding_latency_ms / 1000,
+        completion_latency=args.completion_latency_ms / 1000,
+        token_latency=args.token_latency_ms / 1000,
+        completion_tokens=args.completion_tokens,
+        dim=args.dim,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
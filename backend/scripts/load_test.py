@@ -0,0 +1,362 @@
+"""Load test the API at a target request rate and compare with a baseline.
+
+Run from the backend directory, against an API and worker that use the local
+stand-ins for OpenAI and Milvus (see "Load Testing" in the readme):
+
+    poetry run python -m scripts.load_test --rps 20 --duration 60 --output results.json
+    poetry run python -m scripts.load_test --rps 20 --duration 60 --baseline results.json
+
+Requests are started on a fixed schedule, whether or not earlier ones have
+finished, and their latency is measured from the scheduled start, so a
+server that falls behind shows up in the percentiles instead of lowering
+the request rate. The operations are drawn at random with the weights of
+--mix. "index" creates --index-batch conversations in one bulk request and
+waits until the worker has indexed them.
+
+With --baseline, an operation whose p95 or p99 grew, or whose throughput
+dropped, by more than --tolerance, or whose error rate grew by more than one
+percentage point, is reported as a regression and the exit status is 1.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+from celery.result import AsyncResult
+
+from app.client.api_client import APIClient
+from app.schemas.mental_health_conversation import (
+    MentalHealthConversationBulkCreate,
+    MentalHealthConversationBulkCreateResponse,
+    MentalHealthConversationCreate,
+)
+from app.worker.celery_app import celery_app
+
+DEFAULT_MIX = "create=2,read=4,list=1,update=1,delete=0.5,generate=2,stream=1,index=0.2"
+
+TOPICS = [
+    "sleep",
+    "anxiety at work",
+    "grief",
+    "panic attacks",
+    "loneliness",
+    "my relationship",
+    "exam stress",
+    "low motivation",
+]
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for item in mix.split(","):
+        name, weight = item.split("=")
+        weights[name.strip()] = float(weight)
+    unknown = set(weights) - set(OPERATIONS)
+    if unknown:
+        raise ValueError(f"Unknown operations {sorted(unknown)}")
+    return weights
+
+
+def make_conversation(rng: random.Random) -> MentalHealthConversationCreate:
+    topic = rng.choice(TOPICS)
+    return MentalHealthConversationCreate(
+        question=f"How do I cope with {topic}? (load test {rng.randrange(10**9)})",
+        answer=f"Coping with {topic} takes time. Start with small, regular steps.",
+    )
+
+
+class LoadTest:
+    def __init__(
+        self,
+        client: APIClient,
+        rng: random.Random,
+        distinct_questions: int,
+        index_batch: int,
+        index_timeout: float,
+    ):
+        self.client = client
+        self.rng = rng
+        self.distinct_questions = distinct_questions
+        self.index_batch = index_batch
+        self.index_timeout = index_timeout
+        # Conversations created by this run, for reads, updates and deletes
+        self.ids: List[int] = []
+
+    def question(self) -> str:
+        # Repeats among distinct_questions exercise the response caches
+        number = self.rng.randrange(self.distinct_questions)
+        return f"I keep struggling with {TOPICS[number % len(TOPICS)]} ({number})"
+
+    def pick_id(self) -> Optional[int]:
+        return self.rng.choice(self.ids) if self.ids else None
+
+    async def create(self):
+        conversation = make_conversation(self.rng)
+        created = await self.client.create_conversation(
+            conversation.question, conversation.answer
+        )
+        self.ids.append(created.id)
+
+    async def read(self):
+        conversation_id = self.pick_id()
+        if conversation_id is not None:
+            await self.client.get_conversation(conversation_id)
+
+    async def list(self):
+        await self.client.get_conversations_page(limit=20)
+
+    async def update(self):
+        conversation_id = self.pick_id()
+        if conversation_id is not None:
+            conversation = make_conversation(self.rng)
+            await self.client.update_conversation(
+                conversation_id, conversation.question, conversation.answer
+            )
+
+    async def delete(self):
+        if self.ids:
+            conversation_id = self.ids.pop(self.rng.randrange(len(self.ids)))
+            await self.client.delete_conversation(conversation_id)
+
+    async def generate(self):
+        await self.client.generate_conversation_response(self.question())
+
+    async def stream(self):
+        async for _ in self.client.stream_conversation_response(self.question()):
+            pass
+
+    async def index(self):
+        request = MentalHealthConversationBulkCreate(
+            conversations=[make_conversation(self.rng) for _ in range(self.index_batch)]
+        )
+        response = await self.client.client.post(
+            "/api/v1/conversations/bulk", json=request.model_dump(), timeout=60.0
+        )
+        response.raise_for_status()
+        created = MentalHealthConversationBulkCreateResponse.model_validate(
+            response.json()
+        )
+        self.ids.extend(created.ids)
+        result = await asyncio.to_thread(
+            AsyncResult(created.task_id, app=celery_app).get,
+            timeout=self.index_timeout,
+        )
+        if result["failed"]:
+            raise RuntimeError(f"{result['failed']} conversations were not indexed")
+
+
+OPERATIONS: Dict[str, Callable[[LoadTest], Awaitable[None]]] = {
+    "create": LoadTest.create,
+    "read": LoadTest.read,
+    "list": LoadTest.list,
+    "update": LoadTest.update,
+    "delete": LoadTest.delete,
+    "generate": LoadTest.generate,
+    "stream": LoadTest.stream,
+    "index": LoadTest.index,
+}
+
+
+def summarize(
+    latencies: Dict[str, List[float]], errors: Dict[str, int], duration: float
+) -> Dict[str, Dict[str, Any]]:
+    """Throughput, error rate and latency percentiles in ms per operation."""
+    results = {}
+    for name in sorted(set(latencies) | set(errors)):
+        samples = np.array(latencies.get(name, []))
+        total = len(samples) + errors.get(name, 0)
+        summary = {
+            "requests": total,
+            "errors": errors.get(name, 0),
+            "error_rate": round(errors.get(name, 0) / total, 4),
+            "throughput": round(len(samples) / duration, 2),
+        }
+        for percentile in (50, 95, 99):
+            summary[f"p{percentile}_ms"] = (
+                round(float(np.percentile(samples, percentile)) * 1000, 1)
+                if len(samples)
+                else None
+            )
+        results[name] = summary
+    return results
+
+
+def compare(
+    results: Dict[str, Dict[str, Any]],
+    baseline: Dict[str, Dict[str, Any]],
+    tolerance: float,
+) -> List[str]:
+    """Regressions of results against baseline, as messages."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            if result[key] is not None and before[key]:
+                if result[key] > before[key] * (1 + tolerance):
+                    regressions.append(
+                        f"{name}: {key} {before[key]} -> {result[key]} "
+                        f"(+{result[key] / before[key] - 1:.0%})"
+                    )
+        if result["throughput"] < before["throughput"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {before['throughput']} -> {result['throughput']}/s"
+            )
+        if result["error_rate"] > before["error_rate"] + 0.01:
+            regressions.append(
+                f"{name}: error rate {before['error_rate']:.2%} -> "
+                f"{result['error_rate']:.2%}"
+            )
+    return regressions
+
+
+async def run(
+    base_url: str,
+    rps: float,
+    duration: float,
+    mix: Dict[str, float],
+    seed: int,
+    warmup_conversations: int,
+    **options,
+) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    error_messages: Dict[str, str] = {}
+
+    async with APIClient(base_url=base_url) as client:
+        load_test = LoadTest(client, rng, **options)
+        if warmup_conversations:
+            load_test.ids.extend(
+                await client.create_conversations_bulk(
+                    [make_conversation(rng) for _ in range(warmup_conversations)]
+                )
+            )
+
+        async def request(name: str, scheduled: float):
+            try:
+                await OPERATIONS[name](load_test)
+            except Exception as e:
+                errors[name] += 1
+                error_messages.setdefault(name, f"{type(e).__name__}: {e}")
+            else:
+                latencies[name].append(time.perf_counter() - scheduled)
+
+        names, weights = zip(*mix.items())
+        tasks = []
+        start = time.perf_counter()
+        for i in range(int(rps * duration)):
+            scheduled = start + i / rps
+            await asyncio.sleep(max(scheduled - time.perf_counter(), 0))
+            name = rng.choices(names, weights)[0]
+            tasks.append(asyncio.create_task(request(name, scheduled)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    for name, message in error_messages.items():
+        print(f"First {name} error: {message}")
+    return {
+        "rps": rps,
+        "duration": round(elapsed, 2),
+        "operations": summarize(latencies, errors, elapsed),
+    }
+
+
+def print_results(results: Dict[str, Any]):
+    print(f"\nTarget {results['rps']} requests/s, took {results['duration']}s")
+    print(
+        f"{'operation':<10} {'requests':>8} {'errors':>7} {'ok/s':>8} "
+        f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    )
+    for name, result in results["operations"].items():
+        print(
+            f"{name:<10} {result['requests']:>8} {result['errors']:>7} "
+            f"{result['throughput']:>8} "
+            + " ".join(
+                f"{result[key] if result[key] is not None else '-':>9}"
+                for key in ("p50_ms", "p95_ms", "p99_ms")
+            )
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--rps", type=float, default=10, help="Requests per second")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds")
+    parser.add_argument(
+        "--mix",
+        default=DEFAULT_MIX,
+        help=f"Weights of the operations (default: {DEFAULT_MIX})",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--distinct-questions",
+        type=int,
+        default=1000,
+        help="Questions asked by generate and stream (default: 1000)",
+    )
+    parser.add_argument(
+        "--warmup-conversations",
+        type=int,
+        default=50,
+        help="Conversations created before the run (default: 50)",
+    )
+    parser.add_argument("--index-batch", type=int, default=10)
+    parser.add_argument("--index-timeout", type=float, default=60)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare with the results in this file")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Allowed relative change before flagging a regression (default: 0.2)",
+    )
+    args = parser.parse_args()
+    # Importing the Celery app turns on debug logging, one line per request
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = asyncio.run(
+        run(
+            args.base_url,
+            args.rps,
+            args.duration,
+            parse_mix(args.mix),
+            args.seed,
+            args.warmup_conversations,
+            distinct_questions=args.distinct_questions,
+            index_batch=args.index_batch,
+            index_timeout=args.index_timeout,
+        )
+    )
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(
+            results["operations"], baseline["operations"], args.tolerance
+        )
+        if regressions:
+            print(f"\nRegressions against {args.baseline}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
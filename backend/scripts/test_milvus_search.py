@@ -1,74 +1,413 @@
-import os
-from typing import List
+"""Search and benchmark the Milvus conversation index.
 
-import openai
-from dotenv import load_dotenv
-from pymilvus import Collection, connections
+Run from the backend directory:
 
-# Load environment variables from .env.local
-load_dotenv(".env.local")
+    poetry run python -m scripts.test_milvus_search search "feeling anxious"
+    poetry run python -m scripts.test_milvus_search benchmark --synthetic 20000
+    poetry run python -m scripts.test_milvus_search quantization --synthetic 20000
 
-# Configure OpenAI
-openai.api_key = os.getenv("OPENAI_API_KEY")
+The benchmark copies vectors (from the live collection, or synthetic ones) into
+a scratch collection and, for every index configuration, reports recall@k
+against exact brute-force search together with p50/p99 latency and QPS.
+Use --vector-type FLOAT16_VECTOR to store them as float16.
 
+The quantization report needs no index: it measures in NumPy how much
+recall@k float16 and 8-bit scalar quantization (as in IVF_SQ8) cost compared
+to float32 vectors, and how many bytes each stores per vector.
+"""
 
-def get_embedding(text: str) -> List[float]:
-    """Get embedding from OpenAI API"""
-    response = openai.embeddings.create(model="text-embedding-ada-002", input=text)
-    return response.data[0].embedding
+import argparse
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
 
+import numpy as np
+from pymilvus import DataType
 
-def search_conversations(query: str, limit: int = 5):
-    """Search for similar conversations in Milvus"""
-    try:
-        # Connect to Milvus
-        connections.connect(alias="default", uri=os.getenv("MILVUS_URI"))
+from app.db.milvus_client import (
+    COLLECTION_NAME,
+    EMBEDDING_DIM,
+    VECTOR_DTYPES,
+    build_index_params,
+    build_search_params,
+    get_similar_conversations,
+    milvus_client,
+    rebuild_index,
+    to_milvus_vector,
+)
 
-        # Get the collection
-        collection = Collection(os.getenv("MILVUS_COLLECTION_NAME"))
-        collection.load()
+BENCHMARK_COLLECTION_NAME = f"{COLLECTION_NAME}_benchmark"
 
-        # Get embedding for the query
-        query_embedding = get_embedding(query)
 
-        # Search in Milvus
-        search_params = {
-            "metric_type": "COSINE",
-            "params": {"nprobe": 10},
-        }
+def search_conversations(query: str, limit: int = 5):
+    """Search for similar conversations in Milvus"""
+    from app.utils.embeddings import get_embedding
 
-        results = collection.search(
-            data=[query_embedding],
-            anns_field="embedding",
-            param=search_params,
-            limit=limit,
-            output_fields=["id", "question", "answer"],
-        )
+    try:
+        results = get_similar_conversations(get_embedding(query), limit=limit)
 
         # Print results with more details
         print(f"\nSearch results for query: '{query}'")
         print("-" * 50)
-        for hits in results:
-            for hit in hits:
-                print(f"ID: {hit.entity.get('id')}")
-                print(f"Question: {hit.entity.get('question')}")
-                print(f"Answer: {hit.entity.get('answer')}")
-                print(f"Distance: {hit.distance}")
-                print("-" * 30)
+        for hit in results:
+            print(f"ID: {hit['id']}")
+            print(f"Question: {hit['question']}")
+            print(f"Answer: {hit['answer']}")
+            print(f"Distance: {hit['distance']}")
+            print("-" * 30)
 
     except Exception as e:
         print(f"Error: {e}")
-    finally:
-        connections.disconnect("default")
 
 
-if __name__ == "__main__":
-    # Example searches
-    search_queries = [
-        "feeling anxious about work",
-        "dealing with depression",
-        "relationship problems",
+def load_collection_vectors(limit: Optional[int] = None) -> np.ndarray:
+    """Read the embeddings stored in the live collection."""
+    iterator = milvus_client.query_iterator(
+        collection_name=COLLECTION_NAME,
+        batch_size=1000,
+        limit=limit or -1,
+        output_fields=["embedding"],
+    )
+    vectors = []
+    while True:
+        batch = iterator.next()
+        if not batch:
+            iterator.close()
+            break
+        vectors.extend(row["embedding"] for row in batch)
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def synthetic_vectors(count: int, dim: int, seed: int = 0) -> np.ndarray:
+    """Clustered random vectors, closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(count // 100, 1), dim)).astype(np.float32)
+    assignments = rng.integers(0, len(centers), count)
+    noise = rng.standard_normal((count, dim)).astype(np.float32)
+    return centers[assignments] + 0.5 * noise
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def make_queries(vectors: np.ndarray, count: int, seed: int = 1) -> np.ndarray:
+    """Perturbed copies of stored vectors, so queries resemble real traffic."""
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.integers(0, len(vectors), count)]
+    scale = np.linalg.norm(sample, axis=1, keepdims=True) / math.sqrt(vectors.shape[1])
+    return sample + 0.3 * scale * rng.standard_normal(sample.shape).astype(np.float32)
+
+
+def exact_neighbors(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Ground-truth top-k ids (row numbers) by cosine similarity."""
+    scores = normalize(queries) @ normalize(vectors).T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+def create_benchmark_collection(
+    vectors: np.ndarray,
+    vector_type: str = "FLOAT_VECTOR",
+    insert_batch_size: int = 1000,
+):
+    if milvus_client.has_collection(BENCHMARK_COLLECTION_NAME):
+        milvus_client.drop_collection(BENCHMARK_COLLECTION_NAME)
+
+    schema = milvus_client.create_schema(auto_id=False, enable_dynamic_field=False)
+    schema.add_field(field_name="id", datatype=DataType.INT64, is_primary=True)
+    schema.add_field(
+        field_name="embedding",
+        datatype=getattr(DataType, vector_type),
+        dim=vectors.shape[1],
+    )
+    milvus_client.create_collection(
+        collection_name=BENCHMARK_COLLECTION_NAME,
+        schema=schema,
+        index_params=build_index_params("FLAT", {}),
+    )
+
+    for start in range(0, len(vectors), insert_batch_size):
+        batch = vectors[start : start + insert_batch_size]
+        milvus_client.insert(
+            collection_name=BENCHMARK_COLLECTION_NAME,
+            data=[
+                {
+                    "id": start + i,
+                    "embedding": to_milvus_vector(vector, vector_type, projection=None),
+                }
+                for i, vector in enumerate(batch)
+            ],
+        )
+    milvus_client.flush(BENCHMARK_COLLECTION_NAME)
+
+
+def default_configs(count: int, k: int) -> List[Dict[str, Any]]:
+    """Index configurations worth comparing for a collection of count vectors."""
+    nlist = max(16, min(65536, int(4 * math.sqrt(count))))
+    configs = [{"index_type": "FLAT", "index_params": {}, "search_params": {}}]
+    for index_type in ("IVF_FLAT", "IVF_SQ8"):
+        for nprobe in (4, 8, 16, 32, 64):
+            if nprobe <= nlist:
+                configs.append(
+                    {
+                        "index_type": index_type,
+                        "index_params": {"nlist": nlist},
+                        "search_params": {"nprobe": nprobe},
+                    }
+                )
+    for ef in (16, 32, 64, 128, 256):
+        if ef >= k:
+            configs.append(
+                {
+                    "index_type": "HNSW",
+                    "index_params": {"M": 16, "efConstruction": 200},
+                    "search_params": {"ef": ef},
+                }
+            )
+    return configs
+
+
+def run_searches(
+    queries: np.ndarray,
+    k: int,
+    search_params: Dict[str, Any],
+    concurrency: int,
+    vector_type: str = "FLOAT_VECTOR",
+):
+    """Return the result ids, per-query latencies and QPS at the given concurrency."""
+
+    def search(query: np.ndarray):
+        started = time.perf_counter()
+        result = milvus_client.search(
+            collection_name=BENCHMARK_COLLECTION_NAME,
+            data=[to_milvus_vector(query, vector_type, projection=None)],
+            limit=k,
+            search_params=search_params,
+        )
+        return [hit["id"] for hit in result[0]], time.perf_counter() - started
+
+    # Latency is measured one query at a time so it is not inflated by queueing
+    results = [search(query) for query in queries]
+    ids = [result_ids for result_ids, _ in results]
+    latencies = np.array([latency for _, latency in results])
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(search, queries))
+    qps = len(queries) / (time.perf_counter() - started)
+
+    return ids, latencies, qps
+
+
+def recall_at_k(found: List[List[int]], truth: np.ndarray, k: int) -> float:
+    hits = sum(
+        len(set(ids[:k]) & set(row[:k].tolist())) for ids, row in zip(found, truth)
+    )
+    return hits / (len(truth) * k)
+
+
+def benchmark(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    configs: List[Dict[str, Any]],
+    k: int = 10,
+    concurrency: int = 8,
+    warmup: int = 20,
+    vector_type: str = "FLOAT_VECTOR",
+) -> List[Dict[str, Any]]:
+    print(f"Computing exact top-{k} for {len(queries)} queries...")
+    truth = exact_neighbors(vectors, queries, k)
+
+    print(
+        f"Loading {len(vectors)} vectors into {BENCHMARK_COLLECTION_NAME} "
+        f"as {vector_type}..."
+    )
+    create_benchmark_collection(vectors, vector_type)
+
+    results = []
+    built = None
+    for config in configs:
+        index_key = (config["index_type"], json.dumps(config["index_params"]))
+        if index_key != built:
+            started = time.perf_counter()
+            rebuild_index(
+                BENCHMARK_COLLECTION_NAME, config["index_type"], config["index_params"]
+            )
+            build_seconds = time.perf_counter() - started
+            built = index_key
+
+        search_params = build_search_params(
+            config["index_type"], config["search_params"]
+        )
+        run_searches(queries[:warmup], k, search_params, concurrency, vector_type)
+        ids, latencies, qps = run_searches(
+            queries, k, search_params, concurrency, vector_type
+        )
+
+        result = {
+            "vector_type": vector_type,
+            **config,
+            "build_seconds": round(build_seconds, 2),
+            f"recall@{k}": round(recall_at_k(ids, truth, k), 4),
+            "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 2),
+            "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 2),
+            "qps": round(qps, 1),
+        }
+        results.append(result)
+        print(
+            f"{config['index_type']:<9} {json.dumps(config['index_params']):<32} "
+            f"{json.dumps(config['search_params']):<16} "
+            f"recall@{k}={result[f'recall@{k}']:.4f} "
+            f"p50={result['p50_ms']:.2f}ms p99={result['p99_ms']:.2f}ms "
+            f"qps={result['qps']:.0f}"
+        )
+
+    return results
+
+
+def sq8_roundtrip(vectors: np.ndarray) -> np.ndarray:
+    """Vectors after 8-bit scalar quantization with a per-dimension range."""
+    low = vectors.min(axis=0)
+    scale = (vectors.max(axis=0) - low) / 255
+    scale[scale == 0] = 1
+    codes = np.round((vectors - low) / scale).astype(np.uint8)
+    return codes * scale + low
+
+
+def quantization_report(
+    vectors: np.ndarray, queries: np.ndarray, k: int = 10
+) -> List[Dict[str, Any]]:
+    """recall@k and bytes per vector of float32, float16 and SQ8 storage."""
+    vectors = normalize(vectors.astype(np.float32))
+    truth = exact_neighbors(vectors, queries, k)
+    dim = vectors.shape[1]
+    variants = [
+        ("float32", vectors, 4 * dim),
+        ("float16", vectors.astype(np.float16).astype(np.float32), 2 * dim),
+        ("sq8", sq8_roundtrip(vectors), dim),
     ]
 
-    for query in search_queries:
-        search_conversations(query)
+    results = []
+    for name, stored, bytes_per_vector in variants:
+        found = exact_neighbors(stored, queries, k)
+        result = {
+            "storage": name,
+            "bytes_per_vector": bytes_per_vector,
+            f"recall@{k}": round(recall_at_k(found.tolist(), truth, k), 4),
+        }
+        results.append(result)
+        print(
+            f"{name:<8} {bytes_per_vector:>6} bytes/vector "
+            f"recall@{k}={result[f'recall@{k}']:.4f}"
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    search_parser = subparsers.add_parser("search", help="Search with a text query")
+    search_parser.add_argument("query", nargs="+")
+    search_parser.add_argument("--limit", type=int, default=5)
+
+    bench_parser = subparsers.add_parser(
+        "benchmark", help="Compare recall and latency of index configurations"
+    )
+    bench_parser.add_argument(
+        "--synthetic",
+        type=int,
+        help="Use this many synthetic vectors instead of the live collection",
+    )
+    bench_parser.add_argument(
+        "--max-vectors", type=int, help="Read at most this many vectors"
+    )
+    bench_parser.add_argument("--queries", type=int, default=500)
+    bench_parser.add_argument("--k", type=int, default=10)
+    bench_parser.add_argument(
+        "--concurrency", type=int, default=8, help="Threads used to measure QPS"
+    )
+    bench_parser.add_argument(
+        "--configs",
+        help="JSON file with a list of {index_type, index_params, search_params}",
+    )
+    bench_parser.add_argument("--output", help="Write the results to this JSON file")
+    bench_parser.add_argument(
+        "--keep", action="store_true", help="Keep the benchmark collection"
+    )
+    bench_parser.add_argument(
+        "--vector-type",
+        choices=list(VECTOR_DTYPES),
+        default="FLOAT_VECTOR",
+        help="Storage type of the benchmark collection's vectors",
+    )
+
+    quant_parser = subparsers.add_parser(
+        "quantization", help="Recall cost of float16 and 8-bit vector storage"
+    )
+    quant_parser.add_argument(
+        "--synthetic",
+        type=int,
+        help="Use this many synthetic vectors instead of the live collection",
+    )
+    quant_parser.add_argument(
+        "--max-vectors", type=int, help="Read at most this many vectors"
+    )
+    quant_parser.add_argument("--queries", type=int, default=500)
+    quant_parser.add_argument("--k", type=int, default=10)
+    quant_parser.add_argument("--output", help="Write the results to this JSON file")
+
+    args = parser.parse_args()
+
+    if args.command == "search":
+        for query in args.query:
+            search_conversations(query, limit=args.limit)
+        return
+
+    if args.synthetic:
+        vectors = synthetic_vectors(args.synthetic, EMBEDDING_DIM)
+    else:
+        vectors = load_collection_vectors(args.max_vectors)
+    if len(vectors) <= args.k:
+        print(f"Error: need more than {args.k} vectors, found {len(vectors)}")
+        return
+
+    if args.command == "quantization":
+        results = quantization_report(
+            vectors, make_queries(vectors, args.queries), k=args.k
+        )
+    else:
+        if args.configs:
+            with open(args.configs, "r", encoding="utf-8") as f:
+                configs = json.load(f)
+        else:
+            configs = default_configs(len(vectors), args.k)
+
+        try:
+            results = benchmark(
+                vectors,
+                make_queries(vectors, args.queries),
+                configs,
+                k=args.k,
+                concurrency=args.concurrency,
+                vector_type=args.vector_type,
+            )
+        finally:
+            if not args.keep and milvus_client.has_collection(
+                BENCHMARK_COLLECTION_NAME
+            ):
+                milvus_client.drop_collection(BENCHMARK_COLLECTION_NAME)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,9 @@
 from dagster import Definitions, load_assets_from_modules
 
+import embedding_assets
 import mental_health_assets
 
-all_assets = load_assets_from_modules([mental_health_assets])
+all_assets = load_assets_from_modules([mental_health_assets, embedding_assets])
 
 defs = Definitions(
     assets=all_assets,
@@ -0,0 +1,166 @@
+import hashlib
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+from pymilvus import DataType, MilvusClient
+
+from dagster import Failure, MetadataValue, Output, asset
+
+MILVUS_URI = os.environ.get("MILVUS_URI", "http://milvus-standalone:19530")
+# Must hold full-dimension vectors, e.g. the collection kept by the backend's
+# reindex when switching to a projected one
+PCA_SOURCE_COLLECTION = os.environ.get(
+    "PCA_SOURCE_COLLECTION", "mental_health_conversations"
+)
+# Dimension of the embeddings as returned by OpenAI
+EMBEDDING_DIM = int(os.environ.get("EMBEDDING_DIM", "1536"))
+# Where projection artifacts are written. dagster.yaml mounts this directory
+# from the host into every run container, so the backend can load them.
+PCA_ARTIFACT_DIR = Path(
+    os.environ.get("PCA_ARTIFACT_DIR", "/opt/dagster/artifacts/embedding_pca")
+)
+PCA_COMPONENTS = int(os.environ.get("PCA_COMPONENTS", "256"))
+# Stored vectors held out of the fit and used as evaluation queries
+PCA_EVAL_QUERIES = int(os.environ.get("PCA_EVAL_QUERIES", "500"))
+PCA_EVAL_K = int(os.environ.get("PCA_EVAL_K", "10"))
+
+
+@asset(
+    name="embedding_pca_projection",
+    description=(
+        "Fits a PCA projection on the conversation embeddings stored in Milvus, "
+        "reports explained variance and recall@k against the full-dimension "
+        "vectors, and writes the projection as a versioned .npz artifact."
+    ),
+)
+def embedding_pca_projection():
+    """
+    The artifact holds mean (d,), components (k, d), explained_variance_ratio
+    (k,) and version. The backend loads it from EMBEDDING_PROJECTION_PATH and
+    maps vectors with (x - mean) @ components.T before writing to or
+    searching a reduced-dimension collection.
+    """
+    vectors = load_embeddings(MILVUS_URI, PCA_SOURCE_COLLECTION)
+    if len(vectors) < 2:
+        raise Failure(
+            f"{PCA_SOURCE_COLLECTION} holds {len(vectors)} vectors, "
+            "at least 2 are needed to fit a projection"
+        )
+    n_components = min(PCA_COMPONENTS, vectors.shape[1])
+
+    rng = np.random.default_rng(0)
+    order = rng.permutation(len(vectors))
+    eval_count = min(PCA_EVAL_QUERIES, len(vectors) // 10)
+    queries, corpus = vectors[order[:eval_count]], vectors[order[eval_count:]]
+
+    mean, components, explained = fit_pca(corpus, n_components)
+    path = save_projection(PCA_ARTIFACT_DIR, mean, components, explained)
+
+    metadata = {
+        "path": MetadataValue.path(str(path)),
+        "vectors": len(vectors),
+        "input_dim": vectors.shape[1],
+        "output_dim": n_components,
+        "explained_variance": float(explained.sum()),
+        "eval_queries": eval_count,
+    }
+    # A corpus of fewer than 10 vectors has none to spare for evaluation
+    if eval_count:
+        metadata[f"recall@{PCA_EVAL_K}"] = recall_at_k(
+            corpus, queries, lambda x: (x - mean) @ components.T, PCA_EVAL_K
+        )
+    return Output({"path": str(path), "dim": n_components}, metadata=metadata)
+
+
+def load_embeddings(uri, collection_name) -> np.ndarray:
+    """The stored vectors as a float32 (n, EMBEDDING_DIM) array.
+
+    Refuses a collection of another dimension, such as one that already holds
+    projected vectors.
+    """
+    client = MilvusClient(uri=uri)
+    field = next(
+        field
+        for field in client.describe_collection(collection_name)["fields"]
+        if field["name"] == "embedding"
+    )
+    dim = int(field["params"]["dim"])
+    if dim != EMBEDDING_DIM:
+        raise ValueError(
+            f"{collection_name} holds {dim}-d vectors, not the {EMBEDDING_DIM}-d "
+            "embeddings; set PCA_SOURCE_COLLECTION to a full-dimension collection"
+        )
+    dtype = np.float16 if field["type"] == DataType.FLOAT16_VECTOR else np.float32
+
+    iterator = client.query_iterator(
+        collection_name=collection_name, batch_size=1000, output_fields=["embedding"]
+    )
+    vectors = []
+    while True:
+        batch = iterator.next()
+        if not batch:
+            iterator.close()
+            break
+        vectors.extend(_decode_vector(row["embedding"], dtype) for row in batch)
+    return np.asarray(vectors, dtype=np.float32).reshape(-1, dim)
+
+
+def _decode_vector(value, dtype) -> np.ndarray:
+    # FLOAT16_VECTOR fields come back as raw bytes, in a list of one
+    if isinstance(value, list) and len(value) == 1 and isinstance(value[0], bytes):
+        value = value[0]
+    if isinstance(value, (bytes, bytearray)):
+        return np.frombuffer(value, dtype=dtype)
+    return np.asarray(value, dtype=dtype)
+
+
+def fit_pca(vectors, n_components):
+    """Mean, top principal components and their share of the variance."""
+    mean = vectors.mean(axis=0)
+    centered = vectors - mean
+    # Eigen-decomposition of the d x d covariance, cheaper than an SVD of
+    # the data when there are more vectors than dimensions
+    covariance = centered.T @ centered / max(len(vectors) - 1, 1)
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    top = np.argsort(eigenvalues)[::-1][:n_components]
+    components = eigenvectors[:, top].T.astype(np.float32)
+    explained = eigenvalues[top] / eigenvalues.sum()
+    return mean.astype(np.float32), components, explained.astype(np.float32)
+
+
+def _top_k(corpus, queries, k):
+    def unit(x):
+        norms = np.linalg.norm(x, axis=1, keepdims=True)
+        return x / np.where(norms == 0, 1, norms)
+
+    scores = unit(queries) @ unit(corpus).T
+    return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+
+def recall_at_k(corpus, queries, project, k) -> float:
+    """Share of the full-dimension cosine top-k found in the projected space."""
+    if not len(queries):
+        raise ValueError("recall needs at least one query")
+    k = min(k, len(corpus))
+    truth = _top_k(corpus, queries, k)
+    found = _top_k(project(corpus), project(queries), k)
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+    return hits / (len(queries) * k)
+
+
+def save_projection(directory, mean, components, explained) -> Path:
+    """Write the projection under a new version and return its path."""
+    digest = hashlib.sha256(components.tobytes()).hexdigest()[:8]
+    version = f"{datetime.now(timezone.utc):%Y%m%d%H%M%S}-{digest}"
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"pca-{components.shape[1]}x{components.shape[0]}-{version}.npz"
+    np.savez(
+        path,
+        mean=mean,
+        components=components,
+        explained_variance_ratio=explained,
+        version=np.array(version),
+    )
+    return path